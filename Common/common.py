@@ -1,4 +1,5 @@
 import time
+import math
 from datetime import datetime
 import os
 import sys
@@ -7,12 +8,40 @@ sys.path.insert(0, '/mnt/e/Dev/Polyglot/PolyglotDB')
 import re
 import yaml
 import csv
+import shutil
 import platform
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import numpy as np
+import conch.main
+from conch import analyze_segments
 import polyglotdb.io as pgio
 
 from polyglotdb import CorpusContext
-from polyglotdb.io.enrichment import enrich_speakers_from_csv, enrich_lexicon_from_csv
+from polyglotdb.io.enrichment import enrich_speakers_from_csv
 from polyglotdb.acoustics.formants.refined import analyze_formant_points_refinement
+from polyglotdb.acoustics.segments import generate_segments
+from polyglotdb.acoustics.io import point_measures_from_csv, point_measures_to_csv
+from polyglotdb.acoustics.other import generate_praat_script_function
+from polyglotdb.io.exporters.csv import save_results
+
+import sibilant_measures
+import sibilant_batch
+from segment_cache import SegmentCache
+import formant_sweep
+import export_writers
+from pipeline import Pipeline
+import importing
+import fused_enrichment
+import utterances
+import syllabification
+import lexicon_store
+import corpus_session
+import query_cache
+import telemetry
+import planning
+import progress
+from contextlib import contextmanager
 
 # =============== CONFIGURATION ===============
 
@@ -21,12 +50,47 @@ nIterations = 1
 
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sibilant_script_path = os.path.join(base_dir, 'Common', 'sibilant_jane_optimized.praat')
+segment_cache_dir = os.path.join(base_dir, 'cache', 'segments')
+segment_cache_max_gb = 20
+syllabification_cache_dir = os.path.join(base_dir, 'cache', 'syllabification')
+lexicon_store_dir = os.path.join(base_dir, 'cache', 'lexicon')
+query_cache_dir = os.path.join(base_dir, 'cache', 'queries')
+query_cache_max_gb = 5
+
+# (kind, higher annotation, lower annotation, property name, benchmark task) encoded by basic_enrichment
+hierarchical_properties = [('rate', 'utterance', 'syllable', 'speech_rate', 'speech_rate_encoding'),
+                           ('count', 'utterance', 'word', 'num_words', 'num_words_encoding'),
+                           ('count', 'utterance', 'syllable', 'num_syllables', 'num_syllables_encoding'),
+                           ('position', 'word', 'syllable', 'position_in_word', 'position_in_word_encoding'),
+                           ('count', 'syllable', 'phone', 'num_phones', 'num_phones_encoding'),
+                           ('count', 'word', 'syllable', 'num_syllables', 'num_syllables_encoding')]
 
 # =============================================
 now = datetime.now()
 date = '{}-{}-{}'.format(now.year, now.month, now.day)
 
 
+telemetry.install_query_counter(CorpusContext)
+
+
+def corpus_context(config):
+    # The corpus session of the script if it opened one, otherwise a context of its own
+    session = corpus_session.active_session(config)
+    if session is not None:
+        return session.corpus()
+    return CorpusContext(config)
+
+
+@contextmanager
+def benchmark(config, task):
+    # Stage telemetry as a JSON line in benchmarks/telemetry.jsonl, plus the wall time row in benchmarks.csv
+    with telemetry.stage(config.corpus_name, task) as record, progress.reporter.stage(config.corpus_name, task):
+        yield record
+    record['corpus_size'] = get_size_of_corpus(config)
+    telemetry.write_record(record)
+    save_performance_benchmark(config, task, record['wall_time'])
+
+
 def save_performance_benchmark(config, task, time_taken):
     benchmark_folder = os.path.join(base_dir, 'benchmarks')
     os.makedirs(benchmark_folder, exist_ok=True)
@@ -60,113 +124,332 @@ def load_config(corpus_name):
     return conf
 
 
-def call_back(*args):
-    args = [x for x in args if isinstance(x, str)]
-    if args:
-        print(' '.join(args))
+# Messages and progress counts from PolyglotDB and the stages go to the progress sinks, see progress.py
+call_back = progress.reporter
 
 
 def reset(config):
-    with CorpusContext(config) as c:
+    with corpus_context(config) as c:
         print('Resetting the corpus.')
         c.reset()
+    if os.path.exists(import_manifest_path(config.corpus_name)):
+        os.remove(import_manifest_path(config.corpus_name))
+    shutil.rmtree(word_tiers_path(config.corpus_name), ignore_errors=True)
 
 
-def loading(config, corpus_dir, textgrid_format):
-    with CorpusContext(config) as c:
+def remove_token_properties(config, annotation_type, properties):
+    with corpus_context(config) as c:
+        properties = [x for x in properties if c.hierarchy.has_token_property(annotation_type, x)]
+        if properties:
+            c.hierarchy.remove_token_properties(c, annotation_type, properties)
+            c.encode_hierarchy()
+
+
+def remove_type_properties(config, annotation_type, properties):
+    with corpus_context(config) as c:
+        properties = [x for x in properties if c.hierarchy.has_type_property(annotation_type, x)]
+        if properties:
+            c.hierarchy.remove_type_properties(c, annotation_type, properties)
+            c.encode_hierarchy()
+
+
+def remove_speaker_properties(config, properties):
+    with corpus_context(config) as c:
+        properties = [x for x in properties if c.hierarchy.has_speaker_property(x)]
+        if properties:
+            c.hierarchy.remove_speaker_properties(c, properties)
+            c.encode_hierarchy()
+
+
+def reset_basic_enrichment(config):
+    with corpus_context(config) as c:
+        print('Resetting utterances and syllables.')
+        c.reset_syllables()
+        c.reset_utterances()
+        c.reset_pauses()
+    corpus_sizes.pop(config.corpus_name, None)
+    # Properties of words survive resetting utterances and syllables
+    remove_token_properties(config, 'word', [x[3] for x in hierarchical_properties
+                                             if (x[2] if x[0] == 'position' else x[1]) == 'word'])
+
+
+def pipeline_state_path(corpus_name):
+    return os.path.join(base_dir, corpus_name, '{}_pipeline_state.json'.format(corpus_name))
+
+
+def import_manifest_path(corpus_name):
+    return os.path.join(base_dir, corpus_name, '{}_import_manifest.json'.format(corpus_name))
+
+
+def word_tiers_path(corpus_name):
+    return os.path.join(base_dir, corpus_name, 'word_tiers')
+
+
+def parse_times_path(corpus_name):
+    return os.path.join(base_dir, corpus_name, '{}_parse_times.csv'.format(corpus_name))
+
+
+def imported_files(corpus_name):
+    # Content hashes of the imported discourse files, so later stages rerun when discourses are added
+    manifest = importing.load_manifest(import_manifest_path(corpus_name)) or {}
+    return {k: v['hash'] for k, v in manifest.items()}
+
+
+def build_pipeline(config, corpus_name, corpus_conf, import_jobs=1, import_batch_size=None):
+    # Stages shared by all analysis scripts, analysis specific stages are added with add_formant_stages, etc.
+    pipeline = Pipeline(pipeline_state_path(corpus_name), session=corpus_session.active_session(config))
+    corpus_dir = corpus_conf['corpus_directory']
+    dialect_code = corpus_conf['dialect_code']
+    unisyn_spade_directory = corpus_conf['unisyn_spade_directory']
+    syllabics = corpus_conf['vowel_inventory'] + corpus_conf['extra_syllabic_segments']
+    enrichment_dir = os.path.join(unisyn_spade_directory, 'enrichment_files')
+    enrichment_files = []
+    if os.path.exists(enrichment_dir):
+        enrichment_files = [os.path.join(enrichment_dir, x) for x in sorted(os.listdir(enrichment_dir))
+                            if x == 'rule_applications.csv' or x.startswith(dialect_code)]
+
+    def import_corpus():
+        loading(config, corpus_dir, corpus_conf['input_format'], jobs=import_jobs, batch_size=import_batch_size)
+
+    # Import always runs, loading only new or changed discourses once the corpus exists
+    pipeline.add_stage('import', import_corpus,
+                       inputs=lambda: {'input_format': corpus_conf['input_format'],
+                                       'imported': imported_files(corpus_name)},
+                       invalidate=lambda: reset(config), update=import_corpus, always=True)
+    pipeline.add_stage('lexicon_enrichment',
+                       lambda: lexicon_enrichment(config, unisyn_spade_directory, dialect_code),
+                       update=lambda: lexicon_enrichment(config, unisyn_spade_directory, dialect_code, force=True),
+                       depends=['import'], files=enrichment_files,
+                       invalidate=lambda: remove_type_properties(
+                           config, 'word', ['unisynprimstressedvowel1',
+                                            'unisynprimstressedvowel2_{}'.format(dialect_code).lower()]))
+    pipeline.add_stage('speaker_enrichment',
+                       lambda: speaker_enrichment(config, corpus_conf['speaker_enrichment_file']),
+                       update=lambda: speaker_enrichment(config, corpus_conf['speaker_enrichment_file'], force=True),
+                       depends=['import'], files=[corpus_conf['speaker_enrichment_file']],
+                       invalidate=lambda: remove_speaker_properties(config, ['gender']))
+    # Lexicon files are an input too, so that changing them enriches the whole corpus again rather than
+    # updating only new discourses
+    pipeline.add_stage('basic_enrichment', lambda: basic_enrichment(config, syllabics, corpus_conf['pauses']),
+                       update=lambda: update_basic_enrichment(config, syllabics, corpus_conf['pauses']),
+                       depends=['lexicon_enrichment'], files=enrichment_files,
+                       inputs={'syllabics': syllabics, 'pauses': corpus_conf['pauses']},
+                       invalidate=lambda: reset_basic_enrichment(config))
+    return pipeline
+
+
+def export_outputs(corpus_name, name, export_format, partition):
+    if partition is not None:
+        return [partition_manifest_path(corpus_name, name, partition)]
+    return [export_path(corpus_name, name, export_format)]
+
+
+def add_formant_stages(pipeline, config, corpus_name, corpus_conf, vowels, stream=False, export_format='csv',
+                       partition=None, export_jobs=1, partitions=None, jobs=None):
+    pipeline.add_stage('formant_acoustic_analysis', lambda: formant_acoustic_analysis(config, vowels, jobs=jobs),
+                       depends=['basic_enrichment'],
+                       inputs={'vowels': vowels, 'duration_threshold': duration_threshold,
+                               'num_iterations': nIterations},
+                       invalidate=lambda: remove_token_properties(config, 'phone',
+                                                                  ['F1', 'F2', 'F3', 'B1', 'B2', 'B3']))
+    pipeline.add_stage('formant_export',
+                       lambda: formant_export(config, corpus_name, corpus_conf['dialect_code'],
+                                              corpus_conf['speakers'], vowels, stream=stream,
+                                              export_format=export_format, partition=partition,
+                                              jobs=export_jobs, only=partitions),
+                       depends=['formant_acoustic_analysis', 'speaker_enrichment'],
+                       inputs={'speakers': corpus_conf['speakers'], 'export_format': export_format,
+                               'partition': partition},
+                       outputs=export_outputs(corpus_name, 'formants', export_format, partition),
+                       always=bool(partitions), read_only=True)
+
+
+def add_formant_sweep_stage(pipeline, config, corpus_name, vowels, grid, jobs=None):
+    pipeline.add_stage('formant_sweep', lambda: formant_parameter_sweep(config, corpus_name, vowels, grid, jobs=jobs),
+                       depends=['basic_enrichment'], files=[formant_sweep.__file__],
+                       inputs={'vowels': vowels, 'grid': grid},
+                       outputs=[export_path(corpus_name, 'formant_sweep', 'csv')], read_only=True)
+
+
+def add_sibilant_stages(pipeline, config, corpus_name, corpus_conf, engine='praat', jobs=None, stream=False,
+                        export_format='csv', use_segment_cache=False, partition=None, export_jobs=1,
+                        partitions=None):
+    if engine == 'numpy':
+        engine_files = [sibilant_measures.__file__]
+    elif engine == 'praat-batch':
+        engine_files = [sibilant_batch.batch_script_path]
+    else:
+        engine_files = [sibilant_script_path]
+    pipeline.add_stage('sibilant_acoustic_analysis',
+                       lambda: sibilant_acoustic_analysis(config, corpus_conf['sibilant_segments'], engine=engine,
+                                                          jobs=jobs, use_segment_cache=use_segment_cache),
+                       depends=['basic_enrichment'], files=engine_files,
+                       inputs={'sibilant_segments': corpus_conf['sibilant_segments'], 'engine': engine},
+                       invalidate=lambda: remove_token_properties(config, 'phone', sibilant_measures.measures),
+                       update=lambda: sibilant_acoustic_analysis(config, corpus_conf['sibilant_segments'],
+                                                                 engine=engine, jobs=jobs,
+                                                                 use_segment_cache=use_segment_cache,
+                                                                 new_tokens_only=True))
+    pipeline.add_stage('sibilant_export',
+                       lambda: sibilant_export(config, corpus_name, corpus_conf['dialect_code'],
+                                               corpus_conf['speakers'], stream=stream, export_format=export_format,
+                                               partition=partition, jobs=export_jobs, only=partitions),
+                       depends=['sibilant_acoustic_analysis', 'speaker_enrichment'],
+                       inputs={'speakers': corpus_conf['speakers'], 'export_format': export_format,
+                               'partition': partition},
+                       outputs=export_outputs(corpus_name, 'sibilants', export_format, partition),
+                       always=bool(partitions), read_only=True)
+
+
+def get_parser(corpus_dir, textgrid_format):
+    if textgrid_format == "buckeye":
+        parser = pgio.inspect_buckeye(corpus_dir)
+    elif textgrid_format == "csv":
+        parser = pgio.inspect_buckeye(corpus_dir)
+    elif textgrid_format.lower() == "fave":
+        parser = pgio.inspect_fave(corpus_dir)
+    elif textgrid_format == "ilg":
+        parser = pgio.inspect_ilg(corpus_dir)
+    elif textgrid_format == "labbcat":
+        parser = pgio.inspect_labbcat(corpus_dir)
+    elif textgrid_format == "partitur":
+        parser = pgio.inspect_partitur(corpus_dir)
+    elif textgrid_format == "timit":
+        parser = pgio.inspect_timit(corpus_dir)
+    else:
+        parser = pgio.inspect_mfa(corpus_dir)
+    # Parsers count the lines of each file, which would clash with the count of files being imported
+    parser.call_back = progress.reporter.message
+    return parser
+
+
+def report_parse_times(corpus_name, timings):
+    # Slowest files first, to find pathological TextGrids
+    timings = sorted(timings.items(), key=lambda x: x[1], reverse=True)
+    with open(parse_times_path(corpus_name), 'w', newline='', encoding='utf8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['file', 'parse_time'])
+        writer.writerows(timings)
+    print('Parsing took {} seconds in total, slowest files:'.format(sum(x[1] for x in timings)))
+    for path, seconds in timings[:5]:
+        print('  {}: {}'.format(path, seconds))
+
+
+def loading(config, corpus_dir, textgrid_format, jobs=1, batch_size=None):
+    # The import manifest doubles as a checkpoint: it is saved after every committed batch of discourses,
+    # so an interrupted import resumes with the discourses that were not committed
+    with corpus_context(config) as c:
         exists = c.exists()
-    if exists:
-        print('Corpus already loaded, skipping import.')
-        return
     if not os.path.exists(corpus_dir):
+        if exists:
+            print('Corpus already loaded, skipping import.')
+            return
         print('The path {} does not exist.'.format(corpus_dir))
         sys.exit(1)
-    with CorpusContext(config) as c:
+    manifest_path = import_manifest_path(config.corpus_name)
+    parser = get_parser(corpus_dir, textgrid_format)
+    previous = importing.load_manifest(manifest_path)
+    paths = importing.discourse_files(parser, corpus_dir)
+    manifest = importing.build_manifest(corpus_dir, paths, previous)
+    if not exists:
         print('loading')
+        previous = {}
+        task = 'import'
+    elif previous is None:
+        print('Corpus already loaded, recording its files for incremental imports.')
+        importing.save_manifest(manifest_path, manifest)
+        return
+    else:
+        task = 'incremental_import'
+    new, changed, removed = importing.compare_manifests(previous, manifest)
+    if not new and not changed and not removed:
+        print('Corpus already loaded, no new or changed discourses.')
+        importing.save_manifest(manifest_path, manifest)
+        return
+    if exists:
+        print('Importing {} new and {} changed discourses, removing {}'.format(len(new), len(changed),
+                                                                                len(removed)))
+    checkpoint = dict(previous)
+    committed = []
 
-        if textgrid_format == "buckeye":
-            parser = pgio.inspect_buckeye(corpus_dir)
-        elif textgrid_format == "csv":
-            parser = pgio.inspect_buckeye(corpus_dir)
-        elif textgrid_format.lower() == "fave":
-            parser = pgio.inspect_fave(corpus_dir)
-        elif textgrid_format == "ilg":
-            parser = pgio.inspect_ilg(corpus_dir)
-        elif textgrid_format == "labbcat":
-            parser = pgio.inspect_labbcat(corpus_dir)
-        elif textgrid_format == "partitur":
-            parser = pgio.inspect_partitur(corpus_dir)
-        elif textgrid_format == "timit":
-            parser = pgio.inspect_timit(corpus_dir)
-        else:
-            parser = pgio.inspect_mfa(corpus_dir)
-        parser.call_back = call_back
-        beg = time.time()
-        c.load(parser, corpus_dir)
-        end = time.time()
-        time_taken = end - beg
-        print('Loading took: {}'.format(time_taken))
-    save_performance_benchmark(config, 'import', time_taken)
+    def commit_batch(batch):
+        for path in batch:
+            key = os.path.relpath(path, corpus_dir)
+            checkpoint[key] = manifest[key]
+            committed.append(key)
+        importing.save_manifest(manifest_path, checkpoint)
+        print('Committed {} of {} discourses'.format(len(committed), len(new) + len(changed)))
+
+    with corpus_context(config) as c:
+        with benchmark(config, task) as record:
+            discourses = set(c.discourses)
+            # New discourses may already be partly in the database after an interrupted import
+            for k in changed + removed + new:
+                name = (previous.get(k) or manifest[k])['discourse']
+                if name in discourses:
+                    c.remove_discourse(name)
+            for k in removed:
+                del checkpoint[k]
+                word_table = utterances.word_table_path(word_tiers_path(config.corpus_name), previous[k]['discourse'])
+                if os.path.exists(word_table):
+                    os.remove(word_table)
+            importing.save_manifest(manifest_path, checkpoint)
+            timings = {}
+            if new or changed:
+                timings = importing.load_discourses(c, parser, [os.path.join(corpus_dir, k) for k in new + changed],
+                                                    call_back=call_back, jobs=jobs, batch_size=batch_size,
+                                                    on_batch=commit_batch,
+                                                    word_tier_dir=word_tiers_path(config.corpus_name))
+            corpus_sizes.pop(config.corpus_name, None)
+        print('Loading took: {}'.format(record['wall_time']))
+    if timings:
+        report_parse_times(config.corpus_name, timings)
+    importing.save_manifest(manifest_path, manifest)
 
 
 def basic_enrichment(config, syllabics, pauses):
-    with CorpusContext(config) as g:
+    with corpus_context(config) as g:
         if not 'utterance' in g.annotation_types:
             print('encoding utterances')
-            begin = time.time()
-            g.encode_pauses(pauses)
-            # g.encode_pauses('^[<{].*$', call_back = call_back)
-            g.encode_utterances(min_pause_length=0.15)  # , call_back = call_back)
-            # g.encode_utterances(min_pause_length = 0.5, call_back = call_back)
-            time_taken = time.time() - begin
-            print('Utterance enrichment took: {}'.format(time_taken))
-            save_performance_benchmark(config, 'utterance_encoding', time_taken)
+            with benchmark(config, 'utterance_encoding') as record:
+                g.encode_pauses(pauses)
+                # g.encode_pauses('^[<{].*$', call_back = call_back)
+                word_tier_dir = word_tiers_path(config.corpus_name)
+                if utterances.has_word_tables(word_tier_dir, g.discourses):
+                    # Utterance boundaries from the word tiers saved at import, then bulk loaded
+                    utterances.encode_utterances(g, word_tier_dir, pauses, min_pause_length=0.15,
+                                                 call_back=call_back)
+                else:
+                    g.encode_utterances(min_pause_length=0.15)  # , call_back = call_back)
+                # g.encode_utterances(min_pause_length = 0.5, call_back = call_back)
+                corpus_sizes.pop(config.corpus_name, None)
+            print('Utterance enrichment took: {}'.format(record['wall_time']))
 
         if syllabics and 'syllable' not in g.annotation_types:
             print('encoding syllables')
-            begin = time.time()
-            g.encode_syllabic_segments(syllabics)
-            g.encode_syllables('maxonset')
-            time_taken = time.time() - begin
-            print('Syllable enrichment took: {}'.format(time.time() - begin))
-            save_performance_benchmark(config, 'syllable_encoding', time_taken)
-
-        print('enriching utterances')
-        if syllabics and not g.hierarchy.has_token_property('utterance', 'speech_rate'):
-            begin = time.time()
-            g.encode_rate('utterance', 'syllable', 'speech_rate')
-            time_taken = time.time() - begin
-            print('Speech rate encoding took: {}'.format(time.time() - begin))
-            save_performance_benchmark(config, 'speech_rate_encoding', time_taken)
-
-        if not g.hierarchy.has_token_property('utterance', 'num_words'):
-            begin = time.time()
-            g.encode_count('utterance', 'word', 'num_words')
-            time_taken = time.time() - begin
-            print('Word count encoding took: {}'.format(time.time() - begin))
-            save_performance_benchmark(config, 'num_words_encoding', time_taken)
-
-        if syllabics and not g.hierarchy.has_token_property('utterance', 'num_syllables'):
-            begin = time.time()
-            g.encode_count('utterance', 'syllable', 'num_syllables')
-            time_taken = time.time() - begin
-            print('Syllable count encoding took: {}'.format(time.time() - begin))
-            save_performance_benchmark(config, 'num_syllables_encoding', time_taken)
-
-        if syllabics and not g.hierarchy.has_token_property('syllable', 'position_in_word'):
-            print('enriching syllables')
-            begin = time.time()
-            g.encode_position('word', 'syllable', 'position_in_word')
-            time_taken = time.time() - begin
-            print('Syllable position encoding took: {}'.format(time.time() - begin))
-            save_performance_benchmark(config, 'position_in_word_encoding', time_taken)
-
-        if syllabics and not g.hierarchy.has_token_property('syllable', 'num_phones'):
-            begin = time.time()
-            g.encode_count('syllable', 'phone', 'num_phones')
-            time_taken = time.time() - begin
-            print('Phone count encoding took: {}'.format(time.time() - begin))
-            save_performance_benchmark(config, 'num_phones_encoding', time_taken)
+            with benchmark(config, 'syllable_encoding') as record:
+                g.encode_syllabic_segments(syllabics)
+                syllabification.encode_syllables(g, syllabics, syllabification_cache_dir, call_back=call_back)
+            print('Syllable enrichment took: {}'.format(record['wall_time']))
+
+        if syllabics and not g.hierarchy.has_token_property('syllable', 'onset_labels'):
+            print('encoding syllable structure')
+            with benchmark(config, 'syllable_structure_encoding') as record:
+                syllabification.encode_syllable_structure(g, call_back=call_back)
+            print('Syllable structure encoding took: {}'.format(record['wall_time']))
+
+        print('enriching utterances, words and syllables')
+        properties = [(kind, higher, lower, name, task) for kind, higher, lower, name, task in hierarchical_properties
+                      if (syllabics or 'syllable' not in (higher, lower)) and
+                      not g.hierarchy.has_token_property(lower if kind == 'position' else higher, name)]
+        if properties:
+            # All counts, positions and rates are computed in a single pass per discourse
+            with benchmark(config, 'fused_enrichment') as record:
+                property_times = fused_enrichment.encode_properties(g, [x[:4] for x in properties],
+                                                                    call_back=call_back)
+            for (kind, higher, lower, name, task), time_taken in zip(properties, property_times):
+                save_performance_benchmark(config, task, time_taken)
+            print('Count, position and rate encoding took: {}'.format(record['wall_time']))
 
         # print('enriching words')
         # if not g.hierarchy.has_token_property('word', 'position_in_utterance'):
@@ -174,240 +457,665 @@ def basic_enrichment(config, syllabics, pauses):
         #    g.encode_position('utterance', 'word', 'position_in_utterance')
         #    print('Utterance position encoding took: {}'.format(time.time() - begin))
 
-        if syllabics and not g.hierarchy.has_token_property('word', 'num_syllables'):
-            begin = time.time()
-            g.encode_count('word', 'syllable', 'num_syllables')
-            time_taken = time.time() - begin
-            print('Syllable count encoding took: {}'.format(time.time() - begin))
-            save_performance_benchmark(config, 'num_syllables_encoding', time_taken)
-
         print('enriching syllables')
         if syllabics and g.hierarchy.has_type_property('word', 'stresspattern') and not g.hierarchy.has_token_property('syllable',
                                                                                                          'stress'):
-            begin = time.time()
-            g.encode_stress_from_word_property('stresspattern')
-            time_taken = time.time() - begin
+            with benchmark(config, 'stress_encoding_from_pattern'):
+                g.encode_stress_from_word_property('stresspattern')
             print("encoded stress")
-            save_performance_benchmark(config, 'stress_encoding_from_pattern', time_taken)
         elif syllabics and re.search(r"\d", syllabics[0]) and not g.hierarchy.has_type_property('syllable',
                                                                                                 'stress'):  # If stress is included in the vowels
-            begin = time.time()
-            g.encode_stress_to_syllables("[0-9]", clean_phone_label=False)
-            time_taken = time.time() - begin
+            with benchmark(config, 'stress_encoding'):
+                g.encode_stress_to_syllables("[0-9]", clean_phone_label=False)
             print("encoded stress")
-            save_performance_benchmark(config, 'stress_encoding', time_taken)
 
 
-def lexicon_enrichment(config, unisyn_spade_directory, dialect_code):
+def discourses_without(c, annotation_type):
+    # Discourses with no annotations of the type yet, e.g. those imported since the corpus was enriched
+    statement = '''MATCH (d:Discourse:{corpus})
+    WHERE NOT (d)<-[:spoken_in]-(:{type}:{corpus})
+    RETURN d.name AS name'''.format(type=annotation_type, corpus=c.cypher_safe_name)
+    return sorted(r['name'] for r in c.execute_cypher(statement))
+
+
+def discourses_missing(c, annotation_type, name):
+    # Discourses with speech annotations of the type that don't have the property
+    statement = '''MATCH (n:{type}:{corpus}:speech)-[:spoken_in]->(d:Discourse:{corpus})
+    WHERE n.{name} IS NULL
+    RETURN DISTINCT d.name AS name'''.format(type=annotation_type, corpus=c.cypher_safe_name, name=name)
+    return sorted(r['name'] for r in c.execute_cypher(statement))
+
+
+def update_basic_enrichment(config, syllabics, pauses):
+    # Enrich only the discourses imported since the last run, or the whole corpus again when the new discourses
+    # can't be enriched on their own (no saved word tiers, or new onsets changing the syllabification)
+    word_tier_dir = word_tiers_path(config.corpus_name)
+    with corpus_context(config) as g:
+        updatable = 'utterance' in g.annotation_types and (not syllabics or 'syllable' in g.annotation_types)
+        if updatable:
+            new = discourses_without(g, 'utterance')
+            updatable = utterances.has_word_tables(word_tier_dir, new)
+        if updatable and new:
+            print('encoding utterances for {} new discourses'.format(len(new)))
+            with benchmark(config, 'utterance_encoding') as record:
+                utterances.encode_pauses(g, pauses, new)
+                utterances.encode_utterances(g, word_tier_dir, pauses, min_pause_length=0.15, call_back=call_back,
+                                             discourses=new)
+                corpus_sizes.pop(config.corpus_name, None)
+            print('Utterance enrichment took: {}'.format(record['wall_time']))
+        new_syllables = []
+        if updatable and syllabics:
+            new_syllables = discourses_without(g, 'syllable')
+            if new_syllables:
+                print('encoding syllables for {} new discourses'.format(len(new_syllables)))
+                with benchmark(config, 'syllable_encoding') as record:
+                    g.encode_syllabic_segments(syllabics)
+                    updatable = syllabification.encode_syllables(g, syllabics, syllabification_cache_dir,
+                                                                 call_back=call_back, discourses=new_syllables)
+                print('Syllable enrichment took: {}'.format(record['wall_time']))
+    if not updatable:
+        print('The new discourses can\'t be enriched on their own, enriching the whole corpus again.')
+        reset_basic_enrichment(config)
+        basic_enrichment(config, syllabics, pauses)
+        return
+    with corpus_context(config) as g:
+        if syllabics:
+            new = discourses_missing(g, 'syllable', 'onset_labels')
+            if new:
+                with benchmark(config, 'syllable_structure_encoding') as record:
+                    syllabification.encode_syllable_structure(g, call_back=call_back, discourses=new)
+                print('Syllable structure encoding took: {}'.format(record['wall_time']))
+
+        properties = [x for x in hierarchical_properties if syllabics or 'syllable' not in x[1:3]]
+        new = sorted(set(d for kind, higher, lower, name, task in properties if kind != 'rate'
+                         for d in discourses_missing(g, lower if kind == 'position' else higher, name)))
+        if new:
+            with benchmark(config, 'fused_enrichment') as record:
+                property_times = fused_enrichment.encode_properties(g, [x[:4] for x in properties],
+                                                                    call_back=call_back, discourses=new)
+            for (kind, higher, lower, name, task), time_taken in zip(properties, property_times):
+                save_performance_benchmark(config, task, time_taken)
+            print('Count, position and rate encoding took: {}'.format(record['wall_time']))
+
+        if syllabics and g.hierarchy.has_type_property('word', 'stresspattern'):
+            with benchmark(config, 'stress_encoding_from_pattern'):
+                syllabification.encode_new_stress_from_word_property(g, 'stresspattern')
+        elif syllabics and new_syllables and re.search(r"\d", syllabics[0]):
+            with benchmark(config, 'stress_encoding'):
+                g.encode_stress_to_syllables("[0-9]", clean_phone_label=False)
+
+
+def lexicon_enrichment(config, unisyn_spade_directory, dialect_code, force=False):
     enrichment_dir = os.path.join(unisyn_spade_directory, 'enrichment_files')
     if not os.path.exists(enrichment_dir):
         print('Could not find enrichment_files directory from {}, skipping lexical enrichment.'.format(
             unisyn_spade_directory))
         return
-    with CorpusContext(config) as g:
+    with corpus_context(config) as g:
 
         for lf in os.listdir(enrichment_dir):
             path = os.path.join(enrichment_dir, lf)
             if lf == 'rule_applications.csv':
-                if g.hierarchy.has_type_property('word', 'UnisynPrimStressedVowel1'.lower()):
+                if not force and g.hierarchy.has_type_property('word', 'UnisynPrimStressedVowel1'.lower()):
                     print('Dialect independent enrichment already loaded, skipping.')
                     continue
             elif lf.startswith(dialect_code):
-                if g.hierarchy.has_type_property('word', 'UnisynPrimStressedVowel2_{}'.format(
+                if not force and g.hierarchy.has_type_property('word', 'UnisynPrimStressedVowel2_{}'.format(
                         dialect_code).lower()):
                     print('Dialect specific enrichment already loaded, skipping.')
                     continue
             else:
                 continue
-            begin = time.time()
-            enrich_lexicon_from_csv(g, path)
-            time_taken = time.time() - begin
-            print('Lexicon enrichment took: {}'.format(time.time() - begin))
-            save_performance_benchmark(config, 'lexicon_enrichment', time_taken)
+            with benchmark(config, 'lexicon_enrichment') as record:
+                num_words = lexicon_store.enrich_lexicon(g, lexicon_store_dir, path)
+            print('Lexicon enrichment of {} words from {} took: {}'.format(num_words, lf, record['wall_time']))
 
 
-def speaker_enrichment(config, speaker_file):
+def speaker_enrichment(config, speaker_file, force=False):
     if not os.path.exists(speaker_file):
         print('Could not find {}, skipping speaker enrichment.'.format(speaker_file))
         return
-    with CorpusContext(config) as g:
-        if not g.hierarchy.has_speaker_property('gender'):
-            begin = time.time()
-            enrich_speakers_from_csv(g, speaker_file)
-            time_taken = time.time() - begin
-            print('Speaker enrichment took: {}'.format(time.time() - begin))
-            save_performance_benchmark(config, 'speaker_enrichment', time_taken)
+    with corpus_context(config) as g:
+        if force or not g.hierarchy.has_speaker_property('gender'):
+            with benchmark(config, 'speaker_enrichment') as record:
+                enrich_speakers_from_csv(g, speaker_file)
+            print('Speaker enrichment took: {}'.format(record['wall_time']))
         else:
             print('Speaker enrichment already done, skipping.')
 
 
-def sibilant_acoustic_analysis(config, sibilant_segments):
+def generate_sibilant_segments(c):
+    return generate_segments(c, annotation_type='phone', subset='sibilant', file_type='consonant',
+                             duration_threshold=0.01).segments
+
+
+def save_sibilant_measures(c, segments, output):
+    # output maps phone ids to measures, point_measures_to_csv expects the segments themselves
+    data = {seg: output[seg['id']] for seg in segments if seg['id'] in output}
+    header = ['id'] + sibilant_measures.measures
+    point_measures_to_csv(c, data, header)
+    point_measures_from_csv(c, {m: float for m in sibilant_measures.measures})
+
+
+def segment_cache(corpus_name, limit=True):
+    max_bytes = segment_cache_max_gb * 1024 ** 3 if limit else None
+    return SegmentCache(os.path.join(segment_cache_dir, corpus_name), max_bytes=max_bytes)
+
+
+sibilant_worker_id = 0
+
+
+def init_sibilant_worker(counter):
+    # Number the pool's workers in the order they start, so their benchmark tasks keep the same names across runs
+    global sibilant_worker_id
+    with counter.get_lock():
+        sibilant_worker_id = counter.value
+        counter.value += 1
+
+
+def analyze_sibilant_file(engine, praat_path, tokens, cache_name=None):
+    beg = time.time()
+    if engine == 'numpy':
+        cache = segment_cache(cache_name, limit=False) if cache_name else None
+        output = sibilant_measures.analyze_tokens(tokens, cache=cache)
+    else:
+        output = sibilant_batch.analyze_tokens(praat_path, tokens)
+    return sibilant_worker_id, time.time() - beg, output
+
+
+def longest_first(tokens):
+    # Group tokens by sound file (i.e., discourse), with the files holding the most audio to analyze first
+    groups = {}
+    for t in tokens:
+        groups.setdefault(t[1], []).append(t)
+    return sorted(groups.values(), key=lambda x: sum(t[3] - t[2] for t in x), reverse=True)
+
+
+def measured_sibilants(c):
+    q = c.query_graph(c.phone).filter(c.phone.subset == 'sibilant').filter(c.phone.cog != None)
+    return set(r['id'] for r in q.columns(c.phone.id.column_name('id')).all())
+
+
+def analyze_sibilants(c, engine, jobs=None, use_segment_cache=False, new_tokens_only=False):
+    segments = generate_sibilant_segments(c)
+    if new_tokens_only:
+        measured = measured_sibilants(c)
+        segments = [seg for seg in segments if seg['id'] not in measured]
+        if not segments:
+            print('No new sibilants to analyze.')
+            return 0, 0
+    tokens = [(seg['id'], seg.file_path, seg.begin, seg.end, seg.channel) for seg in segments]
+    if engine == 'praat':
+        # The script run on each token as analyze_script runs it
+        function = generate_praat_script_function(c.config.praat_path, sibilant_script_path)
+        output = analyze_segments(segments, function, num_jobs=jobs)
+        save_sibilant_measures(c, segments, {seg['id']: v for seg, v in output.items()})
+        return len(tokens), sum(t[3] - t[2] for t in tokens)
+    jobs = jobs or 1
+    output = {}
+    worker_times = {}
+    cache_name = c.config.corpus_name if use_segment_cache else None
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_sibilant_worker,
+                                 initargs=(multiprocessing.Value('i', 0),)) as executor:
+            futures = [executor.submit(analyze_sibilant_file, engine, c.config.praat_path, x, cache_name)
+                       for x in longest_first(tokens)]
+            call_back(0, len(futures))
+            for i, f in enumerate(as_completed(futures)):
+                worker, time_taken, file_output = f.result()
+                worker_times[worker] = worker_times.get(worker, 0) + time_taken
+                output.update(file_output)
+                call_back('Analyzed {} of {} discourses'.format(i + 1, len(futures)))
+                call_back(i + 1)
+    else:
+        worker, time_taken, output = analyze_sibilant_file(engine, c.config.praat_path, tokens, cache_name)
+        worker_times[worker] = time_taken
+    if use_segment_cache:
+        segment_cache(c.config.corpus_name).enforce_limit()
+    for worker, time_taken in sorted(worker_times.items()):
+        print('Worker {} spent {} seconds analyzing sibilants'.format(worker, time_taken))
+        save_performance_benchmark(c.config, 'sibilant_acoustic_analysis_worker_{}'.format(worker), time_taken)
+    save_sibilant_measures(c, segments, output)
+    return len(tokens), sum(t[3] - t[2] for t in tokens)
+
+
+@contextmanager
+def analysis_jobs(jobs):
+    # PolyglotDB's analyses call conch's analyze_segments without a number of jobs, so it starts a process for
+    # 3/4 of the CPUs it sees; with jobs, it sees just enough CPUs to start that many
+    if jobs is None:
+        yield
+        return
+    cpu_count = conch.main.cpu_count
+    conch.main.cpu_count = lambda: math.ceil(jobs * 4 / 3)
+    try:
+        yield
+    finally:
+        conch.main.cpu_count = cpu_count
+
+
+def sibilant_acoustic_analysis(config, sibilant_segments, engine='praat', jobs=None, use_segment_cache=False,
+                               new_tokens_only=False):
     # Encode sibilant class and analyze sibilants using the praat script
-    with CorpusContext(config) as c:
-        if c.hierarchy.has_token_property('phone', 'cog'):
+    # With new_tokens_only, only sibilants without measures (e.g., from newly imported discourses) are analyzed
+    with corpus_context(config) as c:
+        if not new_tokens_only and c.hierarchy.has_token_property('phone', 'cog'):
             print('Sibilant acoustics already analyzed, skipping.')
             return
         print('Beginning sibilant analysis')
-        beg = time.time()
-        c.encode_class(sibilant_segments, 'sibilant')
-        time_taken = time.time() - beg
-        save_performance_benchmark(config, 'sibilant_encoding', time_taken)
+        with benchmark(config, 'sibilant_encoding'):
+            c.encode_class(sibilant_segments, 'sibilant')
         print('sibilants encoded')
 
-        # analyze all sibilants using the script found at script_path
-        beg = time.time()
-        c.analyze_script('sibilant', sibilant_script_path, duration_threshold=0.01)
-        end = time.time()
-        time_taken = time.time() - beg
-        print('Sibilant analysis took: {}'.format(end - beg))
-        save_performance_benchmark(config, 'sibilant_acoustic_analysis', time_taken)
+        # analyze all sibilants using the script found at script_path, its batch version or its NumPy port
+        with benchmark(config, 'sibilant_acoustic_analysis') as record:
+            if engine in ('numpy', 'praat-batch') or new_tokens_only:
+                record['tokens'], record['audio_seconds'] = analyze_sibilants(c, engine, jobs, use_segment_cache,
+                                                                              new_tokens_only)
+            else:
+                with analysis_jobs(jobs):
+                    c.analyze_script('sibilant', sibilant_script_path, duration_threshold=0.01, call_back=call_back)
+        print('Sibilant analysis took: {}'.format(record['wall_time']))
 
 
-def formant_acoustic_analysis(config, vowels):
-    with CorpusContext(config) as c:
+def formant_acoustic_analysis(config, vowels, jobs=None):
+    with corpus_context(config) as c:
         if c.hierarchy.has_token_property('phone', 'F1'):
             print('Formant acoustics already analyzed, skipping.')
             return
         print('Beginning formant analysis')
-        beg = time.time()
-        metadata = analyze_formant_points_refinement(c, vowels, duration_threshold=duration_threshold,
-                                                     num_iterations=nIterations)
-        end = time.time()
-        time_taken = time.time() - beg
-        print('Analyzing formants took: {}'.format(end - beg))
-        save_performance_benchmark(config, 'formant_acoustic_analysis', time_taken)
+        with benchmark(config, 'formant_acoustic_analysis') as record:
+            with analysis_jobs(jobs):
+                metadata = analyze_formant_points_refinement(c, vowels, duration_threshold=duration_threshold,
+                                                             num_iterations=nIterations, call_back=call_back)
+        print('Analyzing formants took: {}'.format(record['wall_time']))
+
+
+def formant_parameter_sweep(config, corpus_name, vowels, grid, jobs=None):
+    # Evaluate a grid of (num_iterations, duration_threshold, max_formant) settings with one pass over the audio
+    # per max_formant
+    csv_path = export_path(corpus_name, 'formant_sweep', 'csv')
+    summary_path = export_path(corpus_name, 'formant_sweep_summary', 'csv')
+    with corpus_context(config) as c:
+        print('Beginning formant parameter sweep')
+        with benchmark(config, 'formant_sweep') as record:
+            mapping = generate_segments(c, annotation_type='phone', file_type='vowel',
+                                        duration_threshold=min(x[1] for x in grid), padding=formant_sweep.padding)
+            mapping.segments = [seg for seg in mapping.segments if seg['label'] in vowels]
+            segments = mapping.segments
+            durations = [seg.end - seg.begin for seg in segments]
+            candidates = formant_sweep.measure_candidates(mapping, sorted(set(x[2] for x in grid)),
+                                                          c.config.praat_path, jobs=jobs)
+            results = formant_sweep.run_sweep(segments, candidates, grid)
+            record['tokens'] = len(segments)
+            record['audio_seconds'] = sum(durations)
 
+            labels = list(results.keys())
+            with open(csv_path, 'w', encoding='utf8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['speaker', 'discourse', 'phone_id', 'phone_label', 'begin', 'end', 'duration'] +
+                                ['{}_{}'.format(col, label) for label in labels for col in formant_sweep.columns])
+                for i, seg in enumerate(segments):
+                    row = [seg['speaker'], seg['discourse'], seg['id'], seg['label'], seg.begin, seg.end, durations[i]]
+                    for label in labels:
+                        row.extend('' if v != v else round(float(v), 2) for v in results[label][i])
+                    writer.writerow(row)
 
-def formant_export(config, corpus_name, dialect_code, speakers, vowels):  # Gets information into a csv
+            with open(summary_path, 'w', encoding='utf8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['num_iterations', 'duration_threshold', 'max_formant', 'phone_label', 'count',
+                                 'F1_mean', 'F2_mean', 'F3_mean', 'F1_sd', 'F2_sd', 'F3_sd'])
+                phone_labels = [seg['label'] for seg in segments]
+                for (num_iterations, threshold, ceiling), label in zip(grid, labels):
+                    for v in sorted(set(phone_labels)):
+                        values = results[label][[i for i, x in enumerate(phone_labels) if x == v], :3]
+                        values = values[~np.isnan(values).any(axis=1)]
+                        if not len(values):
+                            continue
+                        writer.writerow([num_iterations, threshold, ceiling, v, len(values)] +
+                                        [round(float(x), 2) for x in values.mean(axis=0)] +
+                                        [round(float(x), 2) for x in values.std(axis=0)])
+        print('Formant sweep took: {}'.format(record['wall_time']))
+        print('Results for the sweep written to {} and {}'.format(csv_path, summary_path))
 
-    csv_path = os.path.join(base_dir, corpus_name, '{}_formants.csv'.format(corpus_name))
+
+def formant_export_query(c, dialect_code, speakers, vowels):
     # Unisyn columns
     other_vowel_codes = ['unisynPrimStressedVowel2_{}'.format(dialect_code),
                          'UnisynPrimStressedVowel3_{}'.format(dialect_code),
                          'UnisynPrimStressedVowel3_XSAMPA',
                          'AnyRuleApplied_{}'.format(dialect_code)]
+    q = c.query_graph(c.phone)
+    if speakers:
+        q = q.filter(c.phone.speaker.name.in_(speakers))
+    q = q.filter(c.phone.label.in_(vowels))
+
+    q = q.columns(c.phone.speaker.name.column_name('speaker'), c.phone.discourse.name.column_name('discourse'),
+                  c.phone.id.column_name('phone_id'), c.phone.label.column_name('phone_label'),
+                  c.phone.begin.column_name('begin'), c.phone.end.column_name('end'),
+                  c.phone.syllable.stress.column_name('syllable_stress'),
+                  c.phone.syllable.word.stresspattern.column_name('word_stress_pattern'),
+                  c.phone.syllable.position_in_word.column_name('syllable_position_in_word'),
+                  c.phone.duration.column_name('duration'),
+                  c.phone.following.label.column_name('following_phone'),
+                  c.phone.previous.label.column_name('previous_phone'), c.phone.word.label.column_name('word'),
+                  c.phone.F1.column_name('F1'), c.phone.F2.column_name('F2'), c.phone.F3.column_name('F3'),
+                  c.phone.B1.column_name('B1'), c.phone.B2.column_name('B2'), c.phone.B3.column_name('B3'))
+    if c.hierarchy.has_type_property('word', 'UnisynPrimStressedVowel1'.lower()):
+        q = q.columns(c.phone.word.unisynprimstressedvowel1.column_name('UnisynPrimStressedVowel1'))
+    for v in other_vowel_codes:
+        if c.hierarchy.has_type_property('word', v.lower()):
+            q = q.columns(getattr(c.phone.word, v.lower()).column_name(v))
+    for sp, _ in c.hierarchy.speaker_properties:
+        if sp == 'name':
+            continue
+        q = q.columns(getattr(c.phone.speaker, sp).column_name(sp))
+    return q
+
+
+def sibilant_export_query(c, speakers):
+    q = c.query_graph(c.phone).filter(c.phone.subset == 'sibilant')
+    #q = q.filter(c.phone.begin == c.phone.syllable.word.begin)
+    if speakers:
+        q = q.filter(c.phone.speaker.name.in_(speakers))
+    if c.hierarchy.has_token_property('syllable', 'onset_labels'):
+        # Stored by basic enrichment
+        structure = [c.phone.syllable.onset_labels.column_name('onset'),
+                     c.phone.syllable.nucleus_labels.column_name('nucleus'),
+                     c.phone.syllable.coda_labels.column_name('coda')]
+    else:
+        structure = [c.phone.syllable.phone.filter_by_subset('onset').label.column_name('onset'),
+                     c.phone.syllable.phone.filter_by_subset('nucleus').label.column_name('nucleus'),
+                     c.phone.syllable.phone.filter_by_subset('coda').label.column_name('coda')]
+    # qr = c.query_graph(c.phone).filter(c.phone.subset == 'sibilant')
+    # this exports data for all sibilants
+    qr = q.columns(c.phone.speaker.name.column_name('speaker'),
+                    c.phone.discourse.name.column_name('discourse'),
+                    c.phone.id.column_name('phone_id'), c.phone.label.column_name('phone_label'),
+                    c.phone.begin.column_name('begin'), c.phone.end.column_name('end'),
+                    c.phone.duration.column_name('duration'),
+                   #c.phone.syllable.position_in_word.column_name('syllable_position_in_word'),
+                    c.phone.following.label.column_name('following_phone'),
+                    c.phone.previous.label.column_name('previous_phone'),
+                    c.phone.syllable.word.label.column_name('word'),
+                    c.phone.syllable.stress.column_name('syllable_stress'),
+                    *structure,
+                    c.phone.cog.column_name('cog'), c.phone.peak.column_name('peak'),
+                    c.phone.slope.column_name('slope'), c.phone.spread.column_name('spread'))
+    for sp, _ in c.hierarchy.speaker_properties:
+        if sp == 'name':
+            continue
+        qr = qr.columns(getattr(c.phone.speaker, sp).column_name(sp))
+    return qr
+
+
+def open_query_cache(c):
+    max_bytes = query_cache_max_gb * 1024 ** 3
+    version = query_cache.corpus_version(c, pipeline_state_path(c.corpus_name))
+    return query_cache.QueryCache(os.path.join(query_cache_dir, c.corpus_name), version, max_bytes=max_bytes)
+
+
+def run_query(q, cache=None):
+    if cache is None:
+        return q.all()
+    return cache.results(q)
+
+
+def export_results(c, build_query, speakers, path, export_format='csv', stream=False, cache=None):
+    if not stream and export_format == 'csv':
+        if cache is None:
+            build_query(c, speakers).to_csv(path)
+            return None
+        results = cache.results(build_query(c, speakers))
+        save_results(results, path, header=results.columns)
+        return len(results)
+    column_types = {sp: t for sp, t in c.hierarchy.speaker_properties}
+    writer = export_writers.open_writer(path, export_format, column_types)
+    try:
+        if stream:
+            return stream_export(c, build_query, speakers or sorted(c.speakers), writer, cache)
+        results = run_query(build_query(c, speakers), cache)
+        rows = [[r[x] for x in results.columns] for r in results]
+        writer.write(results.columns, rows)
+        return len(rows)
+    finally:
+        writer.close()
+
+
+def stream_export(c, build_query, speakers, writer, cache=None):
+    # One query per speaker, each page of results written out before the next is fetched
+    beg = time.time()
+    num_rows = 0
+    call_back(0, len(speakers))
+    for i, s in enumerate(speakers):
+        results = run_query(build_query(c, [s]), cache)
+        rows = [[r[x] for x in results.columns] for r in results]
+        writer.write(results.columns, rows)
+        num_rows += len(rows)
+        del results, rows
+        elapsed = time.time() - beg
+        call_back('Exported speaker {} ({} of {}), {} rows so far ({:.1f} rows/s)'.format(
+            s, i + 1, len(speakers), num_rows, num_rows / elapsed if elapsed else 0))
+        call_back(i + 1)
+    return num_rows
+
+
+def export_path(corpus_name, name, export_format):
+    return os.path.join(base_dir, corpus_name, '{}_{}.{}'.format(corpus_name, name, export_format))
 
+
+def partition_dir(corpus_name, name, partition):
+    return os.path.join(base_dir, corpus_name, '{}_{}_by_{}'.format(corpus_name, name, partition))
+
+
+def partition_manifest_path(corpus_name, name, partition):
+    return os.path.join(partition_dir(corpus_name, name, partition), 'manifest.json')
+
+
+def export_partition(config, partition_query, path, export_format, cache=None):
+    # Each partition gets a CorpusContext, and so a database driver, of its own: the workers of
+    # export_partitions do not share the script's context across threads
+    beg = time.time()
     with CorpusContext(config) as c:
+        results = run_query(partition_query(c), cache)
+        column_types = {sp: t for sp, t in c.hierarchy.speaker_properties}
+    rows = [[r[x] for x in results.columns] for r in results]
+    writer = export_writers.open_writer(path, export_format, column_types)
+    try:
+        writer.write(results.columns, rows)
+    finally:
+        writer.close()
+    return len(rows), time.time() - beg
+
+
+def export_partitions(c, build_query, speakers, directory, partition='speaker', export_format='csv', jobs=1,
+                      only=None, cache=None):
+    """
+    Export one file per speaker or discourse into directory, running up to jobs partition queries at once,
+    each with a CorpusContext of its own.
+
+    A manifest.json in the directory records the file, row count, time and status of every partition.  A failed
+    partition is recorded and does not stop the others.  With only, just those partitions are exported again.
+    """
+    if partition == 'speaker':
+        names = speakers or sorted(c.speakers)
+        partition_query = lambda name: lambda pc: build_query(pc, [name])
+    else:
+        names = sorted(c.discourses)
+        partition_query = lambda name: lambda pc: build_query(pc, speakers).filter(pc.phone.discourse.name == name)
+    if only:
+        unknown = sorted(set(only) - set(names))
+        if unknown:
+            print('Unknown {}s, not exported: {}'.format(partition, ', '.join(unknown)))
+        names = [x for x in names if x in only]
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, 'manifest.json')
+    manifest = importing.load_manifest(manifest_path)
+    if manifest is None or manifest['export_format'] != export_format or not only:
+        manifest = {'partition': partition, 'export_format': export_format, 'partitions': {}}
+    num_rows = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+        for name in names:
+            path = os.path.join(directory, '{}.{}'.format(re.sub(r'[^\w\-.]', '_', name), export_format))
+            futures[executor.submit(export_partition, c.config, partition_query(name), path, export_format, cache)] = (
+                name, path)
+        call_back(0, len(futures))
+        for i, future in enumerate(as_completed(futures)):
+            name, path = futures[future]
+            entry = {'file': os.path.basename(path)}
+            try:
+                entry['rows'], entry['seconds'] = future.result()
+                entry['status'] = 'done'
+                num_rows += entry['rows']
+                call_back('Exported {} {} ({} of {}), {} rows in {:.1f} seconds'.format(
+                    partition, name, i + 1, len(names), entry['rows'], entry['seconds']))
+            except Exception as e:
+                entry['status'] = 'failed'
+                entry['error'] = str(e)
+                failed.append(name)
+                print('Export of {} {} failed: {}'.format(partition, name, e))
+            manifest['partitions'][name] = entry
+            importing.save_manifest(manifest_path, manifest)
+            call_back(i + 1)
+    if failed:
+        print('Failed {}s (rerun them with --partitions): {}'.format(partition, ', '.join(sorted(failed))))
+    return num_rows
+
+
+def formant_export(config, corpus_name, dialect_code, speakers, vowels, stream=False,
+                   export_format='csv', partition=None, jobs=1, only=None):  # Gets information into a csv
+
+    csv_path = export_path(corpus_name, 'formants', export_format)
+
+    with corpus_context(config) as c:
         print('Beginning formant export')
-        beg = time.time()
-        q = c.query_graph(c.phone)
-        if speakers:
-            q = q.filter(c.phone.speaker.name.in_(speakers))
-        q = q.filter(c.phone.label.in_(vowels))
-
-        q = q.columns(c.phone.speaker.name.column_name('speaker'), c.phone.discourse.name.column_name('discourse'),
-                      c.phone.id.column_name('phone_id'), c.phone.label.column_name('phone_label'),
-                      c.phone.begin.column_name('begin'), c.phone.end.column_name('end'),
-                      c.phone.syllable.stress.column_name('syllable_stress'),
-                      c.phone.syllable.word.stresspattern.column_name('word_stress_pattern'),
-                      c.phone.syllable.position_in_word.column_name('syllable_position_in_word'),
-                      c.phone.duration.column_name('duration'),
-                      c.phone.following.label.column_name('following_phone'),
-                      c.phone.previous.label.column_name('previous_phone'), c.phone.word.label.column_name('word'),
-                      c.phone.F1.column_name('F1'), c.phone.F2.column_name('F2'), c.phone.F3.column_name('F3'),
-                      c.phone.B1.column_name('B1'), c.phone.B2.column_name('B2'), c.phone.B3.column_name('B3'))
-        if c.hierarchy.has_type_property('word', 'UnisynPrimStressedVowel1'.lower()):
-            q = q.columns(c.phone.word.unisynprimstressedvowel1.column_name('UnisynPrimStressedVowel1'))
-        for v in other_vowel_codes:
-            if c.hierarchy.has_type_property('word', v.lower()):
-                q = q.columns(getattr(c.phone.word, v.lower()).column_name(v))
-        for sp, _ in c.hierarchy.speaker_properties:
-            if sp == 'name':
-                continue
-            q = q.columns(getattr(c.phone.speaker, sp).column_name(sp))
-        q.to_csv(csv_path)
-        end = time.time()
-        time_taken = time.time() - beg
-        print('Query took: {}'.format(end - beg))
+        cache = open_query_cache(c)
+        build_query = lambda qc, s: formant_export_query(qc, dialect_code, s, vowels)
+        with benchmark(config, 'formant_export') as record:
+            if partition is not None:
+                csv_path = partition_dir(corpus_name, 'formants', partition)
+                record['tokens'] = export_partitions(c, build_query, speakers, csv_path, partition, export_format,
+                                                     jobs, only, cache=cache)
+            else:
+                record['tokens'] = export_results(c, build_query, speakers, csv_path, export_format, stream,
+                                                  cache=cache)
+        print('Query took: {}'.format(record['wall_time']))
+        cache.report()
         print("Results for query written to " + csv_path)
-        save_performance_benchmark(config, 'formant_export', time_taken)
 
 
-def sibilant_export(config, corpus_name, dialect_code, speakers):
-    csv_path = os.path.join(base_dir, corpus_name, '{}_sibilants.csv'.format(corpus_name))
-    with CorpusContext(config) as c:
+def sibilant_export(config, corpus_name, dialect_code, speakers, stream=False, export_format='csv',
+                    partition=None, jobs=1, only=None):
+    csv_path = export_path(corpus_name, 'sibilants', export_format)
+    with corpus_context(config) as c:
         # export to CSV all the measures taken by the script, along with a variety of data about each phone
         print("Beginning sibilant export")
-        beg = time.time()
-        q = c.query_graph(c.phone).filter(c.phone.subset == 'sibilant')
-        #q = q.filter(c.phone.begin == c.phone.syllable.word.begin)
-        if speakers:
-            q = q.filter(c.phone.speaker.name.in_(speakers))
-        # qr = c.query_graph(c.phone).filter(c.phone.subset == 'sibilant')
-        # this exports data for all sibilants
-        qr = q.columns(c.phone.speaker.name.column_name('speaker'),
-                        c.phone.discourse.name.column_name('discourse'),
-                        c.phone.id.column_name('phone_id'), c.phone.label.column_name('phone_label'),
-                        c.phone.begin.column_name('begin'), c.phone.end.column_name('end'),
-                        c.phone.duration.column_name('duration'),
-                       #c.phone.syllable.position_in_word.column_name('syllable_position_in_word'),
-                        c.phone.following.label.column_name('following_phone'),
-                        c.phone.previous.label.column_name('previous_phone'),
-                        c.phone.syllable.word.label.column_name('word'),
-                        c.phone.syllable.stress.column_name('syllable_stress'),
-                        c.phone.syllable.phone.filter_by_subset('onset').label.column_name('onset'),
-                        c.phone.syllable.phone.filter_by_subset('nucleus').label.column_name('nucleus'),
-                        c.phone.syllable.phone.filter_by_subset('coda').label.column_name('coda'),
-                        c.phone.cog.column_name('cog'), c.phone.peak.column_name('peak'),
-                        c.phone.slope.column_name('slope'), c.phone.spread.column_name('spread'))
-        for sp, _ in c.hierarchy.speaker_properties:
-            if sp == 'name':
-                continue
-            q = q.columns(getattr(c.phone.speaker, sp).column_name(sp))
-        qr.to_csv(csv_path)
-        end = time.time()
-        time_taken = time.time() - beg
-        print('Query took: {}'.format(end - beg))
+        cache = open_query_cache(c)
+        build_query = sibilant_export_query
+        with benchmark(config, 'sibilant_export') as record:
+            if partition is not None:
+                csv_path = partition_dir(corpus_name, 'sibilants', partition)
+                record['tokens'] = export_partitions(c, build_query, speakers, csv_path, partition, export_format,
+                                                     jobs, only, cache=cache)
+            else:
+                record['tokens'] = export_results(c, build_query, speakers, csv_path, export_format, stream,
+                                                  cache=cache)
+        print('Query took: {}'.format(record['wall_time']))
+        cache.report()
         print("Results for query written to " + csv_path)
-        save_performance_benchmark(config, 'sibilant_export', time_taken)
+
+
+corpus_sizes = {}
 
 
 def get_size_of_corpus(config):
+    # Computed once per run, the cache is cleared when the corpus is (re)imported and when its utterances, which
+    # are measured once there are any, change
+    if config.corpus_name in corpus_sizes:
+        return corpus_sizes[config.corpus_name]
     from polyglotdb.query.base.func import Sum
-    with CorpusContext(config) as c:
+    with corpus_context(config) as c:
         c.config.query_behavior = 'other'
         if 'utterance' not in c.annotation_types:
             q = c.query_graph(c.word).columns(Sum(c.word.duration).column_name('result'))
         else:
             q = c.query_graph(c.utterance).columns(Sum(c.utterance.duration).column_name('result'))
         results = q.all()
+    corpus_sizes[config.corpus_name] = results[0]['result']
     return results[0]['result']
 
 
+def plan_corpus_size(config, corpus_conf):
+    # Measured in the database once the corpus is imported, otherwise the duration of its sound files
+    with corpus_context(config) as c:
+        exists = c.exists()
+    size = get_size_of_corpus(config) if exists else None
+    if size:
+        return size, 'measured in the database'
+    return planning.audio_duration(corpus_conf['corpus_directory']), 'duration of the sound files'
+
+
+def plan(config, corpus_conf, stages, parallel=None):
+    size, source = plan_corpus_size(config, corpus_conf)
+    planning.print_plan(stages, size, source, parallel=parallel)
+
+
+def phone_inventory_report(c, cache=None):
+    # Counts, thresholded counts and the most frequent example word for every phone label,
+    # computed with three grouped queries rather than three queries per label
+    from polyglotdb.query.base.func import Count
+    c.config.query_behavior = 'other'
+    report = {}
+    q = c.query_graph(c.phone).columns(c.phone.label.column_name('label'), Count(c.phone.id).column_name('count'))
+    for r in run_query(q, cache):
+        report[r['label']] = {'label': r['label'], 'count': r['count'], 'above_threshold': 0,
+                              'word': None, 'transcription': None}
+    q = c.query_graph(c.phone).filter(c.phone.duration >= duration_threshold)
+    q = q.columns(c.phone.label.column_name('label'), Count(c.phone.id).column_name('count'))
+    for r in run_query(q, cache):
+        report[r['label']]['above_threshold'] = r['count']
+    q = c.query_graph(c.phone).columns(c.phone.label.column_name('label'), c.phone.word.label.column_name('word'),
+                                       c.phone.word.transcription.column_name('transcription'),
+                                       Count(c.phone.id).column_name('count'))
+    example_counts = {}
+    for r in run_query(q, cache):
+        if r['count'] > example_counts.get(r['label'], 0):
+            example_counts[r['label']] = r['count']
+            report[r['label']]['word'] = r['word']
+            report[r['label']]['transcription'] = r['transcription']
+    return report
+
+
 def basic_queries(config):
     from polyglotdb.query.base.func import Sum
-    with CorpusContext(config) as c:
+    with corpus_context(config) as c:
         print(c.hierarchy)
         print('beginning basic queries')
-        beg = time.time()
-        q = c.query_lexicon(c.lexicon_phone).columns(c.lexicon_phone.label.column_name('label'))
-        results = q.all()
-        print('The phone inventory is:', ', '.join(sorted(x['label'] for x in results)))
-        for r in results:
-            total_count = c.query_graph(c.phone).filter(c.phone.label == r['label']).count()
-            duration_threshold_count = c.query_graph(c.phone).filter(c.phone.label == r['label']).filter(
-                c.phone.duration >= duration_threshold).count()
-            qr = c.query_graph(c.phone).filter(c.phone.label == r['label']).limit(1)
-            qr = qr.columns(c.phone.word.label.column_name('word'),
-                            c.phone.word.transcription.column_name('transcription'))
-            res = qr.all()
-            if len(res) == 0:
-                print('An example for {} was not found.'.format(r['label']))
-            else:
-                res = res[0]
-                print('An example for {} (of {}, {} above {}) is the word "{}" with the transcription [{}]'.format(
-                    r['label'], total_count, duration_threshold_count, duration_threshold, res['word'],
-                    res['transcription']))
+        cache = open_query_cache(c)
+        with benchmark(config, 'basic_query'):
+            q = c.query_lexicon(c.lexicon_phone).columns(c.lexicon_phone.label.column_name('label'))
+            results = run_query(q, cache)
+            print('The phone inventory is:', ', '.join(sorted(x['label'] for x in results)))
+            report = phone_inventory_report(c, cache)
+            for r in results:
+                res = report.get(r['label'])
+                if res is None or res['word'] is None:
+                    print('An example for {} was not found.'.format(r['label']))
+                else:
+                    print('An example for {} (of {}, {} above {}) is the word "{}" with the transcription [{}]'.format(
+                        r['label'], res['count'], res['above_threshold'], duration_threshold, res['word'],
+                        res['transcription']))
 
-        q = c.query_speakers().columns(c.speaker.name.column_name('name'))
-        results = q.all()
-        print('The speakers in the corpus are:', ', '.join(sorted(x['name'] for x in results)))
-        c.config.query_behavior = 'other'
-        q = c.query_graph(c.utterance).columns(Sum(c.utterance.duration).column_name('result'))
-        results = q.all()
-        q = c.query_graph(c.word).columns(Sum(c.word.duration).column_name('result'))
-        word_results = q.all()
-        print('The total length of speech in the corpus is: {} seconds (utterances) {} seconds (words'.format(
-            results[0]['result'], word_results[0]['result']))
-        time_taken = time.time() - beg
-        save_performance_benchmark(config, 'basic_query', time_taken)
+            q = c.query_speakers().columns(c.speaker.name.column_name('name'))
+            results = run_query(q, cache)
+            print('The speakers in the corpus are:', ', '.join(sorted(x['name'] for x in results)))
+            c.config.query_behavior = 'other'
+            q = c.query_graph(c.utterance).columns(Sum(c.utterance.duration).column_name('result'))
+            results = run_query(q, cache)
+            q = c.query_graph(c.word).columns(Sum(c.word.duration).column_name('result'))
+            word_results = run_query(q, cache)
+            print('The total length of speech in the corpus is: {} seconds (utterances) {} seconds (words'.format(
+                results[0]['result'], word_results[0]['result']))
+        cache.report()
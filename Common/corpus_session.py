@@ -0,0 +1,91 @@
+"""
+A corpus session shared by all the stages of a script.
+
+Opening a CorpusContext creates a database driver and loads the hierarchy, and closing
+it throws both away, so every stage (and every benchmark, which measures the corpus
+size) paid for its own connection.  A CorpusSession keeps one context open for the
+whole script: the driver's connection pool and the hierarchy are reused by every stage.
+The hierarchy is only reloaded when the cached copy on disk was changed by something
+other than the session, and the context's other cached state is only cleared when a
+stage changes the schema.
+
+The time spent opening the corpus is accumulated so the pipeline can report it for
+each stage.
+"""
+import os
+import json
+import time
+import hashlib
+from contextlib import contextmanager
+
+from polyglotdb import CorpusContext
+
+active_sessions = {}
+
+
+def active_session(config):
+    return active_sessions.get(config.corpus_name)
+
+
+class CorpusSession(object):
+    def __init__(self, config):
+        self.config = config
+        self.context = None
+        self.hierarchy_mtime = None
+        self.setup_time = 0
+        self.openings = 0
+        self.schema_changes = 0
+
+    def __enter__(self):
+        active_sessions[self.config.corpus_name] = self
+        return self
+
+    def __exit__(self, exc_type, exc, exc_tb):
+        active_sessions.pop(self.config.corpus_name, None)
+        self.close()
+        return False
+
+    def close(self):
+        if self.context is not None:
+            self.context.graph_driver.close()
+            self.context = None
+
+    def disk_hierarchy_mtime(self):
+        path = self.context.hierarchy_path
+        return os.path.getmtime(path) if os.path.exists(path) else None
+
+    def schema_hash(self):
+        return hashlib.sha1(json.dumps(self.context.hierarchy.to_json(), sort_keys=True).encode('utf8')).hexdigest()
+
+    def invalidate(self):
+        # Cached state of the context that depends on what is in the corpus
+        self.context._has_sound_files = None
+        self.context._has_all_sound_files = None
+
+    @contextmanager
+    def corpus(self):
+        """
+        Use the session's CorpusContext, opening it on first use.
+        """
+        begin = time.time()
+        if self.context is None:
+            self.context = CorpusContext(self.config)
+            self.context.__enter__()
+        elif self.disk_hierarchy_mtime() != self.hierarchy_mtime:
+            self.context.load_hierarchy()
+            self.invalidate()
+        self.hierarchy_mtime = self.disk_hierarchy_mtime()
+        schema = self.schema_hash()
+        self.setup_time += time.time() - begin
+        self.openings += 1
+        try:
+            yield self.context
+        finally:
+            if self.schema_hash() != schema:
+                self.schema_changes += 1
+                self.invalidate()
+            self.hierarchy_mtime = self.disk_hierarchy_mtime()
+
+    def report(self):
+        print('Corpus session: opened {} times, {:.3f} seconds of setup, {} schema changes.'.format(
+            self.openings, self.setup_time, self.schema_changes))
@@ -0,0 +1,97 @@
+"""
+Writers for exported query results, fed one page of rows at a time.
+
+Values are written as PolyglotDB's save_results writes them (lists joined with '/',
+None as an empty field), so every export path gives the same output.
+"""
+import csv
+import sys
+
+from polyglotdb.io.exporters.csv import make_safe
+
+numeric_columns = {'begin': float, 'end': float, 'duration': float,
+                   'F1': float, 'F2': float, 'F3': float, 'B1': float, 'B2': float, 'B3': float,
+                   'cog': float, 'peak': float, 'slope': float, 'spread': float,
+                   'syllable_position_in_word': int}
+
+
+class CsvWriter(object):
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'w', encoding='utf8', newline='')
+        self.writer = csv.writer(self.file)
+        self.header = None
+
+    def write(self, header, rows):
+        if self.header is None:
+            self.header = header
+            self.writer.writerow(header)
+        self.writer.writerows([make_safe(x, '/') for x in row] for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter(object):
+    """
+    Writes typed columns to a Parquet file, with every string column dictionary encoded
+    and every page of rows stored as (at least) one row group.
+    """
+    def __init__(self, path, column_types=None, row_group_size=100000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            print('Parquet export requires the pyarrow package (pip install pyarrow).')
+            sys.exit(1)
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.column_types = dict(numeric_columns)
+        if column_types:
+            self.column_types.update(column_types)
+        self.row_group_size = row_group_size
+        self.header = None
+        self.writer = None
+
+    def arrow_type(self, column):
+        t = self.column_types.get(column, str)
+        if t is float:
+            return self.pa.float64()
+        if t is int:
+            return self.pa.int64()
+        if t is bool:
+            return self.pa.bool_()
+        return self.pa.dictionary(self.pa.int32(), self.pa.string())
+
+    def column_array(self, column, values):
+        arrow_type = self.arrow_type(column)
+        if self.pa.types.is_dictionary(arrow_type):
+            values = [None if v is None else make_safe(v, '/') for v in values]
+            return self.pa.array(values, type=self.pa.string()).dictionary_encode()
+        if self.pa.types.is_integer(arrow_type):
+            values = [None if v is None or v == '' else int(v) for v in values]
+        elif self.pa.types.is_floating(arrow_type):
+            values = [None if v is None or v == '' else float(v) for v in values]
+        return self.pa.array(values, type=arrow_type)
+
+    def write(self, header, rows):
+        if self.writer is None:
+            self.header = header
+            schema = self.pa.schema([(h, self.arrow_type(h)) for h in header])
+            self.writer = self.pq.ParquetWriter(self.path, schema, compression='snappy')
+        for i in range(0, len(rows), self.row_group_size):
+            chunk = rows[i:i + self.row_group_size]
+            columns = list(zip(*chunk))
+            arrays = [self.column_array(h, columns[j]) for j, h in enumerate(self.header)]
+            self.writer.write_table(self.pa.Table.from_arrays(arrays, names=self.header))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_writer(path, export_format, column_types=None):
+    if export_format == 'parquet':
+        return ParquetWriter(path, column_types)
+    return CsvWriter(path)
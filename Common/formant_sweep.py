@@ -0,0 +1,114 @@
+"""
+Formant parameter sweep: evaluate a grid of refinement settings with one Praat pass over the vowels per ceiling.
+
+Candidates are measured as analyze_formant_points_refinement measures them, with
+PolyglotDB's multiple_num_formants.praat script (4 to 7 formants in steps of a half,
+at 33% of the vowel), once for every maximum formant (ceiling) in the grid.  The
+script is run through conch once per token, so every ceiling is a full Praat pass
+over the vowels, costing as much as the formant analysis itself: the sweep's time
+grows with the number of ceilings.  The other settings only change the refinement,
+which is run on the stored candidates.
+
+The refinement is PolyglotDB's, run on these candidates alone for every duration
+threshold and number of iterations: per speaker and vowel, prototypes are computed
+with get_mean_SD from the 5 formant candidates, and each token takes the candidate
+with the smallest get_mahalanobis distance, until the choices stop changing or the
+iterations run out.  Speakers with fewer than 6 tokens of a vowel keep the 5
+formant candidate.  With a 5500 Hz ceiling, a setting gives the measures that the
+formant analysis stores with the same duration threshold and number of iterations.
+"""
+import os
+import math
+
+import numpy as np
+from conch import analyze_segments
+from conch.analysis.praat import PraatAnalysisFunction
+from polyglotdb.acoustics.formants import helper
+from polyglotdb.acoustics.formants.helper import get_mahalanobis, get_mean_SD, parse_multiple_formant_output
+
+script_path = os.path.join(os.path.dirname(helper.__file__), 'multiple_num_formants.praat')
+min_formants = 4
+max_formants = 7
+default_formant = 5
+min_tokens = 6
+padding = 0.1
+columns = ['F1', 'F2', 'F3', 'B1', 'B2', 'B3']
+
+
+def formant_function(praat_path, ceiling):
+    # generate_variable_formants_point_function, with the ceiling as a parameter
+    function = PraatAnalysisFunction(script_path, praat_path=praat_path,
+                                     arguments=[0.01, 0.025, min_formants, max_formants, ceiling])
+    function._function._output_parse_function = parse_multiple_formant_output
+    return function
+
+
+def measure_candidates(segment_mapping, ceilings, praat_path, multiprocessing=True, jobs=None):
+    """
+    Returns a dictionary of ceiling -> segment -> {number of formants: measures}, analyzing up to jobs tokens at once.
+    """
+    return {c: analyze_segments(segment_mapping, formant_function(praat_path, c), num_jobs=jobs,
+                                multiprocessing=multiprocessing)
+            for c in ceilings}
+
+
+def refine(output, num_iterations):
+    """
+    Choose a candidate for each token of one speaker and vowel, as analyze_formant_points_refinement does.
+
+    output maps each segment to its candidates; returns a dictionary of segment -> chosen measures.
+    """
+    if len(output) < min_tokens:
+        return {s: data[default_formant] for s, data in output.items() if data}
+    output = {s: data for s, data in output.items() if data}
+    prototypes = get_mean_SD({s: data[default_formant] for s, data in output.items()}, columns)
+    vowel = next(iter(output))['label']
+    chosen = previous = None
+    for _ in range(num_iterations):
+        means, covariance = prototypes[vowel]
+        inverse_covariance = np.linalg.pinv(np.array(covariance))
+        chosen = {}
+        for s, data in output.items():
+            best_distance = math.inf
+            chosen[s] = default_formant
+            for number, point in data.items():
+                distance = get_mahalanobis(means, [point[x] if point[x] else 0 for x in columns], inverse_covariance)
+                if distance < best_distance:
+                    best_distance = distance
+                    chosen[s] = number
+        prototypes = get_mean_SD({s: output[s][n] for s, n in chosen.items()}, columns)
+        if chosen == previous:
+            break
+        previous = chosen
+    if chosen is None:
+        return {s: data[default_formant] for s, data in output.items()}
+    return {s: output[s][n] for s, n in chosen.items()}
+
+
+def config_label(num_iterations, threshold, ceiling):
+    return 'i{}_d{}_c{}'.format(num_iterations, threshold, ceiling)
+
+
+def run_sweep(segments, candidates, grid):
+    """
+    Evaluate every (num_iterations, duration_threshold, max_formant) setting in grid.
+
+    candidates are the measures of the segments from measure_candidates.  Returns a dictionary of
+    configuration label -> array (segments, 6), with NaN for the measures of tokens under that
+    configuration's duration threshold and for undefined measures.
+    """
+    results = {}
+    for num_iterations, threshold, ceiling in grid:
+        groups = {}
+        for seg in segments:
+            if seg.end - seg.begin >= threshold:
+                groups.setdefault((seg['speaker'], seg['label']), []).append(seg)
+        chosen = {}
+        for members in groups.values():
+            chosen.update(refine({s: candidates[ceiling].get(s) or {} for s in members}, num_iterations))
+        values = np.full((len(segments), len(columns)), np.nan)
+        for i, seg in enumerate(segments):
+            if seg in chosen:
+                values[i] = [np.nan if chosen[seg].get(x) is None else chosen[seg][x] for x in columns]
+        results[config_label(num_iterations, threshold, ceiling)] = values
+    return results
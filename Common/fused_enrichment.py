@@ -0,0 +1,111 @@
+"""
+Fused hierarchical enrichment: counts, positions and rates of lower annotations in higher ones, in one pass.
+
+PolyglotDB's encode_count, encode_position and encode_rate each run a separate query
+over the whole hierarchy.  Here every speech token of a discourse is fetched once
+along with the tokens of the requested types that directly contain it (the importer
+links each annotation to all of its ancestors), all requested properties are
+computed in Python, and they are written back with one bulk UNWIND statement per
+annotation type.  As in PolyglotDB, pause words are not counted.
+
+Properties are specified as (kind, higher_type, lower_type, name) tuples, where kind
+is 'count', 'rate' or 'position', with the same meaning as the PolyglotDB methods:
+the number of lower annotations in each higher one, that number divided by the
+higher annotation's duration, and the (1-based) position of each lower annotation
+in its higher one.  Counts and rates are stored on the higher annotations and
+positions on the lower ones.
+"""
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+
+def fetch_tokens(c, discourse, types):
+    statement = '''MATCH (d:Discourse:{corpus})<-[:spoken_in]-(n:{corpus}:speech)
+    WHERE d.name = $discourse AND any(x IN labels(n) WHERE x IN $types)
+    OPTIONAL MATCH (n)-[:contained_by]->(m:{corpus}:speech)
+    WHERE any(x IN labels(m) WHERE x IN $types)
+    WITH n, collect(m) AS ms
+    RETURN n.id AS id, n.begin AS begin, n.end AS end, [x IN labels(n) WHERE x IN $types][0] AS type,
+    [m IN ms | [[x IN labels(m) WHERE x IN $types][0], m.id]] AS parents'''.format(corpus=c.cypher_safe_name)
+    return c.execute_cypher(statement, discourse=discourse, types=types)
+
+
+def compute_property(tokens, by_type, kind, higher, lower):
+    """
+    Returns a dictionary of token id -> value for one property, given tokens as
+    id -> (type, begin, end, {parent type: parent id}).
+    """
+    groups = defaultdict(list)
+    for token_id in by_type[lower]:
+        parent = tokens[token_id][3].get(higher)
+        if parent is not None:
+            groups[parent].append((tokens[token_id][1], token_id))
+    values = {}
+    if kind == 'position':
+        for members in groups.values():
+            begins = sorted(x[0] for x in members)
+            for begin, token_id in members:
+                values[token_id] = bisect_left(begins, begin) + 1
+        return values
+    for token_id in by_type[higher]:
+        count = len(groups.get(token_id, []))
+        if kind == 'count':
+            values[token_id] = count
+        else:
+            duration = tokens[token_id][2] - tokens[token_id][1]
+            values[token_id] = count / duration if duration else None
+    return values
+
+
+def write_properties(c, annotation_type, values):
+    rows = [{'id': k, 'props': v} for k, v in values.items()]
+    statement = '''UNWIND $rows AS row
+    MATCH (n:{type}:{corpus} {{id: row.id}})
+    SET n += row.props'''.format(type=annotation_type, corpus=c.cypher_safe_name)
+    c.execute_cypher(statement, rows=rows)
+
+
+def encode_properties(c, properties, call_back=None, discourses=None):
+    """
+    Compute and store (kind, higher_type, lower_type, name) properties for every discourse in the corpus, or only
+    for the given discourses.
+
+    Returns the seconds spent on each property: the time computing it plus an equal share of the time
+    spent fetching and writing tokens.
+    """
+    types = sorted(set(x for p in properties for x in p[1:3]))
+    property_times = [0] * len(properties)
+    shared_time = 0
+    if discourses is None:
+        discourses = c.discourses
+    if call_back is not None:
+        call_back(0, len(discourses))
+    for i, d in enumerate(discourses):
+        if call_back is not None:
+            call_back('Enriching discourse {} of {} ({})...'.format(i + 1, len(discourses), d))
+        begin = time.time()
+        tokens = {}
+        by_type = defaultdict(list)
+        for r in fetch_tokens(c, d, types):
+            tokens[r['id']] = (r['type'], r['begin'], r['end'], dict(r['parents']))
+            by_type[r['type']].append(r['id'])
+        shared_time += time.time() - begin
+        updates = defaultdict(lambda: defaultdict(dict))
+        for j, (kind, higher, lower, name) in enumerate(properties):
+            begin = time.time()
+            target = lower if kind == 'position' else higher
+            for token_id, value in compute_property(tokens, by_type, kind, higher, lower).items():
+                updates[target][token_id][name] = value
+            property_times[j] += time.time() - begin
+        begin = time.time()
+        for annotation_type, values in updates.items():
+            write_properties(c, annotation_type, values)
+        shared_time += time.time() - begin
+        if call_back is not None:
+            call_back(i + 1)
+    for kind, higher, lower, name in properties:
+        target = lower if kind == 'position' else higher
+        c.hierarchy.add_token_properties(c, target, [(name, float)])
+    c.encode_hierarchy()
+    return [x + shared_time / len(properties) for x in property_times]
@@ -0,0 +1,223 @@
+"""
+Incremental corpus import: keep a manifest of the imported discourse files and load only new or changed ones.
+
+The manifest maps each file's path (relative to the corpus directory) to its size,
+modification time, content hash and discourse name.  Files are only hashed again
+when their size or modification time changes, so checking a large corpus for
+additions is cheap.  New files are added to the existing corpus, changed files
+have their discourse removed and loaded again, and discourses of deleted files
+are removed.
+
+Discourse files can be parsed in a process pool; parsed discourses are handed to
+the loader in file order, with a bounded number parsed ahead so memory use does
+not grow with the corpus.  The parse time of every file is returned so that
+pathological files can be found.  Discourses can also be committed to the
+database in batches, with the manifest saved after each one as a checkpoint, so an
+interrupted import resumes from the last committed batch.
+
+PolyglotDB's import ends by linking every token of the corpus to all of its
+ancestors (e.g. phones to utterances), with a CREATE over the whole graph.  Here
+that step is limited to the discourses of the batch and uses MERGE, so each batch
+costs the same however large the corpus already is, and tokens imported earlier
+(or enriched since) don't get their links duplicated.
+"""
+import os
+import json
+import time
+import copy
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from polyglotdb.exceptions import ParseError
+from polyglotdb.io.importer import import_csvs
+
+from pipeline import file_hash
+import utterances
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf8') as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    with open(path + '.tmp', 'w', encoding='utf8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def discourse_files(parser, corpus_dir):
+    # Same file discovery as CorpusContext.load_directory
+    paths = []
+    for root, _, files in os.walk(corpus_dir, followlinks=True):
+        for filename in files:
+            if parser.match_extension(filename):
+                paths.append(os.path.join(root, filename))
+    return sorted(paths)
+
+
+def discourse_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def file_entry(path, previous=None):
+    st = os.stat(path)
+    entry = {'size': st.st_size, 'mtime': st.st_mtime, 'discourse': discourse_name(path)}
+    if previous is not None and previous['size'] == entry['size'] and previous['mtime'] == entry['mtime']:
+        entry['hash'] = previous['hash']
+    else:
+        entry['hash'] = file_hash(path)
+    return entry
+
+
+def build_manifest(corpus_dir, paths, previous=None):
+    previous = previous or {}
+    manifest = {}
+    for path in paths:
+        key = os.path.relpath(path, corpus_dir)
+        manifest[key] = file_entry(path, previous.get(key))
+    return manifest
+
+
+def compare_manifests(previous, current):
+    """
+    Returns the relative paths of new, changed and removed files between two manifests.
+    """
+    new = sorted(k for k in current if k not in previous)
+    changed = sorted(k for k in current if k in previous and current[k]['hash'] != previous[k]['hash'])
+    removed = sorted(k for k in previous if k not in current)
+    return new, changed, removed
+
+
+def parse_file(parser, path, corpus_name=None):
+    # Types and speakers of the file when corpus_name is given (first pass), otherwise the full discourse
+    begin = time.time()
+    try:
+        if corpus_name is not None:
+            result = parser.parse_information(path, corpus_name)
+            if not result['type_headers']:
+                raise ParseError('There was an issue using this parser to parse the file {}.'.format(path))
+        else:
+            result = parser.parse_discourse(path)
+        error = None
+    except ParseError as e:
+        result, error = None, str(e)
+    return result, error, time.time() - begin
+
+
+def parse_files(parser, paths, corpus_name=None, jobs=1):
+    """
+    Parse files with up to jobs processes, yielding (path, result, error, seconds) in the order of paths.
+    """
+    if jobs <= 1:
+        for path in paths:
+            yield (path,) + parse_file(parser, path, corpus_name)
+        return
+    worker_parser = copy.copy(parser)
+    worker_parser.call_back = None
+    worker_parser.stop_check = None
+    paths = iter(paths)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for path in paths:
+            pending.append((path, executor.submit(parse_file, worker_parser, path, corpus_name)))
+            if len(pending) >= 2 * jobs:
+                break
+        while pending:
+            path, future = pending.popleft()
+            next_path = next(paths, None)
+            if next_path is not None:
+                pending.append((next_path, executor.submit(parse_file, worker_parser, next_path, corpus_name)))
+            yield (path,) + future.result()
+
+
+class BatchImport(object):
+    """
+    A corpus context for import_csvs that links tokens to their ancestors only in the given discourses.
+    """
+    def __init__(self, c, discourses):
+        self.c = c
+        self.discourses = list(discourses)
+
+    def __getattr__(self, name):
+        return getattr(self.c, name)
+
+    def execute_cypher(self, statement, **parameters):
+        if '[:contained_by*2..]' in statement and 'CREATE (subunit)-[:contained_by]->(superunit)' in statement:
+            statement = '''MATCH (d:Discourse:{corpus}) WHERE d.name IN $discourses
+            MATCH (subunit:{corpus}:speech)-[:spoken_in]->(d)
+            MATCH (subunit)-[:contained_by*2..]->(superunit:{corpus}:speech)
+            WITH DISTINCT subunit, superunit
+            MERGE (subunit)-[:contained_by]->(superunit)'''.format(corpus=self.c.cypher_safe_name)
+            parameters = dict(parameters, discourses=self.discourses)
+        return self.c.execute_cypher(statement, **parameters)
+
+
+def load_discourses(c, parser, paths, call_back=None, jobs=1, batch_size=None, on_batch=None, word_tier_dir=None):
+    """
+    Add the discourses in paths to the corpus, following CorpusContext.load_directory.
+
+    With batch_size, discourses are parsed and committed to the database in batches of that many files, so
+    memory use is bounded by the batch rather than the corpus, and on_batch is called with the paths of each
+    committed batch.  With word_tier_dir, the words of each discourse are saved there for offline utterance
+    encoding (see utterances.py).  Returns a dictionary of file path -> seconds spent parsing it.
+    """
+    if not paths:
+        raise ParseError('No files in the specified directory matched the parser. '
+                         'Please check to make sure you have the correct parser.')
+    batch_size = batch_size or len(paths)
+    timings = {}
+    for i in range(0, len(paths), batch_size):
+        batch = paths[i:i + batch_size]
+        if call_back is not None and batch_size < len(paths):
+            call_back('Importing files {}-{} of {}...'.format(i + 1, i + len(batch), len(paths)))
+        timings.update(load_batch(c, parser, batch, call_back, jobs, word_tier_dir))
+        if on_batch is not None:
+            on_batch(batch)
+    return timings
+
+
+def load_batch(c, parser, paths, call_back=None, jobs=1, word_tier_dir=None):
+    speakers = set()
+    types = defaultdict(set)
+    type_headers = token_headers = subannotations = None
+    could_not_parse = {}
+    timings = {}
+    for path, information, error, seconds in parse_files(parser, paths, c.corpus_name, jobs):
+        timings[path] = seconds
+        if error is not None:
+            could_not_parse[path] = error
+            continue
+        speakers.update(information['speakers'])
+        type_headers = information['type_headers']
+        token_headers = information['token_headers']
+        subannotations = information['subannotations']
+        for k, v in information['types'].items():
+            types[k].update(v)
+    if could_not_parse:
+        raise ParseError('There were issues parsing the following files with {} parser: {}'.format(
+            parser.name, '\n\n'.join('{}: {}'.format(k, v) for k, v in could_not_parse.items())))
+    c.initialize_import(speakers, token_headers, subannotations)
+    c.add_types(types, type_headers)
+    if call_back is not None:
+        call_back(0, len(paths))
+    names = []
+    for i, (path, data, error, seconds) in enumerate(parse_files(parser, paths, jobs=jobs)):
+        timings[path] += seconds
+        if call_back is not None:
+            call_back('Parsing file {} of {} ({})...'.format(i + 1, len(paths), discourse_name(path)))
+        if error is not None or data is None:
+            # The file parsed in the first pass, so it changed while importing; don't checkpoint the batch
+            raise ParseError('There was an issue parsing {} with {} parser: {}'.format(path, parser.name, error))
+        c.add_discourse(data)
+        names.append(data.name)
+        if word_tier_dir is not None:
+            utterances.save_word_table(word_tier_dir, data.name, utterances.word_table(data))
+        if call_back is not None:
+            call_back(i + 1)
+    # CorpusContext.finalize_import, with the ancestor links of the batch only
+    import_csvs(BatchImport(c, names), speakers, token_headers, parser.hierarchy, call_back)
+    c.encode_hierarchy()
+    return timings
@@ -0,0 +1,88 @@
+"""
+Compiled lexicon enrichment files, shared across corpora.
+
+enrich_lexicon_from_csv parses the whole Unisyn CSV file for every corpus, although
+most of its rows are for words the corpus never uses.  Here each CSV file is compiled
+once into an SQLite database in cache/lexicon, indexed by (lower case) word label and
+keyed by the hash of the CSV file, so every corpus using the same enrichment files
+shares it and it is rebuilt when a file changes.  Enrichment then looks up the words of
+the corpus in the store and only writes the matching rows.
+
+Rows and property types are parsed with PolyglotDB's own CSV parser, so the stored
+values are the same as with enrich_lexicon_from_csv.
+"""
+import os
+import json
+import sqlite3
+
+from polyglotdb.io.enrichment.helper import parse_file
+from polyglotdb.io.importer import lexicon_data_to_csvs, import_lexicon_csvs
+
+from pipeline import file_hash
+
+property_types = {'int': int, 'float': float, 'bool': bool, 'str': str}
+
+
+def store_path(directory, csv_path):
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(directory, '{}_{}.sqlite'.format(name, file_hash(csv_path)[:16]))
+
+
+def compile_store(csv_path, path):
+    data, type_data = parse_file(csv_path, labels=None, case_sensitive=False)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path + '.tmp'):
+        os.remove(path + '.tmp')
+    conn = sqlite3.connect(path + '.tmp')
+    with conn:
+        conn.execute('CREATE TABLE entries (label TEXT PRIMARY KEY, data TEXT)')
+        conn.execute('CREATE TABLE properties (name TEXT PRIMARY KEY, type TEXT)')
+        conn.executemany('INSERT INTO entries VALUES (?, ?)', ((k, json.dumps(v)) for k, v in data.items()))
+        conn.executemany('INSERT INTO properties VALUES (?, ?)',
+                         ((k, v.__name__) for k, v in type_data.items()))
+    conn.close()
+    os.replace(path + '.tmp', path)
+
+
+def open_store(directory, csv_path):
+    """
+    Returns the path of the compiled store for a lexicon CSV file, compiling it first if needed.
+    """
+    path = store_path(directory, csv_path)
+    if not os.path.exists(path):
+        print('Compiling lexicon store for {}...'.format(csv_path))
+        compile_store(csv_path, path)
+    return path
+
+
+def lookup(path, labels):
+    """
+    Returns the entries for the given word labels (lower cased) and the types of the store's properties.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('CREATE TEMP TABLE corpus_words (label TEXT PRIMARY KEY)')
+        conn.executemany('INSERT OR IGNORE INTO corpus_words VALUES (?)', ((x.lower(),) for x in labels))
+        data = {label: json.loads(v) for label, v in
+                conn.execute('SELECT e.label, e.data FROM entries e JOIN corpus_words w ON e.label = w.label')}
+        type_data = {k: property_types[v] for k, v in conn.execute('SELECT name, type FROM properties')}
+    finally:
+        conn.close()
+    return data, type_data
+
+
+def enrich_lexicon(c, directory, csv_path):
+    """
+    Enrich the corpus lexicon from a lexicon CSV file through its compiled store.
+
+    Unlike CorpusContext.enrich_lexicon, properties already in the corpus are written again, so words added to
+    the corpus since the last enrichment get them too.  Returns the number of words enriched.
+    """
+    data, type_data = lookup(open_store(directory, csv_path), c.words)
+    if not data:
+        return 0
+    lexicon_data_to_csvs(c, data)
+    import_lexicon_csvs(c, type_data)
+    c.hierarchy.add_type_properties(c, c.word_name, type_data.items())
+    c.encode_hierarchy()
+    return len(data)
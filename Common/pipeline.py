@@ -0,0 +1,151 @@
+"""
+Dependency graph of pipeline stages with checkpointed, content-hash based invalidation.
+
+Each stage records a hash of its inputs (configuration values, the contents of files
+such as Praat scripts or enrichment CSVs, and the hashes of the stages it depends on)
+once it completes.  On the next run, a stage is skipped if its hash is unchanged,
+otherwise it is invalidated and rerun, along with every stage depending on it.
+Stages that can process new data incrementally (e.g. only newly imported
+discourses) provide an ``update`` function, which is run instead when only the
+stages they depend on changed.
+
+When given the script's corpus session, the time each stage spends opening the corpus
+is reported.
+"""
+import os
+import json
+import hashlib
+
+
+def file_hash(path):
+    if not os.path.exists(path):
+        return None
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class Stage(object):
+    def __init__(self, name, run, depends=None, inputs=None, files=None, outputs=None, invalidate=None,
+                 update=None, always=False, read_only=False):
+        self.name = name
+        self.run = run
+        self.depends = depends or []
+        self.inputs = inputs
+        self.files = files or []
+        self.outputs = outputs or []
+        self.invalidate = invalidate
+        self.update = update
+        self.always = always
+        self.read_only = read_only
+
+    def input_data(self):
+        if callable(self.inputs):
+            return self.inputs()
+        return self.inputs
+
+
+class Pipeline(object):
+    def __init__(self, state_path, session=None):
+        self.state_path = state_path
+        self.session = session
+        self.stages = {}
+        self.order = []
+        self.state = {}
+        if os.path.exists(state_path):
+            with open(state_path, 'r', encoding='utf8') as f:
+                self.state = json.load(f)
+        self._hashes = {}
+
+    def add_stage(self, name, run, **kwargs):
+        for d in kwargs.get('depends') or []:
+            if d not in self.stages:
+                raise KeyError('Stage {} depends on unknown stage {}'.format(name, d))
+        self.stages[name] = Stage(name, run, **kwargs)
+        self.order.append(name)
+
+    def input_hash(self, name):
+        # Hash of the stage's own inputs and files, without the stages it depends on
+        stage = self.stages[name]
+        data = {'inputs': stage.input_data(),
+                'files': {os.path.basename(x): file_hash(x) for x in stage.files}}
+        return hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode('utf8')).hexdigest()
+
+    def stage_hash(self, name):
+        if name not in self._hashes:
+            stage = self.stages[name]
+            data = {'inputs': self.input_hash(name),
+                    'depends': {d: self.stage_hash(d) for d in stage.depends}}
+            encoded = json.dumps(data, sort_keys=True).encode('utf8')
+            self._hashes[name] = hashlib.sha1(encoded).hexdigest()
+        return self._hashes[name]
+
+    def previous_state(self, name):
+        previous = self.state.get(name)
+        if isinstance(previous, str):
+            # State files written before input hashes were recorded
+            return {'hash': previous, 'inputs': None}
+        return previous
+
+    def needed_stages(self, targets=None):
+        if targets is None:
+            return list(self.order)
+        needed = set()
+        to_visit = list(targets)
+        while to_visit:
+            name = to_visit.pop()
+            if name in needed:
+                continue
+            needed.add(name)
+            to_visit.extend(self.stages[name].depends)
+        return [x for x in self.order if x in needed]
+
+    def pending_stages(self, targets=None):
+        # Stages that run() would not skip
+        return [x for x in self.needed_stages(targets) if not self.is_current(x)]
+
+    def is_current(self, name):
+        stage = self.stages[name]
+        if stage.always or any(not os.path.exists(x) for x in stage.outputs):
+            return False
+        previous = self.previous_state(name)
+        return previous is not None and previous['hash'] == self.stage_hash(name)
+
+    def save_state(self):
+        with open(self.state_path, 'w', encoding='utf8') as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+
+    def clear(self):
+        self.state = {}
+        self._hashes = {}
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def run(self, targets=None):
+        for name in self.needed_stages(targets):
+            stage = self.stages[name]
+            if self.is_current(name):
+                print('Stage {} is up to date, skipping.'.format(name))
+                continue
+            previous = self.previous_state(name)
+            inputs = self.input_hash(name)
+            if self.session is not None:
+                setup_time, openings = self.session.setup_time, self.session.openings
+            if previous is not None and stage.update is not None and previous['inputs'] in (inputs, None):
+                print('Updating stage {} with new data.'.format(name))
+                stage.update()
+            else:
+                if previous is not None and stage.invalidate is not None:
+                    print('Stage {} is out of date, invalidating previous results.'.format(name))
+                    stage.invalidate()
+                stage.run()
+            if self.session is not None:
+                print('Stage {} spent {:.3f} seconds opening the corpus ({} times).'.format(
+                    name, self.session.setup_time - setup_time, self.session.openings - openings))
+            # Later stages hash the state this stage left behind
+            self._hashes = {}
+            self.state[name] = {'hash': self.stage_hash(name), 'inputs': self.input_hash(name),
+                                'read_only': stage.read_only}
+            self.save_state()
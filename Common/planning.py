@@ -0,0 +1,171 @@
+"""
+Runtime and resource estimates for the remaining pipeline stages, from the benchmark history.
+
+Every benchmark adds a row to benchmarks/benchmarks.csv with the computer, the corpus
+size (seconds of speech) and the time the task took.  For each task, a linear model of
+time against corpus size is fitted to the rows of this computer, or to those of every
+computer when this one has not run the task yet, and a stage's estimate is the sum of
+the estimates of its tasks.  Peak memory is fitted the same way from the telemetry in
+benchmarks/telemetry.jsonl.
+
+Times are taken as those of a single worker.  Stages that can split their work across
+processes get a recommended number of workers: one per minimum_worker_seconds of
+expected work, as starting workers has a cost of its own, up to the number of CPUs.
+"""
+import os
+import csv
+import wave
+import platform
+from datetime import timedelta
+
+import numpy as np
+
+import telemetry
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+benchmark_path = os.path.join(base_dir, 'benchmarks', 'benchmarks.csv')
+
+minimum_worker_seconds = 60
+
+# Benchmark tasks recorded by each pipeline stage
+stage_tasks = {'import': ['import'],
+               'lexicon_enrichment': ['lexicon_enrichment'],
+               'speaker_enrichment': ['speaker_enrichment'],
+               'basic_enrichment': ['utterance_encoding', 'syllable_encoding', 'syllable_structure_encoding',
+                                    'fused_enrichment', 'stress_encoding'],
+               'formant_acoustic_analysis': ['formant_acoustic_analysis'],
+               'formant_export': ['formant_export'],
+               'formant_sweep': ['formant_sweep'],
+               'sibilant_acoustic_analysis': ['sibilant_encoding', 'sibilant_acoustic_analysis'],
+               'sibilant_export': ['sibilant_export']}
+
+# Tasks used instead when a task has no history, e.g. the separate encodings benchmarked before fused_enrichment
+task_fallbacks = {'fused_enrichment': ['speech_rate_encoding', 'num_words_encoding', 'num_syllables_encoding',
+                                       'position_in_word_encoding', 'num_phones_encoding'],
+                  'stress_encoding': ['stress_encoding_from_pattern']}
+
+
+def load_history(path=benchmark_path):
+    rows = []
+    if not os.path.exists(path):
+        return rows
+    with open(path, 'r', encoding='utf8') as f:
+        for r in csv.DictReader(f):
+            try:
+                size, time_taken = float(r['Corpus_size']), float(r['Time'])
+            except (TypeError, ValueError):  # size of a corpus that was not imported
+                continue
+            if size > 0:
+                rows.append({'computer': r['Computer'], 'corpus': r['Corpus'], 'task': r['Task'],
+                             'size': size, 'value': time_taken})
+    return rows
+
+
+def load_memory_history(path=telemetry.telemetry_path):
+    return [{'computer': r['computer'], 'corpus': r['corpus'], 'task': r['stage'], 'size': r['corpus_size'],
+             'value': r['stage_peak_rss_mb']}
+            for r in telemetry.load_records(path) if r.get('corpus_size') and r.get('stage_peak_rss_mb')]
+
+
+def fit(points):
+    """
+    Least squares fit of value = a + b * size, returning (a, b).
+
+    The line goes through the origin when all points have the same size or the fitted intercept or slope is negative.
+    """
+    sizes = np.array([x['size'] for x in points], dtype=float)
+    values = np.array([x['value'] for x in points], dtype=float)
+    if len(np.unique(sizes)) > 1:
+        b, a = np.polyfit(sizes, values, 1)
+        if a >= 0 and b >= 0:
+            return a, b
+    return 0.0, float(np.dot(sizes, values) / np.dot(sizes, sizes))
+
+
+def task_points(rows, task, computer):
+    # Rows of this computer, or of every computer when it has none for the task
+    points = [x for x in rows if x['task'] == task]
+    own = [x for x in points if x['computer'] == computer]
+    if own:
+        return own, True
+    return points, False
+
+
+def estimate_task(rows, task, size, computer):
+    """
+    Returns the estimate for a task at the given corpus size and the number of runs it was fitted to, along with
+    whether they were all of this computer, or None when the task (and its fallbacks) has no history.
+    """
+    points, own = task_points(rows, task, computer)
+    if points:
+        a, b = fit(points)
+        return a + b * size, len(points), own
+    estimates = [estimate_task(rows, x, size, computer) for x in task_fallbacks.get(task, [])]
+    estimates = [x for x in estimates if x is not None]
+    if not estimates:
+        return None
+    return (sum(x[0] for x in estimates), min(x[1] for x in estimates), all(x[2] for x in estimates))
+
+
+def estimate_stage(rows, stage, size, computer, combine=sum):
+    estimates = [estimate_task(rows, x, size, computer) for x in stage_tasks.get(stage, [stage])]
+    estimates = [x for x in estimates if x is not None]
+    if not estimates:
+        return None
+    return combine(x[0] for x in estimates), min(x[1] for x in estimates), all(x[2] for x in estimates)
+
+
+def recommended_workers(seconds, cpus=None):
+    cpus = cpus or os.cpu_count() or 1
+    return int(max(1, min(cpus, seconds // minimum_worker_seconds)))
+
+
+def audio_duration(directory):
+    # Total duration of the wav files in a corpus directory, which includes the silences between speech
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.lower().endswith('.wav'):
+                continue
+            try:
+                with wave.open(os.path.join(root, name), 'rb') as f:
+                    total += f.getnframes() / f.getframerate()
+            except (wave.Error, EOFError):  # e.g. floating point wav files
+                continue
+    return total
+
+
+def format_duration(seconds):
+    return str(timedelta(seconds=int(round(seconds))))
+
+
+def print_plan(stages, size, size_source, parallel=None, computer=None):
+    """
+    Print the expected runtime and peak memory of each stage, and a worker count for those in ``parallel``, a
+    dictionary of stage name to the option setting its number of workers.
+    """
+    computer = computer or platform.node()
+    parallel = parallel or {}
+    rows = load_history()
+    memory_rows = load_memory_history()
+    print('Plan for {} of speech ({}) on {}:'.format(format_duration(size), size_source, computer))
+    total = 0
+    for stage in stages:
+        estimate = estimate_stage(rows, stage, size, computer)
+        if estimate is None:
+            print('  {}: no benchmark history'.format(stage))
+            continue
+        seconds, runs, own = estimate
+        line = '  {}: {} (fitted to {} runs{})'.format(stage, format_duration(seconds), runs,
+                                                        '' if own else ' of other computers')
+        if stage in parallel:
+            workers = recommended_workers(seconds)
+            seconds /= workers
+            line += ', {} worker{} with {} (~{})'.format(workers, '' if workers == 1 else 's', parallel[stage],
+                                                          format_duration(seconds))
+        memory = estimate_stage(memory_rows, stage, size, computer, combine=max)
+        if memory is not None:
+            line += ', peak memory ~{:.1f} GB'.format(memory[0] / 1024)
+        print(line)
+        total += seconds
+    print('Expected total: {}'.format(format_duration(total)))
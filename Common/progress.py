@@ -0,0 +1,227 @@
+"""
+Progress events for long running stages, with their throughput and expected time left.
+
+The reporter is the call_back passed to PolyglotDB and to the scripts' own loops, and
+follows PolyglotDB's conventions: call_back('message') says what is being done,
+call_back(0, total) sets the number of items to process and call_back(done) the
+number processed so far.  Every call becomes an event carrying the corpus, the stage
+(the benchmark task running), the done and total counts, the rate in items per second
+and the expected time left, and is passed to each sink:
+
+* TerminalSink prints messages and a progress bar, redrawn in place on a terminal and
+  printed every few seconds otherwise (e.g. in batch run logs)
+* JsonLinesSink appends the events to a JSON lines file
+* HttpSink serves the latest event of each stage as JSON on a local port
+
+Count updates are sent to the sinks at most once per interval, so loops can report
+every item.
+"""
+import sys
+import json
+import time
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import telemetry
+
+
+def format_seconds(seconds):
+    seconds = int(round(seconds))
+    return '{}:{:02d}:{:02d}'.format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def describe(event, width=30):
+    parts = [event['stage'] or event['corpus'] or 'progress']
+    if event['total']:
+        filled = int(width * min(event['done'], event['total']) / event['total'])
+        parts.append('[{}{}] {}/{} ({:.0%})'.format('#' * filled, '-' * (width - filled), event['done'],
+                                                     event['total'], event['done'] / event['total']))
+    else:
+        parts.append('{} done'.format(event['done']))
+    if event['rate']:
+        parts.append('{:.2f}/s'.format(event['rate']))
+    if event['eta'] is not None:
+        parts.append('ETA {}'.format(format_seconds(event['eta'])))
+    return ' '.join(parts)
+
+
+class TerminalSink(object):
+    def __init__(self, stream=None, interval=10):
+        self.stream = stream or sys.stdout
+        self.interactive = self.stream.isatty()
+        self.interval = interval  # seconds between progress lines when not writing to a terminal
+        self.last_line = 0
+        self.bar_shown = False
+
+    def end_bar(self):
+        if self.bar_shown:
+            self.stream.write('\n')
+            self.bar_shown = False
+
+    def handle(self, event):
+        counting = event['total'] and event['done'] < event['total']
+        if event['event'] == 'message' and not (self.interactive and counting):
+            self.end_bar()
+            print(event['message'], file=self.stream)
+        elif event['event'] in ('message', 'progress'):
+            line = describe(event)
+            if self.interactive:
+                if event['message'] and counting:
+                    line += ' {}'.format(event['message'])
+                self.stream.write('\r\033[K' + line)
+                self.bar_shown = True
+                if not counting:
+                    self.end_bar()
+            elif event['event'] == 'progress' and (not counting or time.time() - self.last_line >= self.interval):
+                self.last_line = time.time()
+                print(line, file=self.stream)
+        else:
+            self.end_bar()
+        self.stream.flush()
+
+    def close(self):
+        self.end_bar()
+
+
+class JsonLinesSink(object):
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a', encoding='utf8')
+
+    def handle(self, event):
+        self.file.write(json.dumps(event, sort_keys=True) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class HttpSink(object):
+    """
+    Serves {"current": latest event, "stages": {stage: latest event}} as JSON at http://host:port/.
+    """
+    def __init__(self, port, host='127.0.0.1'):
+        self.latest = {'current': None, 'stages': {}}
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(sink.latest, sort_keys=True).encode('utf8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer((host, port), Handler)
+        self.url = 'http://{}:{}/'.format(host, self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def handle(self, event):
+        self.latest = {'current': event, 'stages': dict(self.latest['stages'], **{str(event['stage']): event})}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Progress(object):
+    def __init__(self, sinks=None, interval=1):
+        self.sinks = list(sinks or [])
+        self.interval = interval
+        self.lock = threading.Lock()  # partitioned exports report from several threads
+        self.corpus = self.stage_name = None
+        self.stage_begin = time.time()
+        self.reset_counts()
+
+    def reset_counts(self, total=None):
+        self.done = 0
+        self.total = total
+        self.count_begin = time.time()
+        self.last_event = 0
+        self.message_text = None
+
+    def __call__(self, *args):
+        with self.lock:
+            if args and isinstance(args[0], str):
+                self.message_text = ' '.join(x for x in args if isinstance(x, str))
+                self.emit('message')
+            elif len(args) == 2:
+                self.reset_counts(args[1])
+                self.emit('progress')
+            elif len(args) == 1 and isinstance(args[0], (int, float)):
+                self.done = args[0]
+                finished = bool(self.total) and self.done >= self.total
+                if finished or time.time() - self.last_event >= self.interval:
+                    self.emit('progress')
+
+    def message(self, *args):
+        # For callers whose counts would clash with the stage's own, e.g. the line counts of parsers
+        if args and isinstance(args[0], str):
+            self(*args)
+
+    def event(self, kind):
+        now = time.time()
+        counted = now - self.count_begin
+        rate = self.done / counted if self.done and counted > 0 else None
+        eta = None
+        if rate and self.total:
+            eta = max(self.total - self.done, 0) / rate
+        return {'event': kind, 'time': datetime.now().isoformat(timespec='seconds'), 'run_id': telemetry.run_id,
+                'corpus': self.corpus, 'stage': self.stage_name, 'message': self.message_text,
+                'done': self.done, 'total': self.total, 'elapsed': now - self.stage_begin, 'rate': rate,
+                'eta': eta}
+
+    def emit(self, kind):
+        self.last_event = time.time()
+        event = self.event(kind)
+        for sink in self.sinks:
+            sink.handle(event)
+
+    @contextmanager
+    def stage(self, corpus, name):
+        with self.lock:
+            previous = (self.corpus, self.stage_name, self.stage_begin, self.done, self.total, self.count_begin,
+                        self.message_text)
+            self.corpus, self.stage_name, self.stage_begin = corpus, name, time.time()
+            self.reset_counts()
+            self.emit('start')
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.emit('end')
+                (self.corpus, self.stage_name, self.stage_begin, self.done, self.total, self.count_begin,
+                 self.message_text) = previous
+
+    def add_sink(self, sink):
+        with self.lock:
+            self.sinks.append(sink)
+
+    def close(self):
+        with self.lock:
+            for sink in self.sinks:
+                sink.close()
+            self.sinks = []
+
+
+reporter = Progress([TerminalSink()])
+
+
+def configure(jsonl_path=None, port=None):
+    """
+    Add the JSON lines and HTTP sinks requested on the command line to the reporter.
+    """
+    if jsonl_path:
+        reporter.add_sink(JsonLinesSink(jsonl_path))
+        print('Writing progress events to {}'.format(jsonl_path))
+    if port is not None:
+        sink = HttpSink(port)
+        reporter.add_sink(sink)
+        print('Serving progress at {}'.format(sink.url))
@@ -0,0 +1,127 @@
+"""
+On-disk cache of query results, for exports and reports rerun on an unchanged corpus.
+
+Results are stored as compressed pickles of their columns and rows, keyed by a
+fingerprint of the query (its Cypher statement and parameters, i.e. its filters and
+columns) and the version of the corpus.  The version is a hash of the corpus hierarchy
+and of the pipeline state of every stage that writes to the corpus, so it changes
+with any import, enrichment or analysis, after which earlier results are no longer
+found.  The least recently used results are evicted once the cache grows past its size
+limit.  Hits and misses are counted in stats.json.
+"""
+import os
+import gzip
+import json
+import pickle
+import hashlib
+import threading
+
+
+class CachedResults(object):
+    """
+    Query results read back from the cache, iterated over as dictionaries like PolyglotDB records.
+    """
+    def __init__(self, columns, rows):
+        self.columns = columns
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, key):
+        return dict(zip(self.columns, self.rows[key]))
+
+    def __iter__(self):
+        for row in self.rows:
+            yield dict(zip(self.columns, row))
+
+
+def corpus_version(c, pipeline_state_path):
+    h = hashlib.sha1(json.dumps(c.hierarchy.to_json(), sort_keys=True).encode('utf8'))
+    if os.path.exists(pipeline_state_path):
+        with open(pipeline_state_path, 'r', encoding='utf8') as f:
+            state = json.load(f)
+        # Stages that only read from the corpus (exports and reports) don't change its version
+        state = {k: v for k, v in state.items() if not (isinstance(v, dict) and v.get('read_only'))}
+        h.update(json.dumps(state, sort_keys=True).encode('utf8'))
+    return h.hexdigest()
+
+
+def query_fingerprint(q):
+    statement = json.dumps([q.cypher(), q.cypher_params()], sort_keys=True, default=str)
+    return hashlib.sha1(statement.encode('utf8')).hexdigest()
+
+
+class QueryCache(object):
+    def __init__(self, directory, version, max_bytes=None):
+        self.directory = directory
+        self.version = version
+        self.max_bytes = max_bytes
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()  # partitioned exports run queries from several threads
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, q):
+        return os.path.join(self.directory, '{}_{}.pkl.gz'.format(query_fingerprint(q), self.version[:16]))
+
+    def results(self, q):
+        """
+        Returns the results of the query, running it only if they are not cached for this version of the corpus.
+        """
+        path = self.path(q)
+        if os.path.exists(path):
+            with gzip.open(path, 'rb') as f:
+                columns, rows = pickle.load(f)
+            os.utime(path)  # mark as recently used
+            self.save_stats(hits=1)
+            return CachedResults(columns, rows)
+        results = q.all()
+        columns = list(results.columns)
+        rows = [tuple(r[x] for x in columns) for r in results]
+        with gzip.open(path + '.tmp', 'wb', compresslevel=1) as f:
+            pickle.dump((columns, rows), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+        self.save_stats(misses=1)
+        with self.lock:
+            self.enforce_limit()
+        return CachedResults(columns, rows)
+
+    def stats_path(self):
+        return os.path.join(self.directory, 'stats.json')
+
+    def load_stats(self):
+        if not os.path.exists(self.stats_path()):
+            return {'hits': 0, 'misses': 0}
+        with open(self.stats_path(), 'r', encoding='utf8') as f:
+            return json.load(f)
+
+    def save_stats(self, hits=0, misses=0):
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+            stats = self.load_stats()
+            stats['hits'] += hits
+            stats['misses'] += misses
+            with open(self.stats_path(), 'w', encoding='utf8') as f:
+                json.dump(stats, f)
+
+    def report(self):
+        stats = self.load_stats()
+        total = stats['hits'] + stats['misses']
+        print('Query cache: {} hits and {} misses this run, {:.0%} hit rate over {} queries overall.'.format(
+            self.hits, self.misses, stats['hits'] / total if total else 0, total))
+
+    def enforce_limit(self):
+        if self.max_bytes is None:
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl.gz'):
+                path = os.path.join(self.directory, name)
+                entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+        total = sum(x[1] for x in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
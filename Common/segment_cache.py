@@ -0,0 +1,119 @@
+"""
+Persistent on-disk store of token audio, so repeated analyses don't decode the long source files again.
+
+Every source sound file gets a shard: a float32 .npy array with the samples of all of
+its cached tokens concatenated, read back memory-mapped so that slicing a token is
+zero-copy, and a .json index mapping phone ids to their position in the array.  The
+index records the size and modification time of the source file, and a shard is
+rebuilt when they change.  Shards are evicted least recently used first once the
+store grows past its size limit.
+"""
+import os
+import json
+import hashlib
+
+import numpy as np
+
+import sibilant_measures
+
+
+class ShardReader(object):
+    def __init__(self, data, index):
+        self.data = data
+        self.index = index
+        self.sr = index['sampling_rate']
+
+    def read(self, token_id, begin, end):
+        """
+        Return a view of the samples between begin and end (absolute times) of a cached token.
+        """
+        offset, length, first_sample = self.index['tokens'][token_id][:3]
+        start = max(int(round(begin * self.sr)) - first_sample, 0)
+        stop = min(int(round(end * self.sr)) - first_sample, length)
+        if stop <= start:
+            return np.zeros(0, dtype=self.data.dtype), self.sr
+        return self.data[offset + start:offset + stop], self.sr
+
+
+class SegmentCache(object):
+    def __init__(self, directory, max_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def shard_paths(self, source_path):
+        key = hashlib.sha1(os.path.abspath(source_path).encode('utf8')).hexdigest()
+        return os.path.join(self.directory, key + '.npy'), os.path.join(self.directory, key + '.json')
+
+    def load_index(self, source_path):
+        data_path, index_path = self.shard_paths(source_path)
+        if not os.path.exists(index_path) or not os.path.exists(data_path):
+            return None
+        with open(index_path, 'r', encoding='utf8') as f:
+            index = json.load(f)
+        st = os.stat(source_path)
+        if index['source_size'] != st.st_size or index['source_mtime'] != st.st_mtime:
+            return None
+        return index
+
+    def build(self, source_path, tokens):
+        """
+        Decode the (id, begin, end, channel) tokens from the source file and write them as a new shard.
+        """
+        data_path, index_path = self.shard_paths(source_path)
+        st = os.stat(source_path)
+        index = {'source': os.path.abspath(source_path), 'source_size': st.st_size, 'source_mtime': st.st_mtime,
+                 'sampling_rate': None, 'tokens': {}}
+        arrays = []
+        offset = 0
+        for token_id, begin, end, channel in tokens:
+            signal, sr = sibilant_measures.read_segment(source_path, begin, end, channel)
+            index['sampling_rate'] = sr
+            index['tokens'][token_id] = [offset, len(signal), int(round(begin * sr)), begin, end, channel]
+            arrays.append(signal.astype(np.float32))
+            offset += len(signal)
+        data = np.concatenate(arrays) if arrays else np.zeros(0, dtype=np.float32)
+        # Write to temporary files first so an interrupted build never leaves a corrupt shard
+        np.save(data_path + '.tmp.npy', data)
+        os.replace(data_path + '.tmp.npy', data_path)
+        with open(index_path + '.tmp', 'w', encoding='utf8') as f:
+            json.dump(index, f)
+        os.replace(index_path + '.tmp', index_path)
+        return index
+
+    def open(self, source_path, tokens):
+        """
+        Get a reader for the (id, begin, end, channel) tokens of a source file, adding them to the store if needed.
+        """
+        index = self.load_index(source_path)
+        if index is None or any(t[0] not in index['tokens'] for t in tokens):
+            if index is not None:
+                # Keep the tokens already cached alongside the new ones
+                requested = set(t[0] for t in tokens)
+                tokens = list(tokens) + [(k, v[3], v[4], v[5]) for k, v in index['tokens'].items()
+                                         if k not in requested]
+            index = self.build(source_path, tokens)
+        data_path, _ = self.shard_paths(source_path)
+        os.utime(data_path)  # mark as recently used
+        return ShardReader(np.load(data_path, mmap_mode='r'), index)
+
+    def size(self):
+        return sum(os.path.getsize(os.path.join(self.directory, x)) for x in os.listdir(self.directory))
+
+    def enforce_limit(self):
+        if self.max_bytes is None:
+            return
+        shards = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npy'):
+                path = os.path.join(self.directory, name)
+                shards.append((os.path.getmtime(path), path))
+        total = self.size()
+        for _, path in sorted(shards):
+            if total <= self.max_bytes:
+                break
+            index_path = path[:-4] + '.json'
+            for p in (path, index_path):
+                if os.path.exists(p):
+                    total -= os.path.getsize(p)
+                    os.remove(p)
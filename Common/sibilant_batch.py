@@ -0,0 +1,61 @@
+"""
+Runs sibilant_jane_batch.praat once per sound file instead of once per token.
+"""
+import os
+import csv
+import subprocess
+import tempfile
+
+import sibilant_measures
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+batch_script_path = os.path.join(base_dir, 'Common', 'sibilant_jane_batch.praat')
+
+
+def group_by_file(tokens):
+    groups = {}
+    for token_id, path, begin, end, channel in tokens:
+        groups.setdefault(path, []).append((token_id, begin, end, channel))
+    return groups
+
+
+def write_token_table(path, tokens):
+    # Read by the batch script with Read Table from tab-separated file
+    with open(path, 'w', encoding='utf8', newline='') as f:
+        writer = csv.writer(f, delimiter='\t')
+        writer.writerow(['id', 'begin', 'end', 'channel'])
+        writer.writerows(tokens)
+
+
+def analyze_file(praat_path, file_path, tokens):
+    """
+    Measure all (id, begin, end, channel) tokens of one sound file with a single Praat process.
+
+    Returns a dictionary mapping token ids to dictionaries of measures.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        token_table = os.path.join(temp_dir, 'tokens.tsv')
+        output_table = os.path.join(temp_dir, 'output.tsv')
+        write_token_table(token_table, tokens)
+        subprocess.run([praat_path, '--run', batch_script_path, file_path, token_table, output_table],
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        return parse_output(output_table)
+
+
+def parse_output(path):
+    output = {}
+    with open(path, 'r', encoding='utf8') as f:
+        reader = csv.DictReader(f, delimiter='\t')
+        for line in reader:
+            try:
+                output[line['id']] = {m: float(line[m]) for m in sibilant_measures.measures}
+            except ValueError:  # Praat writes --undefined-- for unmeasurable tokens
+                continue
+    return output
+
+
+def analyze_tokens(praat_path, tokens):
+    output = {}
+    for file_path, file_tokens in group_by_file(tokens).items():
+        output.update(analyze_file(praat_path, file_path, file_tokens))
+    return output
@@ -0,0 +1,175 @@
+"""
+NumPy port of the measurements taken by sibilant_jane_optimized.praat.
+
+For every token the middle 25-75% of the segment is extracted, filtered with a
+1000-11000 Hz Hann pass band (100 Hz smoothing), and the centre of gravity,
+spectral spread, LTAS peak frequency and LTAS slope (0-1000 Hz vs 1000-4000 Hz,
+energy averaging) are computed, exactly as the Praat script does.  Tokens are
+processed in batches: all tokens sharing a sampling rate and FFT size are
+stacked and transformed with a single vectorized FFT.
+
+Tolerance against the Praat script: the spectral computations follow Praat's
+own definitions (power-of-two FFT, Hann band edges, power 2 moments, 1-to-1
+LTAS, parabolic peak interpolation), so differences only come from which
+samples fall at the edges of the extracted window.  Expect cog and spread to
+agree within 0.5%, peak within one spectral bin (sampling rate / FFT size) and
+slope within 0.5 dB (praat_tolerance, checked by tests/test_sibilant_measures.py).
+"""
+import wave
+
+import numpy as np
+
+from_percent = 0.25
+to_percent = 0.75
+filter_low = 1000
+filter_high = 11000
+filter_smoothing = 100
+slope_low_band = (0, 1000)
+slope_high_band = (1000, 4000)
+
+measures = ['cog', 'peak', 'slope', 'spread']
+
+# Agreement with the Praat script (see above): relative for cog and spread, spectral bins for peak, dB for slope
+praat_tolerance = {'cog': 0.005, 'spread': 0.005, 'peak': 1, 'slope': 0.5}
+
+
+def read_segment(path, begin, end, channel=0):
+    with wave.open(path, 'rb') as f:
+        sr = f.getframerate()
+        num_channels = f.getnchannels()
+        width = f.getsampwidth()
+        start = max(int(round(begin * sr)), 0)
+        stop = min(int(round(end * sr)), f.getnframes())
+        if stop <= start:
+            return np.zeros(0), sr
+        f.setpos(start)
+        raw = f.readframes(stop - start)
+    if width == 1:
+        data = (np.frombuffer(raw, dtype=np.uint8).astype(np.float64) - 128) / 128
+    elif width == 3:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        data = (b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16))
+        data = np.where(data >= 2 ** 23, data - 2 ** 24, data) / 2 ** 23
+    else:
+        dtype = {2: np.int16, 4: np.int32}[width]
+        data = np.frombuffer(raw, dtype=dtype).astype(np.float64) / 2 ** (8 * width - 1)
+    return data.reshape(-1, num_channels)[:, channel], sr
+
+
+def measure_window(begin, end):
+    duration = end - begin
+    return begin + duration * from_percent, begin + duration * to_percent
+
+
+def next_power_of_two(n):
+    return 1 << max(int(n) - 1, 0).bit_length()
+
+
+def hann_band(frequencies, nyquist, low=filter_low, high=filter_high, smoothing=filter_smoothing):
+    # Same transfer function as Praat's Spectrum_passHannBand
+    f1, f2, f3, f4 = low - smoothing, low + smoothing, high - smoothing, high + smoothing
+    half_pi_by_smooth = np.pi / (2 * smoothing)
+    gain = np.ones_like(frequencies)
+    gain[(frequencies < f1) | (frequencies > f4)] = 0
+    rising = (frequencies >= f1) & (frequencies < f2)
+    gain[rising] = 0.5 - 0.5 * np.cos(half_pi_by_smooth * (frequencies[rising] - f1))
+    if high < nyquist:
+        falling = (frequencies > f3) & (frequencies <= f4)
+        gain[falling] = 0.5 + 0.5 * np.cos(half_pi_by_smooth * (frequencies[falling] - f3))
+    return gain
+
+
+def band_mean_energy(energy, frequencies, band):
+    mask = (frequencies >= band[0]) & (frequencies <= band[1])
+    return energy[:, mask].mean(axis=1)
+
+
+def measure_batch(signals, sr):
+    """
+    Compute the four sibilant measures for signals sharing a sampling rate.
+
+    Returns an array of shape (len(signals), 4) ordered as ``measures``.
+    """
+    lengths = np.array([len(x) for x in signals])
+    nfft = next_power_of_two(lengths.max())
+    frames = np.zeros((len(signals), nfft))
+    for i, x in enumerate(signals):
+        frames[i, :len(x)] = x
+    frequencies = np.fft.rfftfreq(nfft, 1 / sr)
+
+    # Filter (pass Hann band)...: filter in the frequency domain, then truncate back to the token length
+    spectrum = np.fft.rfft(frames, axis=1) * hann_band(frequencies, sr / 2)
+    filtered = np.fft.irfft(spectrum, nfft, axis=1)
+    filtered[np.arange(nfft)[None, :] >= lengths[:, None]] = 0
+
+    # To Spectrum... yes
+    spectrum = np.fft.rfft(filtered, axis=1) / sr
+    energy = spectrum.real ** 2 + spectrum.imag ** 2
+    total = energy.sum(axis=1)
+    total[total == 0] = np.nan
+    cog = (energy * frequencies).sum(axis=1) / total
+    spread = np.sqrt((energy * (frequencies[None, :] - cog[:, None]) ** 2).sum(axis=1) / total)
+
+    # To Ltas (1-to-1), Get frequency of maximum... 0 0 Parabolic
+    ltas = 10 * np.log10(np.maximum(2 * energy, 1e-300) / 4e-10)
+    rows = np.arange(len(signals))
+    peak_index = ltas.argmax(axis=1)
+    inner = (peak_index > 0) & (peak_index < ltas.shape[1] - 1)
+    left = ltas[rows, np.clip(peak_index - 1, 0, None)]
+    centre = ltas[rows, peak_index]
+    right = ltas[rows, np.clip(peak_index + 1, None, ltas.shape[1] - 1)]
+    curvature = left - 2 * centre + right
+    offset = np.zeros(len(signals))
+    refine = inner & (curvature != 0)
+    offset[refine] = 0.5 * (left[refine] - right[refine]) / curvature[refine]
+    peak = (peak_index + offset) * (sr / nfft)
+
+    # Get slope... 0 1000 1000 4000 energy
+    ltas_energy = 10 ** (ltas / 10)
+    slope = 10 * np.log10(band_mean_energy(ltas_energy, frequencies, slope_high_band) /
+                          band_mean_energy(ltas_energy, frequencies, slope_low_band))
+    return np.column_stack([cog, peak, slope, spread])
+
+
+def analyze_tokens(tokens, batch_size=512, cache=None):
+    """
+    Measure sibilant tokens given as (id, file_path, begin, end, channel) tuples.
+
+    Token audio is read from the source files, or through ``cache`` (a segment_cache.SegmentCache)
+    if given.  Returns a dictionary mapping token ids to dictionaries of measures, skipping
+    tokens too short to measure.
+    """
+    by_file = {}
+    for token_id, path, begin, end, channel in tokens:
+        by_file.setdefault(path, []).append((token_id, begin, end, channel))
+    batches = {}
+    output = {}
+    for path, file_tokens in by_file.items():
+        reader = cache.open(path, file_tokens) if cache is not None else None
+        for token_id, begin, end, channel in file_tokens:
+            window_begin, window_end = measure_window(begin, end)
+            if reader is not None:
+                signal, sr = reader.read(token_id, window_begin, window_end)
+            else:
+                signal, sr = read_segment(path, window_begin, window_end, channel=channel)
+            if len(signal) < 2:
+                continue
+            key = (sr, next_power_of_two(len(signal)))
+            batch = batches.setdefault(key, [])
+            batch.append((token_id, signal))
+            if len(batch) >= batch_size:
+                output.update(flush_batch(batch, sr))
+                del batches[key]
+    for (sr, _), batch in batches.items():
+        output.update(flush_batch(batch, sr))
+    return output
+
+
+def flush_batch(batch, sr):
+    values = measure_batch([x[1] for x in batch], sr)
+    output = {}
+    for (token_id, _), row in zip(batch, values):
+        if np.isnan(row).any():
+            continue
+        output[token_id] = {m: round(float(v), 4) for m, v in zip(measures, row)}
+    return output
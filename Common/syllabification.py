@@ -0,0 +1,272 @@
+"""
+Maximal onset syllabification done once per distinct transcription instead of once per word token.
+
+CorpusContext.encode_syllables('maxonset') finds the onsets of the corpus with one
+query per discourse and then syllabifies every word token.  The syllabification of a
+word only depends on its phones, the syllabic segments and the set of onsets, so here
+each distinct transcription is syllabified once and the result applied to every token
+with that transcription.  The onsets (the phones before the first syllabic of a word)
+are also found from the distinct transcriptions.
+
+Syllabifications are kept in cache/syllabification, in one file per set of syllabics and
+onsets, so corpora that share an inventory and onsets (e.g. those transcribed with the
+same dictionary) reuse each other's results.  The syllables are loaded with PolyglotDB's
+bulk syllable CSV import, with the same ids, labels and onset/nucleus/coda links as
+encode_syllables.
+
+Syllables can be added to some discourses only, e.g. newly imported ones, as long as
+their words have no onsets that the rest of the corpus lacks; otherwise the
+syllabification of the other discourses would change too.
+
+The labels of the onset, nucleus and coda phones of every syllable can also be stored
+on the syllable itself (onset_labels, nucleus_labels and coda_labels), so exports read
+them as plain properties instead of running a subquery per syllable and position.
+"""
+import os
+import json
+import hashlib
+from uuid import uuid1
+
+from polyglotdb.io.helper import make_type_id
+from polyglotdb.io.importer import (create_syllabic_csvs, create_nonsyllabic_csvs, syllables_data_to_csvs,
+                                    nonsyls_data_to_csvs, import_syllable_csv, import_nonsyl_csv)
+from polyglotdb.syllabification.maxonset import split_nonsyllabic_maxonset, split_ons_coda_maxonset
+
+from fused_enrichment import write_properties
+
+syllable_positions = ['onset', 'nucleus', 'coda']
+
+
+def distinct_transcriptions(c, discourse):
+    statement = '''MATCH (w:{word}:{corpus}:speech)-[:spoken_in]->(d:Discourse:{corpus})
+    WHERE d.name = $discourse
+    MATCH (p:{phone}:{corpus})-[:contained_by]->(w)
+    WITH w, p ORDER BY p.begin
+    WITH w, collect(p.label) AS phones
+    RETURN DISTINCT phones'''.format(word=c.word_name, phone=c.phone_name, corpus=c.cypher_safe_name)
+    return [tuple(r['phones']) for r in c.execute_cypher(statement, discourse=discourse)]
+
+
+def word_tokens(c, discourse):
+    statement = '''MATCH (w:{word}:{corpus}:speech)-[:spoken_in]->(d:Discourse:{corpus}),
+    (w)-[:spoken_by]->(s:Speaker:{corpus})
+    WHERE d.name = $discourse
+    OPTIONAL MATCH (p:{phone}:{corpus})-[:contained_by]->(w)
+    WITH s, w, p ORDER BY p.begin
+    WITH s, w, collect(p) AS ps
+    RETURN s.name AS speaker, w.label AS label, w.begin AS begin, w.end AS end,
+    [x IN ps | x.id] AS phone_ids, [x IN ps | x.label] AS phones,
+    [x IN ps | x.begin] AS begins, [x IN ps | x.end] AS ends
+    ORDER BY w.begin'''.format(word=c.word_name, phone=c.phone_name, corpus=c.cypher_safe_name)
+    return c.execute_cypher(statement, discourse=discourse)
+
+
+def find_onsets(transcriptions, syllabics):
+    onsets = set()
+    for phones in transcriptions:
+        for i, x in enumerate(phones):
+            if x in syllabics:
+                onsets.add(tuple(phones[:i]))
+                break
+    return onsets
+
+
+def syllabify(phones, syllabics, onsets):
+    """
+    Maximal onset syllabification of one transcription, following CorpusContext.encode_syllables.
+
+    Returns ['nonsyllabic', break, label] for transcriptions without syllabics, otherwise ['syllables', rows], with
+    a [begin, vowel, end, onset, coda, label] row of phone indices per syllable (onset and coda are None when absent).
+    """
+    vowels = [i for i, x in enumerate(phones) if x in syllabics]
+    if not vowels:
+        return ['nonsyllabic', split_nonsyllabic_maxonset(phones, onsets), '.'.join(phones)]
+    rows = []
+    for j, i in enumerate(vowels):
+        if j == 0:
+            begin, onset = 0, (0 if i != 0 else None)
+        else:
+            split = split_ons_coda_maxonset(phones[vowels[j - 1] + 1:i], onsets)
+            if split is None:
+                begin, onset = i, None
+            else:
+                begin = onset = vowels[j - 1] + 1 + split
+        if j == len(vowels) - 1:
+            end, coda = len(phones) - 1, (len(phones) - 1 if i != len(phones) - 1 else None)
+        else:
+            split = split_ons_coda_maxonset(phones[i + 1:vowels[j + 1]], onsets)
+            if split is None:
+                end, coda = i, None
+            else:
+                end = coda = i + split
+        rows.append([begin, i, end, onset, coda, '.'.join(phones[begin:end + 1])])
+    return ['syllables', rows]
+
+
+class SyllabificationCache(object):
+    """
+    Syllabifications of transcriptions for one set of syllabics and onsets, persisted as JSON.
+    """
+    def __init__(self, directory, syllabics, onsets):
+        key = json.dumps([sorted(syllabics), sorted(onsets)])
+        self.path = os.path.join(directory, '{}.json'.format(hashlib.sha1(key.encode('utf8')).hexdigest()))
+        self.syllabics = set(syllabics)
+        self.onsets = onsets
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf8') as f:
+                self.entries = {tuple(k): v for k, v in json.load(f)}
+        self.hits = self.misses = 0
+        self.changed = False
+
+    def get(self, phones):
+        result = self.entries.get(phones)
+        if result is None:
+            result = self.entries[phones] = syllabify(phones, self.syllabics, self.onsets)
+            self.misses += 1
+            self.changed = True
+        else:
+            self.hits += 1
+        return result
+
+    def save(self):
+        if not self.changed:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + '.tmp', 'w', encoding='utf8') as f:
+            json.dump([[list(k), v] for k, v in self.entries.items()], f)
+        os.replace(self.path + '.tmp', self.path)
+
+
+def token_rows(c, discourse, cache, type_ids):
+    """
+    Returns dictionaries of speaker -> syllable rows and speaker -> nonsyllabic rows for the words of a discourse.
+    """
+    syllables, non_syllables = {}, {}
+    prev_ids = {}
+    for w in word_tokens(c, discourse):
+        if not w['phone_ids']:
+            print('The word {} in file {} ({} to {}) did not have any phones.'.format(w['label'], discourse,
+                                                                                     w['begin'], w['end']))
+            continue
+        s = w['speaker']
+        ids, begins, ends = w['phone_ids'], w['begins'], w['ends']
+        kind, *result = cache.get(tuple(w['phones']))
+        if kind == 'nonsyllabic':
+            split, label = result
+            rows = [{'id': uuid1(), 'onset_id': ids[0], 'break': split, 'coda_id': ids[-1],
+                     'begin': begins[0], 'end': ends[-1], 'label': label}]
+            non_syllables.setdefault(s, []).extend(rows)
+        else:
+            rows = [{'id': uuid1(), 'vowel_id': ids[vowel],
+                     'onset_id': ids[onset] if onset is not None else None,
+                     'coda_id': ids[coda] if coda is not None else None,
+                     'begin': begins[begin], 'end': ends[end], 'label': label}
+                    for begin, vowel, end, onset, coda, label in result[0]]
+            syllables.setdefault(s, []).extend(rows)
+        for row in rows:
+            if row['label'] not in type_ids:
+                type_ids[row['label']] = make_type_id([row['label']], c.corpus_name)
+            row['type_id'] = type_ids[row['label']]
+            row['prev_id'] = prev_ids.get(s)
+            prev_ids[s] = row['id']
+    return syllables, non_syllables
+
+
+def encode_syllables(c, syllabics, cache_dir, call_back=None, discourses=None):
+    """
+    Encode maxonset syllables for every word in the corpus, syllabifying each distinct transcription once.
+
+    The syllabic segments must already be encoded (encode_syllabic_segments).  With discourses, syllables are
+    only added to those discourses, which must not have any yet.  Returns False without encoding anything when
+    their words add onsets to the rest of the corpus.
+    """
+    syllabics = set(syllabics)
+    by_discourse = {d: distinct_transcriptions(c, d) for d in c.discourses}
+    transcriptions = set(x for v in by_discourse.values() for x in v)
+    onsets = find_onsets(transcriptions, syllabics)
+    if discourses is None:
+        c.reset_syllables()
+        discourses = c.discourses
+    elif onsets != find_onsets(set(x for d, v in by_discourse.items() if d not in discourses for x in v),
+                               syllabics):
+        return False
+    print('Onsets found by max onset: {}'.format(sorted(onsets)))
+    cache = SyllabificationCache(cache_dir, syllabics, onsets)
+    create_syllabic_csvs(c)
+    create_nonsyllabic_csvs(c)
+    type_ids = {}
+    if call_back is not None:
+        call_back(0, len(discourses))
+    for i, d in enumerate(discourses):
+        if call_back is not None:
+            call_back('Syllabifying discourse {} of {} ({})...'.format(i + 1, len(discourses), d))
+        syllables, non_syllables = token_rows(c, d, cache, type_ids)
+        for s, rows in syllables.items():
+            syllables_data_to_csvs(c, s, d, rows)
+        for s, rows in non_syllables.items():
+            nonsyls_data_to_csvs(c, s, d, rows)
+        if call_back is not None:
+            call_back(i + 1)
+    cache.save()
+    print('Syllabified {} word tokens from {} distinct transcriptions, {} of them cached by earlier runs.'.format(
+        cache.hits + cache.misses, len(transcriptions), len(transcriptions) - cache.misses))
+    import_syllable_csv(c, call_back)
+    import_nonsyl_csv(c, call_back)
+    c.execute_cypher('''MATCH (n:{corpus}:syllable) WHERE n.prev_id IS NOT NULL
+    REMOVE n.prev_id'''.format(corpus=c.cypher_safe_name))
+    c.hierarchy.add_annotation_type('syllable', above=c.phone_name, below=c.word_name)
+    c.hierarchy.add_token_subsets(c, c.phone_name, ['onset', 'coda', 'nucleus'])
+    c.hierarchy.add_token_properties(c, c.phone_name, [('syllable_position', str)])
+    c.encode_hierarchy()
+    return True
+
+
+def syllable_phones(c, discourse):
+    statement = '''MATCH (s:syllable:{corpus})-[:spoken_in]->(d:Discourse:{corpus})
+    WHERE d.name = $discourse
+    MATCH (p:{phone}:{corpus})-[:contained_by]->(s)
+    WITH s, p ORDER BY p.begin
+    RETURN s.id AS id, collect(p.syllable_position) AS positions, collect(p.label) AS labels'''.format(
+        phone=c.phone_name, corpus=c.cypher_safe_name)
+    return c.execute_cypher(statement, discourse=discourse)
+
+
+def encode_syllable_structure(c, call_back=None, discourses=None):
+    """
+    Store the labels of each syllable's onset, nucleus and coda phones (in order) as syllable properties.
+    """
+    if discourses is None:
+        discourses = c.discourses
+    if call_back is not None:
+        call_back(0, len(discourses))
+    for i, d in enumerate(discourses):
+        if call_back is not None:
+            call_back('Encoding syllable structure for discourse {} of {} ({})...'.format(i + 1, len(discourses), d))
+        values = {}
+        for r in syllable_phones(c, d):
+            props = {'{}_labels'.format(x): [] for x in syllable_positions}
+            for position, label in zip(r['positions'], r['labels']):
+                if position in syllable_positions:
+                    props['{}_labels'.format(position)].append(label)
+            values[r['id']] = props
+        write_properties(c, 'syllable', values)
+        if call_back is not None:
+            call_back(i + 1)
+    c.hierarchy.add_token_properties(c, 'syllable', [('{}_labels'.format(x), list) for x in syllable_positions])
+    c.encode_hierarchy()
+
+
+def encode_new_stress_from_word_property(c, property_name):
+    """
+    Set the stress of syllables that have none from a word property like "0-1-0", as
+    CorpusContext.encode_stress_from_word_property does, e.g. for the syllables of newly imported discourses.
+    """
+    statement = '''MATCH (s:syllable:{corpus}:speech)-[:contained_by]->(w:{word}:{corpus}:speech),
+    (w)-[:is_a]->(wt:{word}_type:{corpus})
+    WHERE s.stress IS NULL AND wt.{name} IS NOT NULL
+    WITH s, w, split(wt.{name}, '-') AS stresses
+    WHERE size(stresses) = w.num_syllables
+    SET s.stress = stresses[s.position_in_word - 1]'''.format(word=c.word_name, corpus=c.cypher_safe_name,
+                                                             name=property_name)
+    c.execute_cypher(statement)
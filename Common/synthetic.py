@@ -0,0 +1,178 @@
+"""
+Generator for synthetic MFA-style corpora (TextGrid + WAV per recording) used for benchmarking.
+
+Vowels are synthesized as an impulse train passed through a cascade of resonators
+with known formant frequencies and bandwidths, and sibilants as noise with a known
+spectral peak, so measurements can be checked against the ground truth written to
+truth.csv alongside the corpus.
+"""
+import os
+import csv
+import wave
+
+import numpy as np
+from scipy.signal import lfilter
+
+sampling_rate = 22050
+
+# (F1, F2, F3) targets in Hz, bandwidths are fixed at (80, 100, 150) Hz
+vowel_formants = {'IY1': (280, 2250, 2900), 'IH1': (400, 1900, 2550), 'EH1': (550, 1770, 2490),
+                  'AE1': (690, 1660, 2490), 'AA1': (710, 1100, 2540), 'AH1': (620, 1200, 2550),
+                  'UW1': (310, 870, 2250), 'OW1': (450, 850, 2400)}
+vowel_bandwidths = (80, 100, 150)
+
+# Spectral peak and width in Hz of the noise for each sibilant
+sibilant_spectra = {'S': (6500, 900), 'Z': (6200, 900), 'SH': (3800, 700), 'ZH': (3600, 700)}
+
+lexicon = {'SEE': ['S', 'IY1'], 'SHOE': ['SH', 'UW1'], 'ZOO': ['Z', 'UW1'], 'BUS': ['B', 'AH1', 'S'],
+           'FISH': ['F', 'IH1', 'SH'], 'HAT': ['HH', 'AE1', 'T'], 'MEASURE': ['M', 'EH1', 'ZH', 'ER0'],
+           'DOG': ['D', 'AA1', 'G'], 'NOSE': ['N', 'OW1', 'Z'], 'SOCKS': ['S', 'AA1', 'K', 'S'],
+           'LASH': ['L', 'AE1', 'SH'], 'TEN': ['T', 'EH1', 'N'], 'BASKET': ['B', 'AE1', 'S', 'K', 'AH0', 'T']}
+
+vowel_inventory = sorted(set(x for t in lexicon.values() for x in t if x[-1].isdigit()))
+pause_label = '<SIL>'
+
+
+def resonator(signal, frequency, bandwidth, sr):
+    r = np.exp(-np.pi * bandwidth / sr)
+    theta = 2 * np.pi * frequency / sr
+    a = [1, -2 * r * np.cos(theta), r ** 2]
+    return lfilter([1 - r], a, signal)
+
+
+def synthesize_vowel(label, duration, f0, rng, sr=sampling_rate):
+    n = int(duration * sr)
+    source = np.zeros(n)
+    source[::max(int(sr / f0), 1)] = 1
+    source += rng.normal(0, 0.01, n)
+    formants = vowel_formants.get(label, (500, 1500, 2500))
+    out = source
+    for f, b in zip(formants, vowel_bandwidths):
+        out = resonator(out, f, b, sr)
+    return 0.3 * out / (np.abs(out).max() or 1)
+
+
+def shaped_noise(centre, width, duration, rng, sr=sampling_rate):
+    n = int(duration * sr)
+    spectrum = np.fft.rfft(rng.normal(0, 1, n))
+    frequencies = np.fft.rfftfreq(n, 1 / sr)
+    spectrum *= np.exp(-((frequencies - centre) / width) ** 2)
+    out = np.fft.irfft(spectrum, n)
+    return 0.2 * out / (np.abs(out).max() or 1)
+
+
+def synthesize_phone(label, duration, f0, rng, sr=sampling_rate):
+    if label in sibilant_spectra:
+        return shaped_noise(*sibilant_spectra[label], duration, rng, sr)
+    if label[-1].isdigit():
+        return synthesize_vowel(label, duration, f0, rng, sr)
+    if label in ('M', 'N', 'L'):
+        return 0.3 * synthesize_vowel(label, duration, f0, rng, sr)
+    return shaped_noise(2000, 1500, duration, rng, sr) * 0.2
+
+
+def phone_duration(label, rng):
+    if label[-1].isdigit():
+        return rng.uniform(0.08, 0.2)
+    if label in sibilant_spectra:
+        return rng.uniform(0.08, 0.15)
+    return rng.uniform(0.04, 0.08)
+
+
+def generate_recording(speaker, duration, f0, rng):
+    """
+    Generate word and phone intervals and audio for a single recording of about ``duration`` seconds.
+    """
+    words, phones, pieces, truth = [], [], [], []
+    time = 0
+    words_list = sorted(lexicon)
+    while time < duration:
+        # An utterance of a few words followed by a pause
+        for _ in range(rng.integers(2, 8)):
+            word = words_list[rng.integers(len(words_list))]
+            word_begin = time
+            for p in lexicon[word]:
+                d = round(phone_duration(p, rng), 3)
+                pieces.append((time, synthesize_phone(p, d, f0, rng)))
+                end = round(time + d, 3)
+                phones.append((time, end, p))
+                if p in vowel_formants:
+                    truth.append((speaker, p, time, end) + vowel_formants[p] + (None,))
+                elif p in sibilant_spectra:
+                    truth.append((speaker, p, time, end, None, None, None, sibilant_spectra[p][0]))
+                time = end
+            words.append((word_begin, time, word))
+        pause = round(rng.uniform(0.2, 0.6), 3)
+        pieces.append((time, rng.normal(0, 0.001, int(pause * sampling_rate))))
+        end = round(time + pause, 3)
+        words.append((time, end, pause_label))
+        phones.append((time, end, 'sil'))
+        time = end
+    # Place each phone at the sample of its interval so rounding doesn't accumulate
+    signal = np.zeros(int(round(time * sampling_rate)))
+    for begin, piece in pieces:
+        i = int(round(begin * sampling_rate))
+        piece = piece[:len(signal) - i]
+        signal[i:i + len(piece)] += piece
+    return words, phones, signal, truth
+
+
+def write_wav(path, signal, sr=sampling_rate):
+    data = (np.clip(signal, -1, 1) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sr)
+        f.writeframes(data.tobytes())
+
+
+def write_textgrid(path, speaker, words, phones, duration):
+    lines = ['File type = "ooTextFile"', 'Object class = "TextGrid"', '',
+             'xmin = 0', 'xmax = {}'.format(duration), 'tiers? <exists>', 'size = 2', 'item []:']
+    for i, (name, intervals) in enumerate([('words', words), ('phones', phones)]):
+        lines += ['    item [{}]:'.format(i + 1), '        class = "IntervalTier"',
+                  '        name = "{} - {}"'.format(speaker, name), '        xmin = 0',
+                  '        xmax = {}'.format(duration), '        intervals: size = {}'.format(len(intervals))]
+        for j, (begin, end, label) in enumerate(intervals):
+            lines += ['        intervals [{}]:'.format(j + 1), '            xmin = {}'.format(begin),
+                      '            xmax = {}'.format(end), '            text = "{}"'.format(label)]
+    with open(path, 'w', encoding='utf8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def generate_corpus(directory, num_speakers=4, minutes_per_speaker=5, recording_minutes=2.5, seed=1234):
+    """
+    Write a synthetic corpus to ``directory``, one subdirectory per speaker.
+
+    Returns the path of the speaker CSV file.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    speaker_path = os.path.join(directory, 'speaker_data.csv')
+    with open(os.path.join(directory, 'truth.csv'), 'w', encoding='utf8', newline='') as truth_file, \
+            open(speaker_path, 'w', encoding='utf8', newline='') as speaker_file:
+        truth_writer = csv.writer(truth_file)
+        truth_writer.writerow(['speaker', 'discourse', 'phone_label', 'begin', 'end', 'F1', 'F2', 'F3', 'peak'])
+        speaker_writer = csv.writer(speaker_file)
+        speaker_writer.writerow(['name', 'gender'])
+        for s in range(num_speakers):
+            speaker = 'syn{:03d}'.format(s)
+            gender = 'female' if s % 2 else 'male'
+            f0 = 210 if gender == 'female' else 120
+            speaker_writer.writerow([speaker, gender])
+            speaker_dir = os.path.join(directory, speaker)
+            os.makedirs(speaker_dir, exist_ok=True)
+            remaining = minutes_per_speaker * 60
+            r = 0
+            while remaining > 0:
+                duration = min(recording_minutes * 60, remaining)
+                discourse = '{}_{}'.format(speaker, r)
+                words, phones, signal, truth = generate_recording(speaker, duration, f0, rng)
+                total = phones[-1][1]
+                write_wav(os.path.join(speaker_dir, discourse + '.wav'), signal)
+                write_textgrid(os.path.join(speaker_dir, discourse + '.TextGrid'), speaker, words, phones, total)
+                for row in truth:
+                    truth_writer.writerow((row[0], discourse) + row[1:])
+                remaining -= duration
+                r += 1
+    return speaker_path
@@ -0,0 +1,156 @@
+"""
+Per-stage telemetry, written as JSON lines to benchmarks/telemetry.jsonl.
+
+Each record holds the wall time, CPU time (including child processes such as Praat
+and worker pools), memory use, database query count and, when the stage reports
+them, the number of tokens and seconds of audio processed along with the
+corresponding rates.
+
+Memory is recorded as stage_peak_rss_mb, the largest resident memory of the process
+and its children sampled while the stage runs (requires psutil), and
+process_max_rss_mb, the high-water mark of the process since it started, which
+includes every earlier stage.
+"""
+import os
+import json
+import time
+import uuid
+import platform
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+telemetry_path = os.path.join(base_dir, 'benchmarks', 'telemetry.jsonl')
+
+run_id = os.environ.get('SPADE_RUN_ID', uuid.uuid4().hex)
+query_count = 0
+query_count_lock = threading.Lock()  # partitioned exports run queries from several threads
+
+
+def install_query_counter(context_class):
+    # Every PolyglotDB query goes through execute_cypher, count calls to it
+    original = context_class.execute_cypher
+    if getattr(original, 'counts_queries', False):
+        return
+
+    def execute_cypher(self, *args, **kwargs):
+        global query_count
+        with query_count_lock:
+            query_count += 1
+        return original(self, *args, **kwargs)
+
+    execute_cypher.counts_queries = True
+    context_class.execute_cypher = execute_cypher
+
+
+def cpu_time():
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def process_max_rss_mb():
+    if resource is None:
+        return None
+    usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    if platform.system() == 'Darwin':  # bytes rather than kilobytes
+        return usage / (1024 * 1024)
+    return usage / 1024
+
+
+class RssSampler(object):
+    """
+    Samples the resident memory of the process and its children in a background thread, keeping the largest total.
+    """
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.peak = None
+        self.stopped = threading.Event()
+        self.thread = None
+        if psutil is not None:
+            self.process = psutil.Process()
+            self.sample()
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def sample(self):
+        total = 0
+        for p in [self.process] + self.process.children(recursive=True):
+            try:
+                total += p.memory_info().rss
+            except psutil.Error:  # the child exited in the meantime
+                continue
+        self.peak = max(self.peak or 0, total)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        """
+        Returns the peak in megabytes, or None without psutil.
+        """
+        if self.thread is None:
+            return None
+        self.stopped.set()
+        self.thread.join()
+        self.sample()
+        return self.peak / (1024 * 1024)
+
+
+def rate(amount, seconds):
+    if amount is None or not seconds:
+        return None
+    return amount / seconds
+
+
+@contextmanager
+def stage(corpus_name, name):
+    """
+    Measure a stage; the caller may set ``tokens`` and ``audio_seconds`` on the yielded record.
+    """
+    record = {'run_id': run_id, 'computer': platform.node(), 'corpus': corpus_name, 'stage': name,
+              'start': datetime.now().isoformat(timespec='seconds'), 'tokens': None, 'audio_seconds': None}
+    wall_begin = time.time()
+    cpu_begin = cpu_time()
+    queries_begin = query_count
+    sampler = RssSampler()
+    try:
+        yield record
+    finally:
+        record['stage_peak_rss_mb'] = sampler.stop()
+    record['wall_time'] = time.time() - wall_begin
+    record['cpu_time'] = cpu_time() - cpu_begin
+    record['process_max_rss_mb'] = process_max_rss_mb()
+    record['queries'] = query_count - queries_begin
+    record['tokens_per_second'] = rate(record['tokens'], record['wall_time'])
+    record['audio_seconds_per_second'] = rate(record['audio_seconds'], record['wall_time'])
+
+
+def write_record(record):
+    os.makedirs(os.path.dirname(telemetry_path), exist_ok=True)
+    with open(telemetry_path, 'a', encoding='utf8') as f:
+        f.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def load_records(path=telemetry_path):
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, 'r', encoding='utf8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
@@ -0,0 +1,144 @@
+"""
+Utterance encoding from the word tiers saved at import, instead of pause path queries in the database.
+
+At import, the words of every discourse (id, label, begin, end, speaker) are saved to a
+.npz table.  Utterance boundaries are then found with NumPy for each speaker: two
+consecutive speech words are in different utterances when at least one pause word
+lies between them and the gap between them is at least the minimum pause length,
+as in CorpusContext.get_utterance_ids.  The utterances are loaded with PolyglotDB's
+bulk utterance CSV import.
+
+Pauses and utterances can also be encoded for some discourses only, e.g. those imported
+since the rest of the corpus was enriched.
+"""
+import os
+import re
+from uuid import uuid1
+
+import numpy as np
+
+from polyglotdb.io.importer import create_utterance_csvs, utterance_data_to_csvs, import_utterance_csv
+
+
+def word_table(data):
+    """
+    Extract the words of a parsed discourse (a DiscourseData object) as arrays.
+    """
+    words = [w for k, v in data.items() if v.is_word for w in v if w.begin is not None and w.end is not None]
+    return {'id': np.array([str(w.id) for w in words]),
+            'label': np.array([w.label for w in words]),
+            'begin': np.array([w.begin for w in words], dtype=np.float64),
+            'end': np.array([w.end for w in words], dtype=np.float64),
+            'speaker': np.array([w.speaker if w.speaker is not None else 'unknown' for w in words])}
+
+
+def word_table_path(directory, discourse):
+    return os.path.join(directory, '{}.npz'.format(discourse))
+
+
+def save_word_table(directory, discourse, table):
+    os.makedirs(directory, exist_ok=True)
+    np.savez(word_table_path(directory, discourse), **table)
+
+
+def load_word_table(directory, discourse):
+    with np.load(word_table_path(directory, discourse)) as f:
+        return {k: f[k] for k in f.files}
+
+
+def has_word_tables(directory, discourses):
+    return all(os.path.exists(word_table_path(directory, d)) for d in discourses)
+
+
+def pause_mask(labels, pauses):
+    # Match each distinct label once, as encode_pauses does with a regex (whole label) or a list of labels
+    unique, inverse = np.unique(labels, return_inverse=True)
+    if isinstance(pauses, str):
+        pattern = re.compile(pauses)
+        matches = np.array([pattern.fullmatch(x) is not None for x in unique], dtype=bool)
+    else:
+        matches = np.isin(unique, list(pauses))
+    return matches[inverse]
+
+
+def find_utterances(begins, ends, is_pause, min_pause_length):
+    """
+    Returns arrays of the indices of the first and last words of each utterance, for words sorted by begin.
+    """
+    speech = np.flatnonzero(~is_pause)
+    if len(speech) == 0:
+        return speech, speech
+    gaps = begins[speech[1:]] - ends[speech[:-1]]
+    boundaries = np.flatnonzero((np.diff(speech) > 1) & (gaps >= min_pause_length))
+    return speech[np.r_[0, boundaries + 1]], speech[np.r_[boundaries, len(speech) - 1]]
+
+
+def discourse_utterances(table, pauses, min_pause_length):
+    """
+    Returns a dictionary of speaker -> list of (begin word id, end word id) utterances.
+    """
+    is_pause = pause_mask(table['label'], pauses)
+    utterances = {}
+    for speaker in np.unique(table['speaker']):
+        rows = np.flatnonzero(table['speaker'] == speaker)
+        rows = rows[np.argsort(table['begin'][rows], kind='stable')]
+        first, last = find_utterances(table['begin'][rows], table['end'][rows], is_pause[rows], min_pause_length)
+        utterances[str(speaker)] = list(zip(table['id'][rows[first]].tolist(), table['id'][rows[last]].tolist()))
+    return utterances
+
+
+def encode_pauses(c, pauses, discourses):
+    """
+    Mark the words of the given discourses matching the pauses regex as pauses, as CorpusContext.encode_pauses
+    does for the whole corpus.
+    """
+    word = getattr(c, c.word_name)
+    for d in discourses:
+        c.query_graph(word).filter(word.discourse.name == d).filter(word.label.regex(pauses)).set_pause()
+        statement = '''MATCH (prec:{word}:{corpus}:speech)-[:spoken_in]->(d:Discourse:{corpus})
+        WHERE NOT (prec)-[:precedes]->() AND d.name = $discourse
+        WITH prec
+        MATCH p = (prec)-[:precedes_pause*]->(foll:{word}:{corpus}:speech)
+        WITH prec, foll, p
+        WHERE NONE (x IN nodes(p)[1..-1] WHERE x:speech)
+        MERGE (prec)-[:precedes]->(foll)'''.format(word=c.word_name, corpus=c.cypher_safe_name)
+        c.execute_cypher(statement, discourse=d)
+        statement = '''MATCH (w:{word}:{corpus}:speech)-[:spoken_in]->(d:Discourse:{corpus})
+        WHERE d.name = $discourse
+        WITH d, max(w.end) AS speech_end, min(w.begin) AS speech_begin
+        SET d.speech_begin = speech_begin, d.speech_end = speech_end'''.format(word=c.word_name,
+                                                                             corpus=c.cypher_safe_name)
+        c.execute_cypher(statement, discourse=d)
+
+
+def encode_utterances(c, directory, pauses, min_pause_length=0.5, call_back=None, discourses=None):
+    """
+    Encode utterances in every discourse of the corpus from its saved word table; pauses must already be encoded.
+
+    With discourses, utterances are only added to those discourses, which must not have any yet.
+    """
+    if discourses is None:
+        c.reset_utterances()
+        discourses = c.discourses
+    c.hierarchy.add_annotation_type('utterance', above=c.word_name, below=None)
+    c.encode_hierarchy()
+    create_utterance_csvs(c)
+    if call_back is not None:
+        call_back(0, len(discourses))
+    for i, d in enumerate(discourses):
+        if call_back is not None:
+            call_back('Finding utterances for discourse {} of {} ({})...'.format(i + 1, len(discourses), d))
+        for speaker, utterances in discourse_utterances(load_word_table(directory, d), pauses,
+                                                        min_pause_length).items():
+            rows = []
+            prev_id = None
+            for begin_id, end_id in utterances:
+                cur_id = uuid1()
+                rows.append({'id': cur_id, 'prev_id': prev_id, 'begin_word_id': begin_id, 'end_word_id': end_id})
+                prev_id = cur_id
+            utterance_data_to_csvs(c, speaker, d, rows)
+        if call_back is not None:
+            call_back(i + 1)
+    import_utterance_csv(c, call_back)
+    for m in c.hierarchy.acoustics:
+        c.reassess_utterances(m)
@@ -8,17 +8,22 @@ script_dir = os.path.join(base_dir, 'Common')
 sys.path.insert(0, script_dir)
 
 import common
+import corpus_session
 
 import re
 import time
 
 from polyglotdb.utils import ensure_local_database_running
-from polyglotdb import CorpusConfig, CorpusContext
+from polyglotdb import CorpusConfig
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('corpus_name', help='Name of the corpus')
     parser.add_argument('-r', '--reset', help="Reset the corpus", action='store_true')
+    parser.add_argument('--import-jobs', help="Number of processes for parsing discourse files during import",
+                        type=int, default=1)
+    parser.add_argument('--import-batch-size', help="Commit imported discourses in batches of this many files",
+                        type=int, default=None)
 
     args = parser.parse_args()
     corpus_name = args.corpus_name
@@ -36,18 +41,19 @@ if __name__ == '__main__':
         print(params)
         config = CorpusConfig(corpus_name, **params)
         config.formant_source = 'praat'
-        with CorpusContext(config) as c:
-            print(c.hierarchy)
-        # Common set up
-        if reset:
-            common.reset(config)
-        common.loading(config, corpus_conf['corpus_directory'], corpus_conf['input_format'])
-
-        common.lexicon_enrichment(config, corpus_conf['unisyn_spade_directory'], corpus_conf['dialect_code'])
-        common.speaker_enrichment(config, corpus_conf['speaker_enrichment_file'])
-
-        common.basic_enrichment(config, corpus_conf['vowel_inventory'] + corpus_conf['extra_syllabic_segments'], corpus_conf['pauses'])
-
-        common.basic_queries(config)
-
-        print('Finishing up!')
\ No newline at end of file
+        with corpus_session.CorpusSession(config) as session:
+            with common.corpus_context(config) as c:
+                print(c.hierarchy)
+            pipeline = common.build_pipeline(config, corpus_name, corpus_conf, import_jobs=args.import_jobs,
+                                             import_batch_size=args.import_batch_size)
+            # Common set up
+            if reset:
+                common.reset(config)
+                pipeline.clear()
+
+            pipeline.add_stage('basic_queries', lambda: common.basic_queries(config), depends=['basic_enrichment'],
+                               always=True, read_only=True)
+            pipeline.run()
+
+            print('Finishing up!')
+            session.report()
@@ -0,0 +1,210 @@
+import sys
+import os
+import json
+import time
+import uuid
+import argparse
+import subprocess
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(base_dir, 'Common')
+
+sys.path.insert(0, script_dir)
+
+import telemetry
+
+from requests.exceptions import ConnectionError
+from polyglotdb.client.client import ClientError, PGDBClient
+
+scripts = {'formant': 'formant.py', 'sibilant': 'sibilant.py'}
+default_memory_gb = 4
+
+
+def estimate_memory_gb(corpus_name, records):
+    # Largest stage peak memory of a previous run of the corpus, if there is one
+    peaks = [r['stage_peak_rss_mb'] for r in records if r['corpus'] == corpus_name and r.get('stage_peak_rss_mb')]
+    if not peaks:
+        return default_memory_gb
+    return max(peaks) / 1024
+
+
+def iscan_server_running(host='http://localhost:8080'):
+    # Without an ISCAN server, ensure_local_database_running falls back to the database on the default Neo4j and
+    # InfluxDB ports, which every corpus then shares
+    try:
+        PGDBClient(host).list_databases()
+    except ClientError:
+        pass
+    except ConnectionError:
+        return False
+    return True
+
+
+def job_cpus(analyses, args):
+    # Every process of a job is limited by one of these options, Praat analyses included (see --jobs)
+    cpus = [1, args.import_jobs]
+    if 'formant' in analyses:
+        cpus.append(args.formant_jobs)
+    if 'sibilant' in analyses:
+        cpus.append(args.sibilant_jobs)
+    return max(cpus)
+
+
+def job_commands(corpus_name, analyses, args, log_dir):
+    commands = []
+    for analysis in analyses:
+        command = [sys.executable, os.path.join(base_dir, scripts[analysis]), corpus_name,
+                   '--import-jobs', str(args.import_jobs),
+                   '--progress-jsonl', os.path.join(log_dir, '{}.progress.jsonl'.format(corpus_name))]
+        if args.reset and not commands:
+            command.append('--reset')
+        if args.import_batch_size:
+            command += ['--import-batch-size', str(args.import_batch_size)]
+        if analysis == 'formant':
+            command += ['--jobs', str(args.formant_jobs)]
+        if analysis == 'sibilant':
+            command += ['--engine', args.sibilant_engine, '--jobs', str(args.sibilant_jobs)]
+        commands.append(command)
+    return commands
+
+
+def start_command(job, log_dir, env):
+    command = job['commands'].pop(0)
+    log = open(os.path.join(log_dir, '{}.log'.format(job['corpus'])), 'a', encoding='utf8')
+    log.write('$ {}\n'.format(' '.join(command)))
+    log.flush()
+    job['process'] = subprocess.Popen(command, cwd=base_dir, stdout=log, stderr=subprocess.STDOUT, env=env)
+    job['log'] = log
+
+
+def run_jobs(jobs, cpus, memory_gb, log_dir, env, concurrent=True):
+    """
+    Run corpus jobs concurrently while their summed CPU and memory estimates stay within the budgets, or one at a
+    time when not concurrent.
+
+    The analyses of one corpus run one after another, since they share its database and pipeline stages.
+    """
+    pending = sorted(jobs, key=lambda x: x['memory_gb'], reverse=True)
+    running = []
+    while pending or running:
+        for job in list(pending):
+            cpus_used = sum(x['cpus'] for x in running)
+            memory_used = sum(x['memory_gb'] for x in running)
+            fits = concurrent and cpus_used + job['cpus'] <= cpus and (memory_gb is None or
+                                                                       memory_used + job['memory_gb'] <= memory_gb)
+            # A job larger than the budget still runs, on its own
+            if fits or not running:
+                pending.remove(job)
+                running.append(job)
+                job['begin'] = time.time()
+                print('Starting {} ({} CPUs, {:.1f} GB estimated)'.format(job['corpus'], job['cpus'],
+                                                                         job['memory_gb']))
+                start_command(job, log_dir, env)
+        time.sleep(1)
+        for job in list(running):
+            code = job['process'].poll()
+            if code is None:
+                continue
+            job['log'].close()
+            if code == 0 and job['commands']:
+                start_command(job, log_dir, env)
+                continue
+            running.remove(job)
+            job['wall_time'] = time.time() - job['begin']
+            job['returncode'] = code
+            if code == 0:
+                print('Finished {} in {:.1f} seconds'.format(job['corpus'], job['wall_time']))
+            else:
+                print('{} failed with exit code {} after {:.1f} seconds{}'.format(
+                    job['corpus'], code, job['wall_time'], ', skipping its remaining analyses' if job['commands'] else ''))
+
+
+def stage_report(records):
+    # Tokens are counted per stage, as an analysis and the export of its measures count the same tokens
+    stages = {}
+    for r in records:
+        stage = stages.setdefault(r['stage'], {'wall_time': 0, 'tokens': None, 'audio_seconds': None})
+        stage['wall_time'] += r['wall_time']
+        for k in ['tokens', 'audio_seconds']:
+            if r[k] is not None:
+                stage[k] = (stage[k] or 0) + r[k]
+    for stage in stages.values():
+        stage['tokens_per_second'] = telemetry.rate(stage['tokens'], stage['wall_time'])
+        stage['audio_seconds_per_second'] = telemetry.rate(stage['audio_seconds'], stage['wall_time'])
+    return stages
+
+
+def corpus_report(job, records):
+    records = [r for r in records if r['corpus'] == job['corpus']]
+    return {'corpus': job['corpus'], 'analyses': job['analyses'], 'returncode': job['returncode'],
+            'wall_time': job['wall_time'],
+            'cpu_time': sum(r['cpu_time'] for r in records),
+            'stage_peak_rss_mb': max([r.get('stage_peak_rss_mb') or 0 for r in records] or [None]),
+            'queries': sum(r['queries'] for r in records),
+            'stages': stage_report(records)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run analyses on several corpora concurrently within CPU and '
+                                                 'memory budgets')
+    parser.add_argument('corpora', help='Names of the corpora', nargs='+')
+    parser.add_argument('-a', '--analyses', help="Analyses to run on every corpus", nargs='+',
+                        choices=sorted(scripts), default=['formant', 'sibilant'])
+    parser.add_argument('--cpus', help="Number of CPUs to use across all corpora", type=int,
+                        default=os.cpu_count())
+    parser.add_argument('--memory-gb', help="Memory budget (GB) across all corpora, estimated from the peak memory "
+                                            "of previous runs of each corpus", type=float, default=None)
+    parser.add_argument('-r', '--reset', help="Reset the corpora", action='store_true')
+    parser.add_argument('--import-jobs', help="Number of processes for parsing discourse files during import",
+                        type=int, default=1)
+    parser.add_argument('--import-batch-size', help="Commit imported discourses in batches of this many files",
+                        type=int, default=None)
+    parser.add_argument('-e', '--sibilant-engine', help="Engine for sibilant measurements",
+                        choices=['praat', 'praat-batch', 'numpy'], default='praat')
+    parser.add_argument('--formant-jobs', help="Number of Praat processes for formant analysis", type=int,
+                        default=1)
+    parser.add_argument('-j', '--sibilant-jobs', help="Number of processes for sibilant analysis", type=int,
+                        default=1)
+
+    args = parser.parse_args()
+    directories = [x for x in os.listdir(base_dir) if os.path.isdir(os.path.join(base_dir, x)) and x != 'Common']
+    missing = [x for x in args.corpora if x not in directories]
+    if missing:
+        print('The corpora {} do not have a directory (available: {}).'.format(', '.join(missing),
+                                                                              ', '.join(directories)))
+        sys.exit(1)
+
+    run_id = uuid.uuid4().hex
+    log_dir = os.path.join(base_dir, 'benchmarks', 'batch_{}'.format(run_id))
+    os.makedirs(log_dir, exist_ok=True)
+    # Every script of the batch tags its telemetry with the same run id
+    env = dict(os.environ, SPADE_RUN_ID=run_id)
+    previous_records = telemetry.load_records()
+    concurrent = len(args.corpora) == 1 or iscan_server_running()
+    if not concurrent:
+        print('No ISCAN server is running, so every corpus would share the database on the default ports; '
+              'running the corpora one at a time.')
+    jobs = []
+    for corpus_name in args.corpora:
+        jobs.append({'corpus': corpus_name, 'analyses': args.analyses,
+                     'cpus': min(job_cpus(args.analyses, args), args.cpus),
+                     'memory_gb': estimate_memory_gb(corpus_name, previous_records),
+                     'commands': job_commands(corpus_name, args.analyses, args, log_dir)})
+    print('Batch run {}, logs in {}'.format(run_id, log_dir))
+    run_jobs(jobs, args.cpus, args.memory_gb, log_dir, env, concurrent=concurrent)
+
+    records = [r for r in telemetry.load_records() if r['run_id'] == run_id]
+    report = [corpus_report(job, records) for job in jobs]
+    report_path = os.path.join(log_dir, 'report.json')
+    with open(report_path, 'w', encoding='utf8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    for r in report:
+        print('{}: {} in {:.1f} seconds'.format(r['corpus'], 'done' if r['returncode'] == 0 else 'FAILED',
+                                               r['wall_time']))
+        for name, stage in sorted(r['stages'].items()):
+            if stage['tokens'] is not None:
+                print('    {}: {} tokens ({:.1f} tokens/s), {:.1f} audio seconds/s'.format(
+                    name, stage['tokens'], stage['tokens_per_second'] or 0, stage['audio_seconds_per_second'] or 0))
+    print('Report written to {}'.format(report_path))
+    if any(r['returncode'] != 0 for r in report):
+        sys.exit(1)
@@ -0,0 +1,128 @@
+import sys
+import os
+import json
+import argparse
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(base_dir, 'Common')
+
+sys.path.insert(0, script_dir)
+
+import yaml
+import platform
+
+import common
+import corpus_session
+import telemetry
+import synthetic
+
+from polyglotdb.utils import ensure_local_database_running
+from polyglotdb import CorpusConfig
+
+corpus_name = 'Synthetic'
+baseline_path = os.path.join(base_dir, 'benchmarks', 'synthetic_baseline.json')
+
+
+def write_config(corpus_dir, speaker_file):
+    conf = {'corpus_directory': corpus_dir,
+            'input_format': 'MFA',
+            'dialect_code': 'sca',
+            'unisyn_spade_directory': os.path.join(corpus_dir, 'unisyn_spade'),
+            'speaker_enrichment_file': speaker_file,
+            'speakers': [],
+            'vowel_inventory': synthetic.vowel_inventory,
+            'stressed_vowels': sorted(synthetic.vowel_formants),
+            'extra_syllabic_segments': [],
+            'sibilant_segments': sorted(synthetic.sibilant_spectra),
+            'pauses': '^{}$'.format(synthetic.pause_label)}
+    path = os.path.join(base_dir, corpus_name, '{}.yaml'.format(corpus_name))
+    with open(path, 'w', encoding='utf8') as f:
+        yaml.safe_dump(conf, f, default_flow_style=None)
+
+
+def stage_throughput(records):
+    # Seconds of corpus processed per second of wall time, summed over repeated stage names
+    wall_times = {}
+    sizes = {}
+    for r in records:
+        wall_times[r['stage']] = wall_times.get(r['stage'], 0) + r['wall_time']
+        sizes[r['stage']] = r.get('corpus_size')
+    return {k: sizes[k] / v for k, v in wall_times.items() if sizes[k] and v}
+
+
+def compare_to_baseline(throughput, baseline, tolerance):
+    regressions = []
+    for stage, value in sorted(throughput.items()):
+        if stage not in baseline:
+            print('{}: {:.2f} corpus seconds/s (no baseline)'.format(stage, value))
+            continue
+        change = value / baseline[stage] - 1
+        flag = ''
+        if change < -tolerance:
+            flag = '  <-- REGRESSION'
+            regressions.append(stage)
+        print('{}: {:.2f} corpus seconds/s ({:+.1%} vs baseline){}'.format(stage, value, change, flag))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run every pipeline stage on a synthetic corpus and compare '
+                                                 'throughput against a stored baseline')
+    parser.add_argument('--speakers', help="Number of speakers to generate", type=int, default=4)
+    parser.add_argument('--minutes', help="Minutes of speech per speaker", type=float, default=5)
+    parser.add_argument('-e', '--engine', help="Engine for sibilant measurements",
+                        choices=['praat', 'praat-batch', 'numpy'], default='numpy')
+    parser.add_argument('-j', '--jobs', help="Number of processes for sibilant analysis", type=int, default=1)
+    parser.add_argument('--import-jobs', help="Number of processes for parsing discourse files during import",
+                        type=int, default=1)
+    parser.add_argument('--import-batch-size', help="Commit imported discourses in batches of this many files",
+                        type=int, default=None)
+    parser.add_argument('-t', '--tolerance', help="Allowed fractional drop in throughput", type=float, default=0.2)
+    parser.add_argument('--update-baseline', help="Store this run's throughput as the baseline",
+                        action='store_true')
+
+    args = parser.parse_args()
+    size_label = '{}x{}min'.format(args.speakers, args.minutes)
+    corpus_dir = os.path.join(base_dir, corpus_name, 'corpus_{}'.format(size_label))
+    os.makedirs(os.path.join(base_dir, corpus_name), exist_ok=True)
+    speaker_file = os.path.join(corpus_dir, 'speaker_data.csv')
+    if not os.path.exists(speaker_file):
+        print('Generating synthetic corpus ({})...'.format(size_label))
+        speaker_file = synthetic.generate_corpus(corpus_dir, num_speakers=args.speakers,
+                                                 minutes_per_speaker=args.minutes)
+    write_config(corpus_dir, speaker_file)
+    corpus_conf = common.load_config(corpus_name)
+    print('Processing...')
+    with ensure_local_database_running(corpus_name) as params:
+        config = CorpusConfig(corpus_name, **params)
+        config.formant_source = 'praat'
+        with corpus_session.CorpusSession(config) as session:
+            # Always start from an empty database so runs are comparable
+            common.reset(config)
+            pipeline = common.build_pipeline(config, corpus_name, corpus_conf, import_jobs=args.import_jobs,
+                                             import_batch_size=args.import_batch_size)
+            pipeline.clear()
+            common.add_formant_stages(pipeline, config, corpus_name, corpus_conf, corpus_conf['stressed_vowels'])
+            common.add_sibilant_stages(pipeline, config, corpus_name, corpus_conf, engine=args.engine, jobs=args.jobs)
+            pipeline.add_stage('basic_queries', lambda: common.basic_queries(config), depends=['basic_enrichment'],
+                               read_only=True)
+            pipeline.run()
+            session.report()
+
+    records = [r for r in telemetry.load_records() if r['run_id'] == telemetry.run_id]
+    throughput = stage_throughput(records)
+    baselines = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path, 'r', encoding='utf8') as f:
+            baselines = json.load(f)
+    machine_baselines = baselines.setdefault(platform.node(), {})
+    regressions = compare_to_baseline(throughput, machine_baselines.get(size_label, {}), args.tolerance)
+    if args.update_baseline:
+        machine_baselines[size_label] = throughput
+        with open(baseline_path, 'w', encoding='utf8') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print('Baseline updated in {}'.format(baseline_path))
+    if regressions:
+        print('Throughput regressions in: {}'.format(', '.join(regressions)))
+        sys.exit(1)
+    print('Finishing up!')
@@ -8,6 +8,8 @@ script_dir = os.path.join(base_dir, 'Common')
 sys.path.insert(0, script_dir)
 
 import common
+import corpus_session
+import progress
 
 from polyglotdb.utils import ensure_local_database_running
 from polyglotdb import CorpusConfig
@@ -16,8 +18,41 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('corpus_name', help='Name of the corpus')
     parser.add_argument('-r', '--reset', help="Reset the corpus", action='store_true')
+    parser.add_argument('--import-jobs', help="Number of processes for parsing discourse files during import",
+                        type=int, default=1)
+    parser.add_argument('--import-batch-size', help="Commit imported discourses in batches of this many files",
+                        type=int, default=None)
+    parser.add_argument('-s', '--stream', help="Export one speaker at a time to bound memory use",
+                        action='store_true')
+    parser.add_argument('-f', '--export-format', help="File format of the exported measures",
+                        choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--partition', help="Export one file per speaker or discourse, with a manifest",
+                        choices=['speaker', 'discourse'], default=None)
+    parser.add_argument('--export-jobs', help="Number of partitions to export at once", type=int, default=1)
+    parser.add_argument('--partitions', help="Export only these speakers or discourses again", nargs='+',
+                        default=None)
+    parser.add_argument('-j', '--jobs', help="Number of Praat processes for the formant analysis and sweep "
+                                             "(default 3/4 of the CPUs)", type=int, default=None)
+    parser.add_argument('--sweep', help="Run a formant parameter sweep instead of the formant analysis (takes "
+                                        "about as long as the analysis per maximum formant swept)",
+                        action='store_true')
+    parser.add_argument('--sweep-iterations', help="Numbers of refinement iterations to sweep", type=int,
+                        nargs='+', default=[common.nIterations])
+    parser.add_argument('--sweep-duration-thresholds', help="Duration thresholds to sweep", type=float,
+                        nargs='+', default=[common.duration_threshold])
+    parser.add_argument('--sweep-max-formants', help="Maximum formant frequencies (Hz) to sweep, each one a full "
+                                                     "Praat pass over the vowels", type=int,
+                        nargs='+', default=[5500])
+    parser.add_argument('--plan', help="Print the expected runtime of the remaining stages, from the benchmark "
+                                       "history, without running them", action='store_true')
+    parser.add_argument('--progress-jsonl', help="Append progress events to this JSON lines file", default=None)
+    parser.add_argument('--progress-port', help="Serve the latest progress events as JSON on this local port",
+                        type=int, default=None)
 
     args = parser.parse_args()
+    if args.partitions and not args.partition:
+        print('--partitions requires --partition speaker or --partition discourse.')
+        sys.exit(1)
     corpus_name = args.corpus_name
     reset = args.reset
     directories = [x for x in os.listdir(base_dir) if os.path.isdir(x) and x != 'Common']
@@ -28,29 +63,48 @@ if __name__ == '__main__':
                 args.corpus_name, ', '.join(directories)))
         sys.exit(1)
     corpus_conf = common.load_config(corpus_name)
+    progress.configure(args.progress_jsonl, args.progress_port)
     print('Processing...')
-    with ensure_local_database_running(corpus_name) as params:
-        print(params)
-        config = CorpusConfig(corpus_name, **params)
-        config.formant_source = 'praat'
-        # Common set up
-        if reset:
-            common.reset(config)
-        common.loading(config, corpus_conf['corpus_directory'], corpus_conf['input_format'])
-
-        common.lexicon_enrichment(config, corpus_conf['unisyn_spade_directory'], corpus_conf['dialect_code'])
-        common.speaker_enrichment(config, corpus_conf['speaker_enrichment_file'])
-
-        common.basic_enrichment(config, corpus_conf['vowel_inventory'] + corpus_conf['extra_syllabic_segments'], corpus_conf['pauses'])
-
-
-        # Formant specific analysis
-        if corpus_conf['stressed_vowels']:
-            vowels_to_analyze = corpus_conf['stressed_vowels']
-        else:
-            vowels_to_analyze = corpus_conf['vowel_inventory']
-        common.formant_acoustic_analysis(config, vowels_to_analyze)
-
-        common.formant_export(config, corpus_name, corpus_conf['dialect_code'],
-                              corpus_conf['speakers'], vowels_to_analyze)
-        print('Finishing up!')
+    try:
+        with ensure_local_database_running(corpus_name) as params:
+            print(params)
+            config = CorpusConfig(corpus_name, **params)
+            config.formant_source = 'praat'
+            with corpus_session.CorpusSession(config) as session:
+                pipeline = common.build_pipeline(config, corpus_name, corpus_conf, import_jobs=args.import_jobs,
+                                                 import_batch_size=args.import_batch_size)
+                # Formant specific analysis
+                if corpus_conf['stressed_vowels']:
+                    vowels_to_analyze = corpus_conf['stressed_vowels']
+                else:
+                    vowels_to_analyze = corpus_conf['vowel_inventory']
+                if args.sweep:
+                    grid = [(i, d, m) for i in args.sweep_iterations for d in args.sweep_duration_thresholds
+                            for m in args.sweep_max_formants]
+                    common.add_formant_sweep_stage(pipeline, config, corpus_name, vowels_to_analyze, grid,
+                                                   jobs=args.jobs)
+                    targets = ['formant_sweep']
+                else:
+                    common.add_formant_stages(pipeline, config, corpus_name, corpus_conf, vowels_to_analyze,
+                                              stream=args.stream, export_format=args.export_format,
+                                              partition=args.partition, export_jobs=args.export_jobs,
+                                              partitions=args.partitions, jobs=args.jobs)
+                    targets = None
+                if args.plan:
+                    parallel = {'import': '--import-jobs', 'formant_acoustic_analysis': '--jobs',
+                                'formant_sweep': '--jobs'}
+                    if args.partition:
+                        parallel['formant_export'] = '--export-jobs'
+                    stages = pipeline.needed_stages(targets) if reset else pipeline.pending_stages(targets)
+                    common.plan(config, corpus_conf, stages, parallel=parallel)
+                    sys.exit(0)
+
+                # Common set up
+                if reset:
+                    common.reset(config)
+                    pipeline.clear()
+                pipeline.run(targets)
+                print('Finishing up!')
+                session.report()
+    finally:
+        progress.reporter.close()
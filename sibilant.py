@@ -8,6 +8,8 @@ script_dir = os.path.join(base_dir, 'Common')
 sys.path.insert(0, script_dir)
 
 import common
+import corpus_session
+import progress
 
 from polyglotdb.utils import ensure_local_database_running
 from polyglotdb.config import CorpusConfig
@@ -16,8 +18,36 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('corpus_name', help='Name of the corpus')
     parser.add_argument('-r', '--reset', help="Reset the corpus", action='store_true')
+    parser.add_argument('--import-jobs', help="Number of processes for parsing discourse files during import",
+                        type=int, default=1)
+    parser.add_argument('--import-batch-size', help="Commit imported discourses in batches of this many files",
+                        type=int, default=None)
+    parser.add_argument('-s', '--stream', help="Export one speaker at a time to bound memory use",
+                        action='store_true')
+    parser.add_argument('-f', '--export-format', help="File format of the exported measures",
+                        choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--partition', help="Export one file per speaker or discourse, with a manifest",
+                        choices=['speaker', 'discourse'], default=None)
+    parser.add_argument('--export-jobs', help="Number of partitions to export at once", type=int, default=1)
+    parser.add_argument('--partitions', help="Export only these speakers or discourses again", nargs='+',
+                        default=None)
+    parser.add_argument('-e', '--engine', help="Engine for sibilant measurements", choices=['praat', 'praat-batch', 'numpy'],
+                        default='praat')
+    parser.add_argument('-j', '--jobs', help="Number of processes for sibilant analysis: discourse shards for the "
+                                             "numpy and praat-batch engines (default 1), Praat processes for the "
+                                             "praat engine (default 3/4 of the CPUs)", type=int, default=None)
+    parser.add_argument('--segment-cache', help="Read token audio through the on-disk segment cache "
+                                                "(numpy engine)", action='store_true')
+    parser.add_argument('--plan', help="Print the expected runtime of the remaining stages, from the benchmark "
+                                       "history, without running them", action='store_true')
+    parser.add_argument('--progress-jsonl', help="Append progress events to this JSON lines file", default=None)
+    parser.add_argument('--progress-port', help="Serve the latest progress events as JSON on this local port",
+                        type=int, default=None)
 
     args = parser.parse_args()
+    if args.partitions and not args.partition:
+        print('--partitions requires --partition speaker or --partition discourse.')
+        sys.exit(1)
     corpus_name = args.corpus_name
     reset = args.reset
     directories = [x for x in os.listdir(base_dir) if os.path.isdir(x) and x != 'Common']
@@ -28,21 +58,34 @@ if __name__ == '__main__':
                 args.corpus_name, ', '.join(directories)))
         sys.exit(1)
     corpus_conf = common.load_config(corpus_name)
+    progress.configure(args.progress_jsonl, args.progress_port)
     print('Processing...')
-    with ensure_local_database_running(corpus_name) as params:
-        config = CorpusConfig(corpus_name, **params)
-        config.formant_source = 'praat'
-        # Common set up
-        if reset:
-            common.reset(config)
-        common.loading(config, corpus_conf['corpus_directory'], corpus_conf['input_format'])
-
-        common.lexicon_enrichment(config, corpus_conf['unisyn_spade_directory'], corpus_conf['dialect_code'])
-        common.speaker_enrichment(config, corpus_conf['speaker_enrichment_file'])
-
-        common.basic_enrichment(config, corpus_conf['vowel_inventory'] + corpus_conf['extra_syllabic_segments'], corpus_conf['pauses'])
-
-        # Formant specific analysis
-        common.sibilant_acoustic_analysis(config, corpus_conf['sibilant_segments'])
-        common.sibilant_export(config, corpus_name, corpus_conf['dialect_code'], corpus_conf['speakers'])
-        print('Finishing up!')
+    try:
+        with ensure_local_database_running(corpus_name) as params:
+            config = CorpusConfig(corpus_name, **params)
+            config.formant_source = 'praat'
+            with corpus_session.CorpusSession(config) as session:
+                pipeline = common.build_pipeline(config, corpus_name, corpus_conf, import_jobs=args.import_jobs,
+                                                 import_batch_size=args.import_batch_size)
+                # Sibilant specific analysis
+                common.add_sibilant_stages(pipeline, config, corpus_name, corpus_conf, engine=args.engine,
+                                           jobs=args.jobs, stream=args.stream, export_format=args.export_format,
+                                           use_segment_cache=args.segment_cache, partition=args.partition,
+                                           export_jobs=args.export_jobs, partitions=args.partitions)
+                if args.plan:
+                    parallel = {'import': '--import-jobs', 'sibilant_acoustic_analysis': '--jobs'}
+                    if args.partition:
+                        parallel['sibilant_export'] = '--export-jobs'
+                    stages = pipeline.needed_stages() if reset else pipeline.pending_stages()
+                    common.plan(config, corpus_conf, stages, parallel=parallel)
+                    sys.exit(0)
+
+                # Common set up
+                if reset:
+                    common.reset(config)
+                    pipeline.clear()
+                pipeline.run()
+                print('Finishing up!')
+                session.report()
+    finally:
+        progress.reporter.close()
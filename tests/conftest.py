@@ -0,0 +1,56 @@
+import os
+import sys
+import shutil
+
+import pytest
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base_dir, 'Common'))
+
+import synthetic
+
+
+@pytest.fixture(scope='session')
+def synthetic_corpus(tmp_path_factory):
+    # A small synthetic corpus: two speakers with two 15 second recordings each
+    directory = str(tmp_path_factory.mktemp('synthetic'))
+    synthetic.generate_corpus(directory, num_speakers=2, minutes_per_speaker=0.5, recording_minutes=0.25)
+    return directory
+
+
+@pytest.fixture(scope='session')
+def praat_path():
+    path = os.environ.get('PRAAT_PATH') or shutil.which('praat')
+    if path is None:
+        pytest.skip('Praat is not installed (set PRAAT_PATH or put praat on the path)')
+    return path
+
+
+@pytest.fixture(scope='session')
+def database():
+    # Connection parameters of a local database; tests that need one are skipped when none is running
+    from polyglotdb.utils import ensure_local_database_running
+    manager = ensure_local_database_running('spade_tests')
+    try:
+        params = manager.__enter__()
+    except (Exception, SystemExit):
+        pytest.skip('No local PolyglotDB database is running')
+    yield params
+    manager.__exit__(None, None, None)
+
+
+@pytest.fixture(scope='session')
+def load_synthetic(database, synthetic_corpus):
+    """
+    Returns a function that imports the synthetic corpus under a name and returns its CorpusConfig.
+    """
+    from polyglotdb import CorpusConfig, CorpusContext
+    import polyglotdb.io as pgio
+
+    def load(name):
+        config = CorpusConfig(name, **database)
+        with CorpusContext(config) as c:
+            c.reset()
+            c.load(pgio.inspect_mfa(synthetic_corpus), synthetic_corpus)
+        return config
+    return load
@@ -0,0 +1,14 @@
+import conch.main
+
+import common
+
+
+def test_analysis_jobs_sets_conch_pool_size():
+    cpu_count = conch.main.cpu_count
+    for jobs in range(1, 65):
+        with common.analysis_jobs(jobs):
+            # The number of processes analyze_segments starts without num_jobs
+            assert int((3 * conch.main.cpu_count()) / 4) == jobs
+        assert conch.main.cpu_count is cpu_count
+    with common.analysis_jobs(None):
+        assert conch.main.cpu_count is cpu_count
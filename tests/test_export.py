@@ -0,0 +1,142 @@
+import os
+import csv
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from polyglotdb.io.exporters.csv import save_results
+
+import common
+
+columns = ['speaker', 'discourse', 'phone_label', 'begin']
+table = [('s1', 'd1', 'S', 0.5), ('s1', 'd1', 'IY1', 0.6), ('s1', 'd2', 'SH', 1.0),
+         ('s2', 'd3', 'Z', 0.25), ('s2', 'd3', 'UW1', 0.4), ('s2', 'd4', 'S', 2.0)]
+
+
+class Results(list):
+    columns = columns
+
+
+class Attribute(object):
+    def __init__(self, column):
+        self.column = column
+
+    def __eq__(self, value):
+        return self.column, value
+
+
+class Query(object):
+    # Stands in for a PolyglotDB query over the rows of table
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter(self, criterion):
+        column, value = criterion
+        return Query([r for r in self.rows if r[columns.index(column)] == value])
+
+    def all(self):
+        return Results(dict(zip(columns, r)) for r in self.rows)
+
+    def to_csv(self, path):
+        save_results(self.all(), path, header=columns)
+
+
+class Context(object):
+    """
+    Stands in for CorpusContext, recording the thread that opens each context.
+    """
+    opened = []
+    speakers = ['s1', 's2']
+    discourses = ['d1', 'd2', 'd3', 'd4']
+    hierarchy = SimpleNamespace(speaker_properties=[('name', str)])
+    phone = SimpleNamespace(discourse=SimpleNamespace(name=Attribute('discourse')))
+
+    def __init__(self, config):
+        self.config = config
+
+    def __enter__(self):
+        Context.opened.append((self, threading.get_ident()))
+        return self
+
+    def __exit__(self, exc_type, exc, exc_tb):
+        return False
+
+
+def build_query(c, speakers):
+    assert isinstance(c, Context)
+    return Query([r for r in table if not speakers or r[0] in speakers])
+
+
+def read_rows(path):
+    with open(path, encoding='utf8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        return header, [tuple(r) for r in reader]
+
+
+def partition_rows(directory):
+    rows = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.csv'):
+            header, file_rows = read_rows(os.path.join(directory, name))
+            assert header == columns
+            rows.extend(file_rows)
+    return sorted(rows)
+
+
+@pytest.mark.parametrize('partition', ['speaker', 'discourse'])
+def test_partitions_match_single_export(tmp_path, monkeypatch, partition):
+    monkeypatch.setattr(common, 'CorpusContext', Context)
+    Context.opened = []
+    c = Context('config')
+    common.export_results(c, build_query, None, str(tmp_path / 'all.csv'))
+    header, expected = read_rows(str(tmp_path / 'all.csv'))
+    num_rows = common.export_partitions(c, build_query, None, str(tmp_path / 'parts'), partition, jobs=2)
+    assert num_rows == len(expected) == len(table)
+    assert partition_rows(str(tmp_path / 'parts')) == sorted(expected)
+    # Every partition opened a context of its own, none of them on the calling thread
+    names = c.speakers if partition == 'speaker' else c.discourses
+    assert len({id(x) for x, _ in Context.opened}) == len(names)
+    assert all(x is not c and thread != threading.get_ident() for x, thread in Context.opened)
+    assert all(x.config == 'config' for x, _ in Context.opened)
+
+
+def test_stream_export_matches_single_export(tmp_path):
+    c = Context('config')
+    common.export_results(c, build_query, None, str(tmp_path / 'all.csv'))
+    num_rows = common.export_results(c, build_query, None, str(tmp_path / 'stream.csv'), stream=True)
+    assert num_rows == len(table)
+    assert read_rows(str(tmp_path / 'stream.csv')) == read_rows(str(tmp_path / 'all.csv'))
+
+
+def test_only_reexports_named_partitions(tmp_path, monkeypatch):
+    monkeypatch.setattr(common, 'CorpusContext', Context)
+    c = Context('config')
+    directory = str(tmp_path / 'parts')
+    common.export_partitions(c, build_query, None, directory, 'speaker', jobs=2)
+    expected = partition_rows(directory)
+    os.remove(os.path.join(directory, 's2.csv'))
+    assert common.export_partitions(c, build_query, None, directory, 'speaker', only=['s2']) == 3
+    manifest = common.importing.load_manifest(os.path.join(directory, 'manifest.json'))
+    assert sorted(manifest['partitions']) == ['s1', 's2']
+    assert partition_rows(directory) == expected
+
+
+def phone_query(c, speakers):
+    q = c.query_graph(c.phone)
+    if speakers:
+        q = q.filter(c.phone.speaker.name.in_(speakers))
+    return q.columns(c.phone.speaker.name.column_name('speaker'), c.phone.discourse.name.column_name('discourse'),
+                     c.phone.label.column_name('phone_label'), c.phone.begin.column_name('begin'))
+
+
+@pytest.mark.parametrize('partition', ['speaker', 'discourse'])
+def test_database_partitions_match_single_export(load_synthetic, tmp_path, partition):
+    config = load_synthetic('spade_tests_export')
+    with common.CorpusContext(config) as c:
+        common.export_results(c, phone_query, None, str(tmp_path / 'all.csv'))
+        header, expected = read_rows(str(tmp_path / 'all.csv'))
+        num_rows = common.export_partitions(c, phone_query, None, str(tmp_path / 'parts'), partition, jobs=2)
+    assert expected and num_rows == len(expected)
+    assert partition_rows(str(tmp_path / 'parts')) == sorted(expected)
@@ -0,0 +1,36 @@
+import pytest
+
+from polyglotdb.io.exporters.csv import save_results
+
+import export_writers
+from query_cache import CachedResults
+
+columns = ['speaker', 'phone_label', 'onset', 'coda', 'cog', 'syllable_position_in_word']
+rows = [('s1', 'S', ['S', 'T', 'R'], [], 6512.25, 1.0),
+        ('s1', 'SH', ['SH'], None, None, 2.0),
+        ('s2', 'Z', [], ['Z'], 6100.5, None)]
+
+
+def test_csv_writer_matches_save_results(tmp_path):
+    expected_path = str(tmp_path / 'save_results.csv')
+    save_results(CachedResults(columns, rows), expected_path, header=columns)
+    path = str(tmp_path / 'writer.csv')
+    writer = export_writers.open_writer(path, 'csv')
+    writer.write(columns, [list(r) for r in rows[:1]])
+    writer.write(columns, [list(r) for r in rows[1:]])
+    writer.close()
+    with open(path, encoding='utf8') as f, open(expected_path, encoding='utf8') as expected:
+        assert f.read() == expected.read()
+
+
+def test_parquet_writer_joins_lists_like_save_results(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    path = str(tmp_path / 'writer.parquet')
+    writer = export_writers.open_writer(path, 'parquet')
+    writer.write(columns, [list(r) for r in rows])
+    writer.close()
+    table = pq.read_table(path).to_pydict()
+    assert table['onset'] == ['S/T/R', 'SH', '']
+    assert table['coda'] == ['', None, 'Z']
+    assert table['cog'] == [6512.25, None, 6100.5]
+    assert table['syllable_position_in_word'] == [1, 2, None]
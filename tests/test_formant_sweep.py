@@ -0,0 +1,112 @@
+import copy
+import types
+
+import numpy as np
+import pytest
+from conch.analysis.segments import SegmentMapping
+from polyglotdb.acoustics.formants import refined
+
+import formant_sweep
+
+
+def candidate_measures(rng, formants):
+    # Measures in the form parse_multiple_formant_output returns them, for 4 to 7 formants in steps of a half
+    candidates = {}
+    for number in np.arange(formant_sweep.min_formants, formant_sweep.max_formants + 0.5, 0.5):
+        measures = {}
+        for i in range(int(number)):
+            measures['F{}'.format(i + 1)] = float(rng.normal(formants[i], 150) if i < 3 else 3500 + 300 * i)
+            measures['B{}'.format(i + 1)] = float(rng.uniform(1.5, 2.5))
+            measures['A{}'.format(i + 1)] = float(rng.uniform(10, 40))
+        candidates[float(number) if number % 1 else int(number)] = measures
+    return candidates
+
+
+@pytest.fixture
+def measured():
+    rng = np.random.default_rng(7)
+    mapping = SegmentMapping()
+    candidates = {}
+    # Enough tokens of IY1 for the refinement, too few of AA1 for it
+    for speaker, label, count, formants in [('s1', 'IY1', 12, (300, 2300, 3000)), ('s1', 'AA1', 4, (700, 1100, 2500)),
+                                            ('s2', 'IY1', 8, (350, 2600, 3300))]:
+        for i in range(count):
+            mapping.add_file_segment('{}.wav'.format(speaker), i, i + 0.1, 0, label=label, speaker=speaker,
+                                     id='{}_{}_{}'.format(speaker, label, i))
+            candidates[mapping.segments[-1]] = candidate_measures(rng, formants)
+    # A B3 Praat could not measure
+    candidates[mapping.segments[0]][5]['B3'] = None
+    return mapping, candidates
+
+
+@pytest.mark.parametrize('num_iterations', [1, 3])
+def test_matches_polyglotdb_refinement(monkeypatch, measured, num_iterations):
+    mapping, candidates = measured
+    saved = {}
+    monkeypatch.setattr(refined, 'generate_vowel_segments', lambda *args, **kwargs: mapping)
+    monkeypatch.setattr(refined, 'generate_variable_formants_point_function', lambda *args: None)
+    monkeypatch.setattr(refined, 'analyze_segments', lambda seg, *args, **kwargs: {s: copy.deepcopy(candidates[s])
+                                                                                  for s in seg})
+    monkeypatch.setattr(refined, 'save_formant_point_data', lambda c, data, **kwargs: saved.update(data))
+    corpus_context = types.SimpleNamespace(hierarchy=types.SimpleNamespace(has_type_subset=lambda *args: True))
+    refined.analyze_formant_points_refinement(corpus_context, num_iterations=num_iterations)
+
+    label = formant_sweep.config_label(num_iterations, 0, 5500)
+    values = formant_sweep.run_sweep(mapping.segments, {5500: candidates}, [(num_iterations, 0, 5500)])[label]
+    for i, seg in enumerate(mapping.segments):
+        expected = [np.nan if saved[seg][x] is None else saved[seg][x] for x in formant_sweep.columns]
+        np.testing.assert_array_equal(values[i], expected)
+
+
+def test_duration_threshold_leaves_short_tokens_out(measured):
+    mapping, candidates = measured
+    values = formant_sweep.run_sweep(mapping.segments, {5500: candidates}, [(1, 0.2, 5500)])
+    assert np.isnan(values[formant_sweep.config_label(1, 0.2, 5500)]).all()
+
+
+def test_one_praat_pass_per_ceiling(monkeypatch, measured):
+    mapping, candidates = measured
+    passes = []
+
+    def analyze_segments(segment_mapping, function, num_jobs=None, multiprocessing=True):
+        ceiling = function._function.arguments[-1]
+        passes.append((ceiling, num_jobs))
+        # Lower ceilings give proportionally lower measures, and so the same choices in the refinement
+        return {s: {n: {k: None if v is None else v * ceiling / 5500 for k, v in m.items()}
+                    for n, m in candidates[s].items()}
+                for s in segment_mapping}
+    monkeypatch.setattr(formant_sweep, 'analyze_segments', analyze_segments)
+    measured_candidates = formant_sweep.measure_candidates(mapping, [5000, 5500], 'praat', jobs=3)
+    assert passes == [(5000, 3), (5500, 3)]
+
+    grid = [(i, d, c) for i in [1, 3] for d in [0, 0.2] for c in [5000, 5500]]
+    values = formant_sweep.run_sweep(mapping.segments, measured_candidates, grid)
+    assert sorted(values) == sorted(formant_sweep.config_label(*x) for x in grid)
+    for i in [1, 3]:
+        low = values[formant_sweep.config_label(i, 0, 5000)]
+        high = values[formant_sweep.config_label(i, 0, 5500)]
+        np.testing.assert_allclose(low, high * 5000 / 5500)
+        expected = formant_sweep.run_sweep(mapping.segments, {5500: candidates}, [(i, 0, 5500)])
+        np.testing.assert_allclose(high, expected[formant_sweep.config_label(i, 0, 5500)])
+
+
+def test_agrees_with_formant_analysis(load_synthetic, praat_path):
+    from polyglotdb import CorpusContext
+    from polyglotdb.acoustics.segments import generate_vowel_segments
+    import synthetic
+
+    config = load_synthetic('spade_tests_formants')
+    config.praat_path = praat_path
+    with CorpusContext(config) as c:
+        c.encode_type_subset('phone', synthetic.vowel_inventory, 'vowel')
+        mapping = generate_vowel_segments(c, duration_threshold=0.05, padding=formant_sweep.padding)
+        candidates = formant_sweep.measure_candidates(mapping, [5500], praat_path)
+        values = formant_sweep.run_sweep(mapping.segments, candidates, [(1, 0.05, 5500)])
+        values = values[formant_sweep.config_label(1, 0.05, 5500)]
+        refined.analyze_formant_points_refinement(c, 'vowel', duration_threshold=0.05, num_iterations=1)
+        q = c.query_graph(c.phone).filter(c.phone.subset == 'vowel')
+        stored = {r['id']: r for r in q.columns(c.phone.id.column_name('id'), c.phone.F1.column_name('F1'),
+                                                 c.phone.F2.column_name('F2'), c.phone.F3.column_name('F3'))}
+    for i, seg in enumerate(mapping.segments):
+        expected = [np.nan if stored[seg['id']][x] is None else stored[seg['id']][x] for x in ['F1', 'F2', 'F3']]
+        np.testing.assert_allclose(values[i][:3], expected, atol=1)
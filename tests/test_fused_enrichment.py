@@ -0,0 +1,48 @@
+import pytest
+
+import fused_enrichment
+import synthetic
+
+# One utterance of two words, the first with two syllables; syllables are linked to both their word and utterance
+tokens = {'u1': ('utterance', 0.0, 2.0, {}),
+          'w1': ('word', 0.0, 1.0, {'utterance': 'u1'}),
+          'w2': ('word', 1.0, 2.0, {'utterance': 'u1'}),
+          's1': ('syllable', 0.0, 0.5, {'word': 'w1', 'utterance': 'u1'}),
+          's2': ('syllable', 0.5, 1.0, {'word': 'w1', 'utterance': 'u1'}),
+          's3': ('syllable', 1.0, 2.0, {'word': 'w2', 'utterance': 'u1'}),
+          'u2': ('utterance', 3.0, 3.0, {})}
+by_type = {'utterance': ['u1', 'u2'], 'word': ['w1', 'w2'], 'syllable': ['s3', 's2', 's1']}
+
+
+def test_compute_property_groups_by_parent_of_higher_type():
+    assert fused_enrichment.compute_property(tokens, by_type, 'count', 'utterance', 'syllable') == {'u1': 3, 'u2': 0}
+    assert fused_enrichment.compute_property(tokens, by_type, 'count', 'word', 'syllable') == {'w1': 2, 'w2': 1}
+    assert fused_enrichment.compute_property(tokens, by_type, 'position', 'word', 'syllable') == {'s1': 1, 's2': 2,
+                                                                                                 's3': 1}
+    assert fused_enrichment.compute_property(tokens, by_type, 'rate', 'utterance', 'syllable') == {'u1': 1.5,
+                                                                                                  'u2': None}
+
+
+def test_matches_polyglotdb_encoders(load_synthetic):
+    from polyglotdb import CorpusContext
+    import common
+
+    config = load_synthetic('spade_tests_fused')
+    properties = [x[:4] for x in common.hierarchical_properties]
+    with CorpusContext(config) as c:
+        c.encode_pauses('^{}$'.format(synthetic.pause_label))
+        c.encode_utterances(min_pause_length=0.15)
+        c.encode_syllabic_segments(synthetic.vowel_inventory)
+        c.encode_syllables()
+        for kind, higher, lower, name in properties:
+            getattr(c, 'encode_' + kind)(higher, lower, 'expected_' + name)
+        fused_enrichment.encode_properties(c, properties)
+        for kind, higher, lower, name in properties:
+            target = lower if kind == 'position' else higher
+            statement = '''MATCH (n:{type}:{corpus}:speech)
+            RETURN n.{name} AS fused, n.expected_{name} AS expected'''.format(type=target,
+                                                                             corpus=c.cypher_safe_name, name=name)
+            rows = list(c.execute_cypher(statement))
+            assert rows
+            for r in rows:
+                assert r['fused'] == pytest.approx(r['expected']), (kind, higher, lower)
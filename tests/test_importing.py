@@ -0,0 +1,160 @@
+from types import SimpleNamespace
+
+import pytest
+
+from polyglotdb.exceptions import ParseError
+
+import importing
+
+
+class Parser(object):
+    # Parses every file's types, but fails on the discourses named in broken
+    name = 'test'
+    hierarchy = None
+
+    def __init__(self, broken):
+        self.broken = broken
+
+    def parse_information(self, path, corpus_name):
+        return {'speakers': ['s1'], 'types': {}, 'type_headers': {'word': []}, 'token_headers': {},
+                'subannotations': {}}
+
+    def parse_discourse(self, path):
+        if path in self.broken:
+            raise ParseError('unreadable')
+        return SimpleNamespace(name=path)
+
+
+class Corpus(object):
+    corpus_name = 'test'
+
+    def __init__(self):
+        self.discourses = []
+
+    def initialize_import(self, *args):
+        pass
+
+    def add_types(self, *args):
+        pass
+
+    def add_discourse(self, data):
+        self.discourses.append(data.name)
+
+    def finalize_import(self, *args):
+        pass
+
+
+def test_discourse_failing_after_first_pass_stops_the_batch():
+    c = Corpus()
+    batches = []
+    with pytest.raises(ParseError, match='b.TextGrid'):
+        importing.load_discourses(c, Parser({'b.TextGrid'}), ['a.TextGrid', 'b.TextGrid', 'c.TextGrid'],
+                                  batch_size=3, on_batch=batches.append)
+    assert c.discourses == ['a.TextGrid']
+    assert batches == []
+
+
+class Recorder(object):
+    cypher_safe_name = '`test`'
+
+    def __init__(self):
+        self.statements = []
+
+    def execute_cypher(self, statement, **parameters):
+        self.statements.append((statement, parameters))
+
+
+def test_ancestor_links_limited_to_batch():
+    c = Recorder()
+    batch = importing.BatchImport(c, ['d1', 'd2'])
+    assert batch.cypher_safe_name == '`test`'
+    batch.execute_cypher('MATCH (n:`test`) RETURN n', limit=1)
+    batch.execute_cypher('''MATCH (subunit:`test`:speech)-[:contained_by*2..]->(superunit:`test`:speech)
+    with subunit, superunit
+    CREATE (subunit)-[:contained_by]->(superunit)''')
+    assert c.statements[0] == ('MATCH (n:`test`) RETURN n', {'limit': 1})
+    statement, parameters = c.statements[1]
+    assert 'MERGE (subunit)-[:contained_by]->(superunit)' in statement and 'CREATE' not in statement
+    assert parameters == {'discourses': ['d1', 'd2']}
+
+
+def test_checkpoint_resumes_with_uncommitted_files(synthetic_corpus):
+    import polyglotdb.io as pgio
+
+    paths = importing.discourse_files(pgio.inspect_mfa(synthetic_corpus), synthetic_corpus)
+    manifest = importing.build_manifest(synthetic_corpus, paths)
+    committed = sorted(manifest)[:1]
+    checkpoint = {k: manifest[k] for k in committed}
+    new, changed, removed = importing.compare_manifests(checkpoint, manifest)
+    assert new == sorted(manifest)[1:]
+    assert changed == removed == []
+
+
+def annotations(c):
+    statement = '''MATCH (n:{corpus})-[:spoken_in]->(d:Discourse:{corpus}), (n)-[:spoken_by]->(s:Speaker:{corpus})
+    RETURN d.name AS discourse, s.name AS speaker, labels(n) AS types, n.label AS label, n.begin AS begin,
+    n.end AS end'''.format(corpus=c.cypher_safe_name)
+    return sorted((r['discourse'], r['speaker'], sorted(r['types']), r['label'], r['begin'], r['end'])
+                  for r in c.execute_cypher(statement))
+
+
+def test_batched_resumed_import_matches_load(load_synthetic, synthetic_corpus, tmp_path):
+    import polyglotdb.io as pgio
+    from polyglotdb import CorpusContext
+
+    with CorpusContext(load_synthetic('spade_tests_importing')) as c:
+        expected = annotations(c)
+        hierarchy = c.hierarchy.to_json()
+        c.reset()
+        parser = pgio.inspect_mfa(synthetic_corpus)
+        paths = importing.discourse_files(parser, synthetic_corpus)
+        # An import interrupted after its first batch committed and while adding the second
+        importing.load_discourses(c, parser, paths[:2], batch_size=1, word_tier_dir=str(tmp_path))
+        c.remove_discourse(importing.discourse_name(paths[1]))
+        batches = []
+        importing.load_discourses(c, parser, paths[1:], batch_size=1, on_batch=batches.append,
+                                  word_tier_dir=str(tmp_path))
+        assert batches == [[x] for x in paths[1:]]
+        assert expected
+        assert annotations(c) == expected
+        assert c.hierarchy.to_json() == hierarchy
+
+
+def contained_by(c, discourses):
+    statement = '''MATCH (n:{corpus}:speech)-[:spoken_in]->(d:Discourse:{corpus})
+    WHERE d.name IN $discourses
+    MATCH (n)-[r:contained_by]->()
+    RETURN count(r) AS n'''.format(corpus=c.cypher_safe_name)
+    return c.execute_cypher(statement, discourses=discourses)[0]['n']
+
+
+def duplicate_links(c):
+    statement = '''MATCH (a:{corpus})-[r:contained_by]->(b)
+    WITH a, b, count(r) AS n WHERE n > 1
+    RETURN count(*) AS n'''.format(corpus=c.cypher_safe_name)
+    return c.execute_cypher(statement)[0]['n']
+
+
+def test_second_batch_leaves_earlier_links_alone(load_synthetic, synthetic_corpus, tmp_path):
+    import polyglotdb.io as pgio
+    from polyglotdb import CorpusContext
+
+    import synthetic
+
+    with CorpusContext(load_synthetic('spade_tests_batch_links')) as c:
+        parser = pgio.inspect_mfa(synthetic_corpus)
+        paths = importing.discourse_files(parser, synthetic_corpus)
+        first = [importing.discourse_name(x) for x in paths[:2]]
+        second = [importing.discourse_name(x) for x in paths[2:]]
+        expected = contained_by(c, second)
+        c.reset()
+        importing.load_discourses(c, parser, paths[:2])
+        # Utterances give the first batch's phones ancestors two levels up
+        c.encode_pauses('^{}$'.format(synthetic.pause_label))
+        c.encode_utterances(min_pause_length=0.15)
+        links = contained_by(c, first)
+        importing.load_discourses(c, parser, paths[2:])
+        assert expected
+        assert contained_by(c, second) == expected
+        assert contained_by(c, first) == links
+        assert duplicate_links(c) == 0
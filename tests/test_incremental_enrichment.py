@@ -0,0 +1,81 @@
+import synthetic
+import syllabification
+
+
+def syllables(c):
+    statement = '''MATCH (s:syllable:{corpus}:speech)-[:spoken_in]->(d:Discourse:{corpus})
+    RETURN d.name AS discourse, s.label AS label, s.begin AS begin, s.end AS end,
+    s.onset_labels AS onset, s.coda_labels AS coda'''.format(corpus=c.cypher_safe_name)
+    return sorted(tuple(r.values()) for r in c.execute_cypher(statement))
+
+
+def test_new_discourses_syllabified_as_whole_corpus(load_synthetic, tmp_path):
+    from polyglotdb import CorpusContext
+
+    config = load_synthetic('spade_tests_incremental')
+    with CorpusContext(config) as c:
+        c.encode_pauses('^{}$'.format(synthetic.pause_label))
+        c.encode_utterances(min_pause_length=0.15)
+        c.encode_syllabic_segments(synthetic.vowel_inventory)
+        discourses = sorted(c.discourses)
+        half = len(discourses) // 2
+        cache_dir = str(tmp_path)
+        assert syllabification.encode_syllables(c, synthetic.vowel_inventory, cache_dir,
+                                                discourses=discourses[:half])
+        syllabification.encode_syllable_structure(c, discourses=discourses[:half])
+        assert syllabification.encode_syllables(c, synthetic.vowel_inventory, cache_dir,
+                                                discourses=discourses[half:])
+        syllabification.encode_syllable_structure(c, discourses=discourses[half:])
+        incremental = syllables(c)
+        syllabification.encode_syllables(c, synthetic.vowel_inventory, cache_dir)
+        syllabification.encode_syllable_structure(c)
+        assert incremental
+        assert incremental == syllables(c)
+
+
+def relationships(c):
+    statement = '''MATCH (a:{corpus})-[r]->(b:{corpus})
+    RETURN type(r) AS type, count(r) AS n'''.format(corpus=c.cypher_safe_name)
+    return sorted((r['type'], r['n']) for r in c.execute_cypher(statement))
+
+
+def annotations(c):
+    # Every token with its labels and properties, except for ids, which differ between imports
+    statement = '''MATCH (n:{corpus})-[:spoken_in]->(d:Discourse:{corpus})
+    RETURN d.name AS discourse, [x IN labels(n) WHERE x <> $corpus] AS types,
+    [k IN keys(n) WHERE NOT k IN ['id', 'type_id'] | [k, n[k]]] AS properties'''.format(corpus=c.cypher_safe_name)
+    return sorted((r['discourse'], sorted(r['types']), sorted(r['properties']))
+                  for r in c.execute_cypher(statement, corpus=c.corpus_name))
+
+
+def test_update_matches_full_enrichment(database, synthetic_corpus, tmp_path, monkeypatch):
+    import polyglotdb.io as pgio
+    from polyglotdb import CorpusConfig, CorpusContext
+
+    import common
+    import importing
+    import telemetry
+
+    monkeypatch.setattr(common, 'base_dir', str(tmp_path))
+    monkeypatch.setattr(common, 'syllabification_cache_dir', str(tmp_path / 'syllabification'))
+    monkeypatch.setattr(telemetry, 'telemetry_path', str(tmp_path / 'telemetry.jsonl'))
+    parser = pgio.inspect_mfa(synthetic_corpus)
+    paths = importing.discourse_files(parser, synthetic_corpus)
+    pauses = '^{}$'.format(synthetic.pause_label)
+    results = []
+    # The whole corpus at once, or half of it enriched before the other half is imported
+    for name, batches in [('spade_tests_full', [paths]), ('spade_tests_update', [paths[:2], paths[2:]])]:
+        config = CorpusConfig(name, **database)
+        with CorpusContext(config) as c:
+            c.reset()
+        for i, batch in enumerate(batches):
+            with CorpusContext(config) as c:
+                importing.load_discourses(c, parser, batch, word_tier_dir=common.word_tiers_path(name))
+            if i == 0:
+                common.basic_enrichment(config, synthetic.vowel_inventory, pauses)
+            else:
+                common.update_basic_enrichment(config, synthetic.vowel_inventory, pauses)
+        with CorpusContext(config) as c:
+            results.append((relationships(c), annotations(c)))
+    assert results[0][1]
+    assert results[0] == results[1]
@@ -0,0 +1,53 @@
+import csv
+
+from polyglotdb.io.enrichment.helper import parse_file
+
+import synthetic
+import lexicon_store
+
+
+def write_lexicon(path):
+    # The synthetic lexicon plus words that the corpus doesn't use
+    words = sorted(synthetic.lexicon) + ['UNUSED', 'ALSO_UNUSED']
+    with open(path, 'w', encoding='utf8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Word', 'stresspattern', 'frequency', 'function_word'])
+        for i, w in enumerate(words):
+            vowels = [x for x in synthetic.lexicon.get(w, ['AH1']) if x[-1].isdigit()]
+            writer.writerow([w, '-'.join(x[-1] for x in vowels), i * 1.5, i % 2 == 0])
+
+
+def test_lookup_matches_parse_file(tmp_path):
+    csv_path = str(tmp_path / 'lexicon.csv')
+    write_lexicon(csv_path)
+    labels = [x.lower() for x in synthetic.lexicon]
+    expected, expected_types = parse_file(csv_path, labels=labels, case_sensitive=False)
+    store = lexicon_store.open_store(str(tmp_path / 'store'), csv_path)
+    data, type_data = lexicon_store.lookup(store, list(synthetic.lexicon))
+    assert len(data) == len(synthetic.lexicon)
+    assert data == expected
+    assert type_data == expected_types
+
+
+def word_types(c, names):
+    statement = '''MATCH (t:{word}_type:{corpus})
+    RETURN t.label AS label, {columns}'''.format(word=c.word_name, corpus=c.cypher_safe_name,
+                                                 columns=', '.join('t.{0} AS {0}'.format(x) for x in names))
+    return sorted(tuple(r.values()) for r in c.execute_cypher(statement))
+
+
+def test_matches_enrich_lexicon_from_csv(load_synthetic, tmp_path):
+    from polyglotdb import CorpusContext
+
+    csv_path = str(tmp_path / 'lexicon.csv')
+    write_lexicon(csv_path)
+    names = ['stresspattern', 'frequency', 'function_word']
+    config = load_synthetic('spade_tests_lexicon')
+    with CorpusContext(config) as c:
+        c.enrich_lexicon_from_csv(csv_path)
+        expected = word_types(c, names)
+        c.hierarchy.remove_type_properties(c, c.word_name, names)
+        c.encode_hierarchy()
+        assert lexicon_store.enrich_lexicon(c, str(tmp_path / 'store'), csv_path) == len(synthetic.lexicon)
+        assert word_types(c, names) == expected
+        assert c.hierarchy.has_type_property(c.word_name, 'stresspattern')
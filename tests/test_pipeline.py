@@ -0,0 +1,110 @@
+import json
+
+from pipeline import Pipeline
+
+
+def build(state_path, calls, settings, files=None, always=False):
+    # import -> enrichment -> analysis, with export also depending on enrichment only
+    def stage(name):
+        return lambda: calls.append((name, 'run'))
+
+    def update(name):
+        return lambda: calls.append((name, 'update'))
+
+    def invalidate(name):
+        return lambda: calls.append((name, 'invalidate'))
+
+    pipeline = Pipeline(str(state_path))
+    pipeline.add_stage('import', stage('import'), inputs=lambda: {'files': settings['files']},
+                       invalidate=invalidate('import'), update=update('import'), always=always)
+    pipeline.add_stage('enrichment', stage('enrichment'), depends=['import'], files=files,
+                       inputs={'pauses': settings['pauses']}, invalidate=invalidate('enrichment'),
+                       update=update('enrichment'))
+    pipeline.add_stage('analysis', stage('analysis'), depends=['enrichment'],
+                       inputs={'vowels': settings['vowels']}, invalidate=invalidate('analysis'))
+    pipeline.add_stage('export', stage('export'), depends=['enrichment'], inputs={})
+    return pipeline
+
+
+def test_unchanged_stages_are_skipped(tmp_path):
+    settings = {'files': ['a'], 'pauses': 'sil', 'vowels': ['IY1']}
+    calls = []
+    build(tmp_path / 'state.json', calls, settings).run()
+    assert calls == [('import', 'run'), ('enrichment', 'run'), ('analysis', 'run'), ('export', 'run')]
+    calls.clear()
+    # A new pipeline reads the state saved by the previous run
+    build(tmp_path / 'state.json', calls, settings).run()
+    assert calls == []
+
+
+def test_changed_inputs_invalidate_downstream_stages(tmp_path):
+    settings = {'files': ['a'], 'pauses': 'sil', 'vowels': ['IY1']}
+    calls = []
+    build(tmp_path / 'state.json', calls, settings).run()
+    calls.clear()
+    settings['pauses'] = 'sp'
+    build(tmp_path / 'state.json', calls, settings).run()
+    assert calls == [('enrichment', 'invalidate'), ('enrichment', 'run'), ('analysis', 'invalidate'),
+                     ('analysis', 'run'), ('export', 'run')]
+    calls.clear()
+    settings['vowels'] = ['IY1', 'UW1']
+    build(tmp_path / 'state.json', calls, settings).run()
+    assert calls == [('analysis', 'invalidate'), ('analysis', 'run')]
+
+
+def test_changed_files_invalidate(tmp_path):
+    settings = {'files': ['a'], 'pauses': 'sil', 'vowels': ['IY1']}
+    path = tmp_path / 'lexicon.csv'
+    path.write_text('word,stress\n')
+    calls = []
+    build(tmp_path / 'state.json', calls, settings, files=[str(path)]).run()
+    calls.clear()
+    path.write_text('word,stress\nsee,1\n')
+    build(tmp_path / 'state.json', calls, settings, files=[str(path)]).run()
+    assert calls[:2] == [('enrichment', 'invalidate'), ('enrichment', 'run')]
+
+
+def test_update_preferred_when_only_dependencies_changed(tmp_path):
+    settings = {'files': ['a'], 'pauses': 'sil', 'vowels': ['IY1']}
+    calls = []
+    build(tmp_path / 'state.json', calls, settings).run()
+    calls.clear()
+    settings['files'] = ['a', 'b']
+    build(tmp_path / 'state.json', calls, settings).run()
+    # Import's own inputs changed, enrichment only depends on it; stages without an update are rerun
+    assert calls == [('import', 'invalidate'), ('import', 'run'), ('enrichment', 'update'),
+                     ('analysis', 'invalidate'), ('analysis', 'run'), ('export', 'run')]
+
+
+def test_always_stages_run_every_time(tmp_path):
+    settings = {'files': ['a'], 'pauses': 'sil', 'vowels': ['IY1']}
+    calls = []
+    build(tmp_path / 'state.json', calls, settings, always=True).run()
+    calls.clear()
+    pipeline = build(tmp_path / 'state.json', calls, settings, always=True)
+    assert pipeline.pending_stages() == ['import']
+    pipeline.run()
+    assert calls == [('import', 'update')]
+
+
+def test_targets_run_their_dependencies_only(tmp_path):
+    settings = {'files': ['a'], 'pauses': 'sil', 'vowels': ['IY1']}
+    calls = []
+    build(tmp_path / 'state.json', calls, settings).run(['export'])
+    assert calls == [('import', 'run'), ('enrichment', 'run'), ('export', 'run')]
+
+
+def test_state_file_survives_reruns(tmp_path):
+    settings = {'files': ['a'], 'pauses': 'sil', 'vowels': ['IY1']}
+    state_path = tmp_path / 'state.json'
+    build(state_path, [], settings).run()
+    with open(str(state_path), encoding='utf8') as f:
+        state = json.load(f)
+    assert sorted(state) == ['analysis', 'enrichment', 'export', 'import']
+    build(state_path, [], settings).run()
+    with open(str(state_path), encoding='utf8') as f:
+        assert json.load(f) == state
+    pipeline = build(state_path, [], settings)
+    pipeline.clear()
+    assert not state_path.exists()
+    assert pipeline.pending_stages() == ['import', 'enrichment', 'analysis', 'export']
@@ -0,0 +1,69 @@
+import pytest
+
+import planning
+
+
+def row(task, size, value, computer='here'):
+    return {'computer': computer, 'corpus': 'c', 'task': task, 'size': size, 'value': value}
+
+
+def test_fit_recovers_line():
+    a, b = planning.fit([row('import', x, 5 + 0.5 * x) for x in [10, 20, 40]])
+    assert a == pytest.approx(5)
+    assert b == pytest.approx(0.5)
+
+
+def test_fit_through_origin_for_one_size():
+    assert planning.fit([row('import', 10, 4), row('import', 10, 6)]) == (0.0, pytest.approx(0.5))
+
+
+def test_fit_through_origin_for_negative_intercept_or_slope():
+    # Least squares through the origin: sum(size * value) / sum(size ** 2)
+    assert planning.fit([row('import', 10, 1), row('import', 20, 10)]) == (0.0, pytest.approx(210 / 500))
+    assert planning.fit([row('import', 10, 10), row('import', 20, 5)]) == (0.0, pytest.approx(200 / 500))
+
+
+def test_estimate_prefers_own_computer():
+    rows = [row('import', 10, 10), row('import', 20, 20), row('import', 10, 100, 'other')]
+    assert planning.estimate_task(rows, 'import', 30, 'here') == (pytest.approx(30), 2, True)
+    # A new computer is fitted to every run, here through the origin as the slope is negative
+    assert planning.estimate_task(rows, 'import', 30, 'new') == (pytest.approx(30 * 1500 / 600), 3, False)
+
+
+def test_estimate_falls_back_to_separate_encodings():
+    encodings = planning.task_fallbacks['fused_enrichment']
+    rows = [row(task, size, size * (i + 1)) for i, task in enumerate(encodings) for size in [10, 20]]
+    rows.append(row(encodings[0], 30, 30))
+    seconds, runs, own = planning.estimate_task(rows, 'fused_enrichment', 100, 'here')
+    assert seconds == pytest.approx(100 * sum(range(1, len(encodings) + 1)))
+    assert (runs, own) == (2, True)
+    # Fused enrichment's own history is used once there is some
+    rows.append(row('fused_enrichment', 10, 1))
+    assert planning.estimate_task(rows, 'fused_enrichment', 100, 'here') == (pytest.approx(10), 1, True)
+
+
+def test_no_history():
+    assert planning.estimate_task([], 'fused_enrichment', 100, 'here') is None
+    assert planning.estimate_stage([row('import', 10, 10)], 'formant_export', 100, 'here') is None
+
+
+def test_stage_sums_its_tasks():
+    rows = [row('sibilant_encoding', 10, 1), row('sibilant_acoustic_analysis', 10, 9, 'other')]
+    assert planning.estimate_stage(rows, 'sibilant_acoustic_analysis', 20, 'here') == (pytest.approx(20), 1, False)
+    assert planning.estimate_stage(rows, 'sibilant_acoustic_analysis', 20, 'here', combine=max)[0] == \
+        pytest.approx(18)
+
+
+def test_recommended_workers():
+    assert planning.recommended_workers(10, cpus=8) == 1
+    assert planning.recommended_workers(3 * planning.minimum_worker_seconds + 1, cpus=8) == 3
+    assert planning.recommended_workers(100 * planning.minimum_worker_seconds, cpus=8) == 8
+
+
+def test_load_history_skips_unimported_corpora(tmp_path):
+    path = tmp_path / 'benchmarks.csv'
+    path.write_text('Computer,Corpus,Date,Corpus_size,Task,Time\n'
+                    'here,c,2026-1-1,120.5,import,30\n'
+                    'here,c,2026-1-1,None,import,30\n'
+                    'here,c,2026-1-1,0,import,30\n')
+    assert planning.load_history(str(path)) == [row('import', 120.5, 30.0)]
@@ -0,0 +1,105 @@
+import io
+
+import pytest
+
+import progress
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Sink(object):
+    def __init__(self):
+        self.events = []
+
+    def handle(self, event):
+        self.events.append(event)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(progress.time, 'time', clock)
+    return clock
+
+
+def test_counts_throttled_to_interval(clock):
+    sink = Sink()
+    reporter = progress.Progress([sink], interval=1)
+    reporter(0, 10)
+    for i in range(1, 10):
+        clock.now += 0.25
+        reporter(i)
+    # One event per second of updates, besides the one setting the total
+    assert [e['done'] for e in sink.events] == [0, 4, 8]
+    # The last item is always reported
+    clock.now += 0.1
+    reporter(10)
+    assert sink.events[-1]['done'] == 10
+    # Messages are never throttled
+    reporter('Working')
+    reporter('Still working')
+    assert [e['message'] for e in sink.events[-2:]] == ['Working', 'Still working']
+
+
+def test_rate_and_eta(clock):
+    sink = Sink()
+    reporter = progress.Progress([sink], interval=0)
+    reporter(0, 100)
+    assert sink.events[-1]['rate'] is None and sink.events[-1]['eta'] is None
+    clock.now += 10
+    reporter(25)
+    assert sink.events[-1]['rate'] == pytest.approx(2.5)
+    assert sink.events[-1]['eta'] == pytest.approx(30)
+    clock.now += 30
+    reporter(100)
+    assert sink.events[-1]['eta'] == pytest.approx(0)
+    # Without a total there is a rate but no ETA
+    reporter(0, None)
+    clock.now += 4
+    reporter(2)
+    assert sink.events[-1]['rate'] == pytest.approx(0.5)
+    assert sink.events[-1]['eta'] is None
+
+
+def test_nested_stage_restores_outer(clock):
+    sink = Sink()
+    reporter = progress.Progress([sink], interval=0)
+    with reporter.stage('corpus', 'outer'):
+        reporter(0, 10)
+        clock.now += 5
+        reporter(5)
+        with reporter.stage('corpus', 'inner'):
+            reporter(0, 2)
+            reporter('Inner')
+            clock.now += 1
+            reporter(2)
+        assert (reporter.stage_name, reporter.done, reporter.total, reporter.message_text) == ('outer', 5, 10, None)
+        reporter(6)
+        # The outer stage's rate still counts from its own start
+        assert sink.events[-1]['stage'] == 'outer'
+        assert sink.events[-1]['rate'] == pytest.approx(1)
+    assert reporter.stage_name is None and reporter.corpus is None
+    assert [(e['event'], e['stage']) for e in sink.events if e['event'] in ('start', 'end')] == [
+        ('start', 'outer'), ('start', 'inner'), ('end', 'inner'), ('end', 'outer')]
+
+
+def test_terminal_sink_prints_periodically_without_terminal(clock):
+    stream = io.StringIO()
+    reporter = progress.Progress([progress.TerminalSink(stream, interval=10)], interval=0)
+    with reporter.stage('corpus', 'import'):
+        reporter(0, 4)
+        for i in range(1, 5):
+            clock.now += 4
+            reporter(i)
+    lines = stream.getvalue().splitlines()
+    # The first count, the one ten seconds later and the last
+    assert [line.split()[2] for line in lines] == ['0/4', '3/4', '4/4']
@@ -0,0 +1,51 @@
+import query_cache
+
+
+class Results(list):
+    columns = ['label', 'begin']
+
+
+class Query(object):
+    # Stands in for a PolyglotDB query, counting how many times it is run
+    def __init__(self, statement, rows):
+        self.statement = statement
+        self.rows = rows
+        self.runs = 0
+
+    def cypher(self):
+        return self.statement
+
+    def cypher_params(self):
+        return {}
+
+    def all(self):
+        self.runs += 1
+        return Results(dict(zip(Results.columns, r)) for r in self.rows)
+
+
+def test_results_read_back_from_cache(tmp_path):
+    q = Query('MATCH (n) RETURN n.label AS label, n.begin AS begin', [('S', 0.5), ('SH', None)])
+    cache = query_cache.QueryCache(str(tmp_path), 'version')
+    expected = list(q.all())
+    for _ in range(2):
+        assert list(cache.results(q)) == expected
+    assert q.runs == 2
+    assert (cache.hits, cache.misses) == (1, 1)
+    # A new version of the corpus runs the query again
+    assert list(query_cache.QueryCache(str(tmp_path), 'other').results(q)) == expected
+    assert q.runs == 3
+
+
+def test_matches_direct_query(load_synthetic, tmp_path):
+    from polyglotdb import CorpusContext
+
+    with CorpusContext(load_synthetic('spade_tests_query_cache')) as c:
+        q = c.query_graph(c.phone).order_by(c.phone.begin)
+        q = q.columns(c.phone.label.column_name('phone_label'), c.phone.begin.column_name('begin'),
+                      c.phone.word.label.column_name('word_label'), c.phone.speaker.name.column_name('speaker'))
+        expected = [dict(r) for r in q.all()]
+        cache = query_cache.QueryCache(str(tmp_path), query_cache.corpus_version(c, str(tmp_path / 'state.json')))
+        for _ in range(2):
+            assert list(cache.results(q)) == expected
+        assert expected
+        assert (cache.hits, cache.misses) == (1, 1)
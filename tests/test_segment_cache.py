@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+
+import synthetic
+import sibilant_measures
+from segment_cache import SegmentCache
+
+tokens = [('p1', 0.1, 0.25, 0), ('p2', 0.5, 0.62, 0)]
+
+
+def write_audio(path, seed, mtime):
+    rng = np.random.default_rng(seed)
+    synthetic.write_wav(path, rng.uniform(-0.5, 0.5, synthetic.sampling_rate))
+    os.utime(path, (mtime, mtime))
+
+
+def assert_matches_source(reader, path, token_list):
+    for token_id, begin, end, channel in token_list:
+        signal, sr = reader.read(token_id, begin, end)
+        expected, expected_sr = sibilant_measures.read_segment(path, begin, end, channel)
+        assert sr == expected_sr
+        np.testing.assert_allclose(signal, expected, rtol=0, atol=1e-7)
+
+
+def test_round_trip_memory_mapped(tmp_path):
+    path = str(tmp_path / 'd1.wav')
+    write_audio(path, 0, 1000000)
+    cache = SegmentCache(str(tmp_path / 'cache'))
+    reader = cache.open(path, tokens)
+    assert isinstance(reader.data, np.memmap)
+    assert_matches_source(reader, path, tokens)
+    # A window inside a token is a slice of it
+    signal, _ = reader.read('p1', 0.15, 0.2)
+    full, _ = reader.read('p1', 0.1, 0.25)
+    start = int(round(0.15 * synthetic.sampling_rate)) - int(round(0.1 * synthetic.sampling_rate))
+    np.testing.assert_array_equal(signal, full[start:start + len(signal)])
+    # Read back from disk by a new cache
+    reader = SegmentCache(str(tmp_path / 'cache')).open(path, tokens)
+    assert_matches_source(reader, path, tokens)
+
+
+def test_changed_audio_rebuilds_shard(tmp_path):
+    path = str(tmp_path / 'd1.wav')
+    write_audio(path, 0, 1000000)
+    cache = SegmentCache(str(tmp_path / 'cache'))
+    cache.open(path, tokens)
+    write_audio(path, 1, 2000000)
+    assert cache.load_index(path) is None
+    assert_matches_source(cache.open(path, tokens), path, tokens)
+
+
+def test_new_tokens_are_added_to_shard(tmp_path):
+    path = str(tmp_path / 'd1.wav')
+    write_audio(path, 0, 1000000)
+    cache = SegmentCache(str(tmp_path / 'cache'))
+    cache.open(path, tokens[:1])
+    reader = cache.open(path, tokens[1:])
+    assert sorted(reader.index['tokens']) == ['p1', 'p2']
+    assert_matches_source(reader, path, tokens)
+
+
+def test_least_recently_used_shards_evicted(tmp_path):
+    paths = [str(tmp_path / 'd{}.wav'.format(i)) for i in range(3)]
+    cache = SegmentCache(str(tmp_path / 'cache'))
+    for i, path in enumerate(paths):
+        write_audio(path, i, 1000000)
+        cache.open(path, tokens)
+        data_path = cache.shard_paths(path)[0]
+        os.utime(data_path, (1000000 + i, 1000000 + i))
+    shard_size = cache.size() // 3
+    cache.max_bytes = 2 * shard_size
+    cache.enforce_limit()
+    assert cache.load_index(paths[0]) is None
+    assert cache.load_index(paths[1]) is not None and cache.load_index(paths[2]) is not None
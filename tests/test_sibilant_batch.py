@@ -0,0 +1,67 @@
+import os
+import csv
+import sys
+
+import pytest
+
+import sibilant_batch
+from test_sibilant_measures import sibilant_tokens, praat_measures
+
+# Stands in for Praat running sibilant_jane_batch.praat: measures every token of the table from its id
+fake_praat = '''#!{python}
+import csv
+import sys
+
+_, _, script, filename, token_table, output_table = sys.argv
+with open(token_table, encoding='utf8') as f:
+    tokens = list(csv.DictReader(f, delimiter='\\t'))
+with open(output_table, 'w', encoding='utf8', newline='') as f:
+    writer = csv.writer(f, delimiter='\\t')
+    writer.writerow(['id', 'peak', 'slope', 'cog', 'spread'])
+    for t in tokens:
+        n = float(t['begin']) + float(t['end']) + int(t['channel'])
+        if filename.endswith('bad.wav'):
+            writer.writerow([t['id'], '--undefined--', n, n, n])
+        else:
+            writer.writerow([t['id'], 1000 * n, n, 2000 * n, 10 * n])
+'''
+
+
+def test_token_table_read_as_written(tmp_path):
+    tokens = [('p1', 0.1, 0.25, 0), ('p 2', 1.0 / 3, 12.5, 1)]
+    path = str(tmp_path / 'tokens.tsv')
+    sibilant_batch.write_token_table(path, tokens)
+    with open(path, encoding='utf8') as f:
+        rows = list(csv.DictReader(f, delimiter='\t'))
+    assert [(r['id'], float(r['begin']), float(r['end']), int(r['channel'])) for r in rows] == tokens
+
+
+def test_parse_output_skips_undefined(tmp_path):
+    path = str(tmp_path / 'output.tsv')
+    with open(path, 'w', encoding='utf8') as f:
+        f.write('id\tpeak\tslope\tcog\tspread\n')
+        f.write('p1\t5512.5\t-12.25\t6100.75\t1200.5\n')
+        f.write('p2\t--undefined--\t1.0\t2.0\t3.0\n')
+    assert sibilant_batch.parse_output(path) == {'p1': {'peak': 5512.5, 'slope': -12.25, 'cog': 6100.75,
+                                                        'spread': 1200.5}}
+
+
+def test_one_praat_call_per_file(tmp_path):
+    praat = tmp_path / 'praat'
+    praat.write_text(fake_praat.format(python=sys.executable))
+    os.chmod(str(praat), 0o755)
+    tokens = [('a1', 'a.wav', 0.5, 0.75, 0), ('b1', 'bad.wav', 0.1, 0.2, 0), ('a2', 'a.wav', 1.0, 1.5, 1)]
+    output = sibilant_batch.analyze_tokens(str(praat), tokens)
+    assert output == {'a1': {'peak': 1250.0, 'slope': 1.25, 'cog': 2500.0, 'spread': 12.5},
+                      'a2': {'peak': 3500.0, 'slope': 3.5, 'cog': 7000.0, 'spread': 35.0}}
+
+
+def test_matches_per_token_script(synthetic_corpus, praat_path):
+    tokens = sibilant_tokens(synthetic_corpus)
+    output = sibilant_batch.analyze_tokens(praat_path, [x[:5] for x in tokens])
+    assert len(output) == len(tokens)
+    for token_id, path, begin, end, channel, _ in tokens:
+        expected = praat_measures(praat_path, path, begin, end)
+        for measure, value in expected.items():
+            # Both scripts write four decimals
+            assert output[token_id][measure] == pytest.approx(value, abs=1e-4)
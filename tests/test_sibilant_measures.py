@@ -0,0 +1,54 @@
+import os
+import csv
+import subprocess
+
+import pytest
+
+import sibilant_measures
+import synthetic
+
+script_path = os.path.join(os.path.dirname(sibilant_measures.__file__), 'sibilant_jane_optimized.praat')
+
+
+def sibilant_tokens(corpus_dir, limit=40):
+    tokens = []
+    with open(os.path.join(corpus_dir, 'truth.csv'), 'r', encoding='utf8') as f:
+        for r in csv.DictReader(f):
+            if r['phone_label'] not in synthetic.sibilant_spectra:
+                continue
+            path = os.path.join(corpus_dir, r['speaker'], r['discourse'] + '.wav')
+            tokens.append(('{}_{}'.format(r['discourse'], len(tokens)), path, float(r['begin']), float(r['end']), 0,
+                           float(r['peak'])))
+    return tokens[:limit]
+
+
+def praat_measures(praat_path, path, begin, end):
+    output = subprocess.run([praat_path, '--run', script_path, path, str(begin), str(end), '0', '0'],
+                            stdout=subprocess.PIPE, check=True).stdout.decode('utf8').split()
+    header, values = output[:4], output[4:8]
+    return {k: float(v) for k, v in zip(header, values)}
+
+
+def test_peak_near_synthesized_spectrum(synthetic_corpus):
+    tokens = sibilant_tokens(synthetic_corpus)
+    output = sibilant_measures.analyze_tokens([x[:5] for x in tokens])
+    assert len(output) == len(tokens)
+    for token_id, path, begin, end, channel, true_peak in tokens:
+        # The noise is shaped by a Gaussian of width 700-900 Hz around its peak
+        assert abs(output[token_id]['peak'] - true_peak) < 1000
+
+
+def test_agrees_with_praat_script(synthetic_corpus, praat_path):
+    tokens = sibilant_tokens(synthetic_corpus)
+    output = sibilant_measures.analyze_tokens([x[:5] for x in tokens])
+    tolerance = sibilant_measures.praat_tolerance
+    for token_id, path, begin, end, channel, _ in tokens:
+        expected = praat_measures(praat_path, path, begin, end)
+        measured = output[token_id]
+        window_begin, window_end = sibilant_measures.measure_window(begin, end)
+        num_samples = int(round((window_end - window_begin) * synthetic.sampling_rate))
+        bin_width = synthetic.sampling_rate / sibilant_measures.next_power_of_two(num_samples)
+        assert measured['cog'] == pytest.approx(expected['cog'], rel=tolerance['cog'])
+        assert measured['spread'] == pytest.approx(expected['spread'], rel=tolerance['spread'])
+        assert abs(measured['peak'] - expected['peak']) <= tolerance['peak'] * bin_width
+        assert abs(measured['slope'] - expected['slope']) <= tolerance['slope']
@@ -0,0 +1,38 @@
+import synthetic
+import syllabification
+
+
+def test_cache_reuses_syllabifications(tmp_path):
+    syllabics = set(synthetic.vowel_inventory)
+    transcriptions = set(tuple(x) for x in synthetic.lexicon.values())
+    onsets = syllabification.find_onsets(transcriptions, syllabics)
+    cache = syllabification.SyllabificationCache(str(tmp_path), syllabics, onsets)
+    expected = {x: cache.get(x) for x in transcriptions}
+    cache.save()
+    cache = syllabification.SyllabificationCache(str(tmp_path), syllabics, onsets)
+    assert {x: cache.get(x) for x in transcriptions} == expected
+    assert cache.hits == len(transcriptions) and cache.misses == 0
+
+
+def syllables(c):
+    statement = '''MATCH (s:syllable:{corpus})-[:spoken_in]->(d:Discourse:{corpus})
+    MATCH (p:{phone}:{corpus})-[:contained_by]->(s)
+    WITH d, s, p ORDER BY p.begin
+    RETURN d.name AS discourse, s.label AS label, s.begin AS begin, s.end AS end,
+    collect([p.label, p.syllable_position]) AS phones'''.format(phone=c.phone_name, corpus=c.cypher_safe_name)
+    return sorted((r['discourse'], r['begin'], r['end'], r['label'], r['phones']) for r in c.execute_cypher(statement))
+
+
+def test_matches_polyglotdb_maxonset(load_synthetic, tmp_path):
+    from polyglotdb import CorpusContext
+
+    config = load_synthetic('spade_tests_syllabification')
+    with CorpusContext(config) as c:
+        c.encode_syllabic_segments(synthetic.vowel_inventory)
+        c.encode_syllables()
+        expected = syllables(c)
+        # Twice, the second time with every syllabification from the cache
+        for _ in range(2):
+            syllabification.encode_syllables(c, synthetic.vowel_inventory, str(tmp_path))
+            assert expected
+            assert syllables(c) == expected
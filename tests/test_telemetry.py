@@ -0,0 +1,34 @@
+import time
+
+import pytest
+
+import telemetry
+
+
+def test_stage_peak_is_sampled_per_stage():
+    pytest.importorskip('psutil')
+    np = pytest.importorskip('numpy')
+    with telemetry.stage('test', 'heavy') as heavy:
+        data = np.ones(200 * 1024 * 1024 // 8)
+        time.sleep(0.5)
+        del data
+    with telemetry.stage('test', 'light') as light:
+        time.sleep(0.5)
+    # The light stage runs after the allocation was freed and is not charged for it
+    assert heavy['stage_peak_rss_mb'] - light['stage_peak_rss_mb'] > 150
+    assert light['process_max_rss_mb'] >= heavy['stage_peak_rss_mb'] - 1
+
+
+def test_queries_counted_across_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    class Context(object):
+        def execute_cypher(self, statement):
+            return statement
+
+    telemetry.install_query_counter(Context)
+    c = Context()
+    with telemetry.stage('test', 'threads') as record:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: [c.execute_cypher('RETURN 1') for _ in range(2000)], range(8)))
+    assert record['queries'] == 16000
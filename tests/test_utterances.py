@@ -0,0 +1,104 @@
+import re
+
+import numpy as np
+import pytest
+
+import utterances
+
+pauses = '^<sil>$'
+
+
+def word_table(words):
+    # (id, label, begin, end, speaker) tuples as saved at import
+    ids, labels, begins, ends, speakers = zip(*words)
+    return {'id': np.array(ids), 'label': np.array(labels), 'begin': np.array(begins, dtype=np.float64),
+            'end': np.array(ends, dtype=np.float64), 'speaker': np.array(speakers)}
+
+
+class Discourse(object):
+    """
+    Answers the queries of CorpusContext.get_utterance_ids from a word table, as the graph would after
+    encode_pauses: each speaker's words are linked in order, with precedes_pause links around pauses.
+    """
+    word_name = 'word'
+    cypher_safe_name = '`test`'
+
+    def __init__(self, table):
+        self.table = table
+        # Cypher's =~ matches the whole label
+        self.is_pause = [re.fullmatch(pauses, x) is not None for x in table['label']]
+
+    def get_speakers_in_discourse(self, discourse):
+        return sorted(set(self.table['speaker'].tolist()))
+
+    def words(self, speaker):
+        rows = [i for i in np.argsort(self.table['begin'], kind='stable') if self.table['speaker'][i] == speaker]
+        return [{'id': str(self.table['id'][i]), 'begin': float(self.table['begin'][i]),
+                 'end': float(self.table['end'][i]), 'pause': bool(self.is_pause[i])} for i in rows]
+
+    def execute_cypher(self, statement, speaker, discourse, node_pause_duration=None):
+        words = self.words(speaker)
+        speech = [w for w in words if not w['pause']]
+        if 'precedes_pause' in statement:
+            # Consecutive speech words with pauses between them, far enough apart
+            results = []
+            for i, w in enumerate(words):
+                if w['pause']:
+                    continue
+                following = next((j for j in range(i + 1, len(words)) if not words[j]['pause']), None)
+                if following is None or following == i + 1:
+                    continue
+                foll = words[following]
+                if foll['begin'] - w['end'] >= node_pause_duration:
+                    results.append({'begin': w['end'], 'begin_id': w['id'], 'end': foll['begin'],
+                                    'end_id': foll['id'], 'duration': foll['begin'] - w['end']})
+            return sorted(results, key=lambda x: x['begin'])
+        if not speech:
+            return []
+        min_begin = min(w['begin'] for w in speech)
+        max_end = max(w['end'] for w in speech)
+        return [w for w in speech if w['begin'] == min_begin or w['end'] == max_end]
+
+
+def polyglotdb_utterances(table, min_pause_length):
+    from polyglotdb import CorpusContext
+    return CorpusContext.get_utterance_ids(Discourse(table), 'd', min_pause_length=min_pause_length)
+
+
+cases = {
+    'gap at the minimum': [('a', 'SEE', 0.0, 1.0, 's1'), ('p', '<sil>', 1.0, 1.5, 's1'),
+                           ('b', 'ZOO', 1.5, 2.0, 's1'), ('q', '<sil>', 2.0, 2.49, 's1'),
+                           ('c', 'DOG', 2.49, 3.0, 's1')],
+    'runs of pauses': [('a', 'SEE', 0.0, 1.0, 's1'), ('p1', '<sil>', 1.0, 1.2, 's1'),
+                       ('p2', '<sil>', 1.2, 1.4, 's1'), ('p3', '<sil>', 1.4, 2.0, 's1'),
+                       ('b', 'ZOO', 2.0, 3.0, 's1'), ('p4', '<sil>', 3.0, 3.1, 's1'),
+                       ('p5', '<sil>', 3.1, 3.2, 's1'), ('c', 'DOG', 3.2, 4.0, 's1'),
+                       ('p6', '<sil>', 4.0, 5.0, 's1')],
+    'gap without a pause word': [('a', 'SEE', 0.0, 1.0, 's1'), ('b', 'ZOO', 2.0, 3.0, 's1'),
+                                 ('p', '<sil>', 3.0, 4.0, 's1'), ('c', 'DOG', 4.0, 5.0, 's1')],
+    'several speakers': [('a', 'SEE', 0.0, 1.0, 's1'), ('x', 'HAT', 0.5, 1.5, 's2'),
+                         ('p', '<sil>', 1.0, 2.0, 's1'), ('y', '<sil>', 1.5, 1.7, 's2'),
+                         ('z', 'TEN', 1.7, 2.5, 's2'), ('b', 'ZOO', 2.0, 3.0, 's1'),
+                         ('w', '<sil>', 2.5, 4.0, 's2'), ('v', 'BUS', 4.0, 4.5, 's2')],
+    'all pauses': [('p1', '<sil>', 0.0, 1.0, 's1'), ('p2', '<sil>', 1.0, 2.0, 's1')],
+    'single word': [('p', '<sil>', 0.0, 1.0, 's1'), ('a', 'SEE', 1.0, 2.0, 's1')],
+}
+
+
+@pytest.mark.parametrize('name', sorted(cases))
+@pytest.mark.parametrize('min_pause_length', [0.15, 0.5])
+def test_matches_get_utterance_ids(name, min_pause_length):
+    table = word_table(cases[name])
+    expected = polyglotdb_utterances(table, min_pause_length)
+    assert utterances.discourse_utterances(table, pauses, min_pause_length) == expected
+
+
+def test_gap_at_minimum_is_a_boundary():
+    table = word_table(cases['gap at the minimum'])
+    assert utterances.discourse_utterances(table, pauses, 0.5) == {'s1': [('a', 'a'), ('b', 'c')]}
+
+
+def test_list_of_pause_labels():
+    table = word_table(cases['runs of pauses'])
+    assert utterances.discourse_utterances(table, ['<sil>'], 0.5) == utterances.discourse_utterances(table, pauses,
+                                                                                                     0.5)